@@ -0,0 +1,123 @@
+"""
+Выгрузка файлов датасетов по HTTP.
+Готовые файлы отдаются FileResponse (sendfile, если сервер его поддерживает),
+запросы с заголовком Range - частичным ответом 206, чтобы прерванную
+загрузку можно было продолжить.
+"""
+import os
+import threading
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.core.export import write_chunks
+
+EXPORTS_DIR = os.getenv('EXPORTS_DIR', 'data/exports')
+
+# Размер блока чтения при отдаче диапазона
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Блокировки построения файлов выгрузки по пути (single-flight внутри процесса)
+_build_locks: Dict[str, threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Диапазон из заголовка Range (bytes=start-end, bytes=start-, bytes=-suffix).
+    None - заголовок не распознан или диапазонов несколько: отдаем файл целиком.
+    ValueError - диапазон за пределами файла (ответ 416).
+    """
+    units, _, spec = header.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    start, _, end = spec.strip().partition('-')
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        else:
+            first = max(size - int(end), 0)
+            last = size - 1
+    except ValueError:
+        return None
+    last = min(last, size - 1)
+    if first > last:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return first, last
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def file_download(request: Request, path: str, media_type: str, filename: str) -> Response:
+    """Файл целиком или диапазон байт из заголовка Range"""
+    size = os.path.getsize(path)
+    range_header = request.headers.get('range')
+    if range_header:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+        if byte_range:
+            start, end = byte_range
+            return StreamingResponse(
+                _iter_file(path, start, end - start + 1),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    'Accept-Ranges': 'bytes',
+                    'Content-Range': f'bytes {start}-{end}/{size}',
+                    'Content-Length': str(end - start + 1),
+                    'Content-Disposition': f'attachment; filename="{filename}"',
+                },
+            )
+    return FileResponse(path, media_type=media_type, filename=filename, headers={'Accept-Ranges': 'bytes'})
+
+
+def stream_download(chunks: Iterator[bytes], media_type: str, filename: str) -> StreamingResponse:
+    """Потоковая выгрузка (chunked transfer): содержимое формируется по мере отправки"""
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'Accept-Ranges': 'bytes'},
+    )
+
+
+def cached_export(job_id: str, name: str, build: Callable[[str], str]) -> str:
+    """
+    Путь к файлу выгрузки задачи в EXPORTS_DIR; при первом обращении файл строится
+    функцией build(path). Данные задачи не меняются, поэтому файл можно переиспользовать.
+    Одновременные запросы одного файла (параллельные Range-запросы загрузчиков)
+    ждут одно построение.
+    """
+    path = os.path.join(EXPORTS_DIR, job_id, name)
+    if os.path.exists(path):
+        return path
+
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(path, threading.Lock())
+    with lock:
+        # Файл мог построить запрос, державший блокировку
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            build(path)
+    # Файл готов: следующие запросы не доходят до блокировки
+    with _build_locks_guard:
+        if _build_locks.get(path) is lock:
+            del _build_locks[path]
+    return path
+
+
+def cached_stream(job_id: str, name: str, chunks: Callable[[], Iterator[bytes]]) -> str:
+    """Потоковый формат, записанный в файл - для запросов с Range"""
+    return cached_export(job_id, name, lambda path: write_chunks(path, chunks()))
@@ -0,0 +1,156 @@
+"""
+Push-канал состояния задач генерации вместо периодического опроса /api/v1/jobs.
+JobEventBus рассылает снимки записи задачи (из jobs_db) подписчикам:
+SSE-потоку одной задачи и WebSocket со всеми задачами пользователя.
+Удаление задачи рассылается снимком со статусом deleted - после него
+обновлений задачи не будет.
+"""
+import json
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+DELETED_STATUS = 'deleted'
+# Статусы, после которых снимков задачи больше не будет
+FINAL_STATUSES = ('completed', 'failed', DELETED_STATUS)
+
+# Комментарий-пинг в SSE, чтобы прокси не закрывали простаивающее соединение
+SSE_HEARTBEAT_SECONDS = 15
+# Очередь подписчика; медленный клиент теряет старые снимки, а не тормозит рассылку
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def _offer(queue: asyncio.Queue, item: Dict[str, Any]):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+def _dumps(job: Dict[str, Any]) -> str:
+    return json.dumps(job, ensure_ascii=False, default=str)
+
+
+class JobEventBus:
+    """
+    Подписки на изменения задач: по job_id, по user_id или на все задачи.
+    Работает в event loop приложения, publish вызывается из того же потока.
+    """
+
+    def __init__(self):
+        self._by_job: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._by_user: Dict[Any, Set[asyncio.Queue]] = defaultdict(set)
+        self._all: Set[asyncio.Queue] = set()
+
+    @contextmanager
+    def subscribe(self, job_id: Optional[str] = None, user_id: Any = None) -> Iterator[asyncio.Queue]:
+        """Очередь снимков задачи job_id, задач пользователя user_id или (без аргументов) всех задач"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        if job_id is not None:
+            registry, key = self._by_job, job_id
+        elif user_id is not None:
+            registry, key = self._by_user, user_id
+        else:
+            registry, key = None, None
+
+        if registry is None:
+            self._all.add(queue)
+        else:
+            registry[key].add(queue)
+        try:
+            yield queue
+        finally:
+            if registry is None:
+                self._all.discard(queue)
+            else:
+                registry[key].discard(queue)
+                if not registry[key]:
+                    del registry[key]
+
+    def publish(self, job: Dict[str, Any]):
+        """Рассылка снимка записи задачи всем заинтересованным подписчикам"""
+        snapshot = dict(job)
+        targets = set(self._all)
+        targets.update(self._by_job.get(snapshot.get('job_id'), ()))
+        targets.update(self._by_user.get(snapshot.get('user_id'), ()))
+        for queue in targets:
+            _offer(queue, snapshot)
+
+    def publish_deleted(self, job_id: str, user_id: Any = None):
+        """Задача удалена: подписчики получают итоговый снимок со статусом deleted"""
+        self.publish({'job_id': job_id, 'user_id': user_id, 'status': DELETED_STATUS})
+
+    def publish_cleared(self):
+        """Удалены все задачи: итоговый снимок для каждой задачи с подписчиками потока"""
+        for job_id in list(self._by_job):
+            self.publish_deleted(job_id)
+
+
+def job_event_stream(
+    bus: JobEventBus,
+    job: Dict[str, Any],
+    reload: Optional[Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = None,
+) -> StreamingResponse:
+    """
+    SSE-поток задачи: текущее состояние, затем каждое обновление.
+    Поток закрывается после статуса completed / failed / deleted.
+    reload() перечитывает задачу из хранилища уже после подписки: снимок job прочитан
+    до нее, и итоговое обновление между чтением и подпиской иначе было бы потеряно.
+    """
+    async def events():
+        with bus.subscribe(job_id=job['job_id']) as queue:
+            state = dict(job)
+            if reload is not None:
+                current = await reload()
+                state = current if current is not None else {**state, 'status': DELETED_STATUS}
+            yield f"data: {_dumps(state)}\n\n"
+            while state.get('status') not in FINAL_STATUSES:
+                try:
+                    state = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {_dumps(state)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+async def _wait_closed(websocket: WebSocket):
+    while (await websocket.receive())['type'] != 'websocket.disconnect':
+        pass
+
+
+async def serve_job_socket(
+    websocket: WebSocket,
+    bus: JobEventBus,
+    jobs: Iterable[Dict[str, Any]],
+    user_id: Any = None,
+):
+    """
+    WebSocket со всеми задачами пользователя user_id (None - все задачи):
+    сначала текущие записи jobs, затем снимки по мере изменения.
+    """
+    await websocket.accept()
+    with bus.subscribe(user_id=user_id) as queue:
+        closed = asyncio.ensure_future(_wait_closed(websocket))
+        try:
+            for job in jobs:
+                await websocket.send_text(_dumps(job))
+            while not closed.done():
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    await websocket.send_text(_dumps(getter.result()))
+                else:
+                    getter.cancel()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            closed.cancel()
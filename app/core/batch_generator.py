@@ -4,199 +4,543 @@
 """
 import polars as pl
 import numpy as np
-from faker import Faker
-from typing import Dict, List, Any, Optional, Tuple
-from datetime import datetime, timedelta
-import uuid
-import random
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Callable
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from functools import partial
+import multiprocessing
+from datetime import datetime
 import logging
 
+from app.core.name_vocabulary import get_vocabulary
+from app.core.progress import ProgressTracker, ProgressCallback
+from app.core.schema import PATIENT_SCHEMA, VISIT_SCHEMA, GENDER_ENUM, DIAGNOSIS_ENUM, DIAGNOSES
+
 logger = logging.getLogger(__name__)
-fake = Faker(['en_US'])
+
+# Шаблон UUID: позиции шестнадцатеричных символов в строке из 36 символов
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype='S1')
+_UUID_HEX_POSITIONS = np.array([i for i in range(36) if i not in (8, 13, 18, 23)])
+
+
+def _uuid4_bytes(count: int, rng: np.random.Generator) -> np.ndarray:
+    """Пакетная генерация UUID4 из одного буфера случайных байт: массив (count, 16) uint8"""
+    raw = np.frombuffer(rng.bytes(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # версия 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # вариант RFC 4122
+    return raw
+
+
+def _format_uuids(raw: np.ndarray) -> pl.Series:
+    """UUID из байт в каноническом виде (xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx)"""
+    count = len(raw)
+    hex_chars = np.empty((count, 32), dtype='S1')
+    hex_chars[:, 0::2] = _HEX_DIGITS[raw >> 4]
+    hex_chars[:, 1::2] = _HEX_DIGITS[raw & 0x0F]
+    
+    chars = np.full((count, 36), b'-', dtype='S1')
+    chars[:, _UUID_HEX_POSITIONS] = hex_chars
+    return pl.Series(chars.view('S36').ravel()).cast(pl.String)
+
+
+def uuid_strings(ids: pl.Series) -> pl.Series:
+    """Текстовые UUID из колонки 16-байтовых id. Используется только при экспорте."""
+    return _format_uuids(ids.to_numpy()).alias(ids.name)
+
+
+def render_patients(patients_df: pl.DataFrame) -> pl.DataFrame:
+    """Пациенты для экспорта: id в текстовом виде, показатели Float32 с одним знаком"""
+    return patients_df.with_columns(
+        uuid_strings(patients_df['id']),
+        pl.col('height', 'weight', 'bmi').cast(pl.Float64).round(1),
+    )
+
+
+def render_visits(visits_df: pl.DataFrame, parent_ids: pl.Series) -> pl.DataFrame:
+    """
+    Визиты для экспорта: id в текстовом виде, patient_index заменяется на patient_id.
+    parent_ids - бинарные id пациентов, выровненные по строкам visits_df.
+    """
+    return visits_df.select(
+        uuid_strings(visits_df['id']),
+        uuid_strings(parent_ids).alias('patient_id'),
+        pl.exclude('id', 'patient_index'),
+    )
+
+
+def render_ids(dataset: Dict[str, pl.DataFrame]) -> Dict[str, pl.DataFrame]:
+    """Датасет с текстовыми UUID и внешним ключом patient_id - для экспорта"""
+    patients_df = dataset['patients']
+    visits_df = dataset['visits']
+    return {
+        'patients': render_patients(patients_df),
+        'visits': render_visits(visits_df, patients_df['id'].gather(visits_df['patient_index'])),
+    }
+
+
+# Параметры распределений (нормальные - среднее и отклонение); по ним же
+# считается ожидаемая статистика датасета в app.core.preview_stats
+DIABETES_RATE = 0.08
+BMI_DIABETIC = (32, 4)
+BMI_NON_DIABETIC = (26, 5)
+BMI_RANGE = (16, 50)
+VISIT_COST = (150, 80)
+VISIT_COST_RANGE = (30, 500)
+
+
+def _patient_keys(rng: np.random.Generator, count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Ключевые колонки пациентов, от которых зависят визиты: байты id, возраст, диабет.
+    Выбираются первыми в потоке батча, поэтому их можно перегенерировать
+    без остальных колонок.
+    """
+    id_bytes = _uuid4_bytes(count, rng)
+    diabetes = rng.random(count) < DIABETES_RATE
+    age = np.clip(rng.normal(45, 18, count).astype(int), 0, 100).astype(np.uint8)
+    return id_bytes, age, diabetes
+
+
+# Визиты: период 2023-01-01 .. 2024-12-31 и сезонные распределения диагнозов
+_VISITS_START_DATE = np.datetime64('2023-01-01', 'D')
+_VISITS_DATE_RANGE = (np.datetime64('2024-12-31', 'D') - _VISITS_START_DATE).astype(int)
+_WINTER_MONTHS = [11, 12, 1, 2]
+
+_DIAGNOSIS_CODES = {name: code for code, name in enumerate(DIAGNOSES)}
+
+
+def _diagnosis_distribution(probabilities: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Коды диагнозов и их кумулятивная функция распределения"""
+    codes = np.array([_DIAGNOSIS_CODES[name] for name in probabilities], dtype=np.uint8)
+    return codes, np.cumsum(list(probabilities.values()))
+
+
+_WINTER_DIAGNOSES = _diagnosis_distribution(
+    {'Flu': 0.4, 'Cold': 0.3, 'Pneumonia': 0.2, 'Bronchitis': 0.1}
+)
+_SUMMER_DIAGNOSES = _diagnosis_distribution(
+    {'Cold': 0.3, 'Allergy': 0.25, 'Hypertension': 0.2, 'Arthritis': 0.15, 'Flu': 0.1}
+)
+
+
+def _sample_codes(codes: np.ndarray, cdf: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """Выборка кодов категорий методом обратной функции распределения"""
+    positions = np.searchsorted(cdf, rng.random(count) * cdf[-1], side='right')
+    return codes[np.minimum(positions, len(codes) - 1)]
+
+
+# Независимые ветки SeedSequence для пациентов и визитов
+_PATIENTS_STREAM = 0
+_VISITS_STREAM = 1
+
+# Атрибуты пациентов (возраст, диабет) в процессе пула, передаются один раз через initializer
+_worker_patients: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+
+def _init_visit_worker(patient_ages: np.ndarray, patient_diabetes: np.ndarray):
+    global _worker_patients
+    _worker_patients = (patient_ages, patient_diabetes)
+
+
+def _fill_buffers(
+    batches: Iterator[Dict[str, np.ndarray]],
+    count: int,
+    progress: Optional[ProgressTracker] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Сборка батчей в колонки, выделенные один раз на весь датасет:
+    батчи копируются в срезы буферов без промежуточных DataFrame и pl.concat.
+    После каждого батча прогресс обновляется в progress.
+    """
+    buffers = {}
+    start = 0
+    for arrays in batches:
+        if not buffers:
+            buffers = {name: np.empty((count,) + a.shape[1:], dtype=a.dtype) for name, a in arrays.items()}
+        n = len(arrays['id'])
+        for name, a in arrays.items():
+            buffers[name][start:start + n] = a
+        start += n
+        if progress is not None:
+            progress.advance(n)
+    return buffers
+
+
+def _patient_batch_task(generator: 'BatchGenerator', seed_seq: np.random.SeedSequence, batch_count: int) -> Dict[str, np.ndarray]:
+    return generator._generate_patient_arrays(np.random.default_rng(seed_seq), batch_count)
+
+
+def _visit_batch_task(
+    generator: 'BatchGenerator',
+    seed_seq: np.random.SeedSequence,
+    batch_count: int,
+    patient_ages: Optional[np.ndarray] = None,
+    patient_diabetes: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    if patient_ages is None:
+        patient_ages, patient_diabetes = _worker_patients
+    
+    # Распределяем визиты по пациентам
+    rng = np.random.default_rng(seed_seq)
+    parent_indices = rng.integers(0, len(patient_ages), batch_count)
+    return generator._generate_visit_arrays(
+        rng, parent_indices, patient_ages[parent_indices], patient_diabetes[parent_indices]
+    )
+
 
 class BatchGenerator:
     """
     Генератор данных, работающий батчами.
     Оптимизирован для генерации больших объемов данных.
+    Каждый батч использует собственный np.random.Generator от seed генератора,
+    глобальное состояние NumPy, random и Faker не меняется - экземпляры
+    с разными seed можно использовать одновременно в потоках и процессах.
     """
     
-    def __init__(self, batch_size: int = 10000):
+    def __init__(self, batch_size: int = 10000, workers: int = 1, locale: str = 'en_US', seed: Optional[int] = None):
         self.batch_size = batch_size
-        self.seed = None
+        self.workers = workers
+        self.locale = locale
+        self.set_seed(seed)
         
-    def set_seed(self, seed: int):
-        """Установка seed для воспроизводимости"""
+    def set_seed(self, seed: Optional[int]):
+        """
+        Установка seed для воспроизводимости. Без seed берется случайная энтропия,
+        общая для всех батчей экземпляра.
+        """
         self.seed = seed
-        np.random.seed(seed)
-        random.seed(seed)
-        Faker.seed(seed)
+        self._entropy = np.random.SeedSequence(seed).entropy
     
-    def generate_patients(self, count: int = 10000) -> pl.DataFrame:
+    def _batch_plan(self, count: int, stream: int) -> Tuple[List[np.random.SeedSequence], List[int]]:
         """
-        Генерация пациентов с реалистичными характеристиками.
+        Разбиение на батчи и независимый поток случайных чисел для каждого батча.
+        Зависит только от seed и batch_size, поэтому результат не зависит от числа процессов.
         """
-        logger.info(f"Генерация {count} пациентов...")
+        counts = [min(self.batch_size, count - start) for start in range(0, count, self.batch_size)]
+        seeds = [self._batch_seed(stream, index) for index in range(len(counts))]
+        return seeds, counts
+    
+    def _batch_seed(self, stream: int, index: int) -> np.random.SeedSequence:
+        """
+        Seed батча index потока stream. Совпадает с
+        SeedSequence(seed).spawn(2)[stream].spawn(n)[index], но строится напрямую.
+        """
+        return np.random.SeedSequence(self._entropy, spawn_key=(stream, index))
+    
+    def _process_pool(self, initializer=None, initargs=()) -> ProcessPoolExecutor:
+        """Пул процессов для параллельной генерации батчей"""
+        # spawn, а не fork: пул потоков Polars не переживает fork
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=initializer,
+            initargs=initargs,
+        )
+    
+    def _iter_batches(
+        self,
+        seeds: List[np.random.SeedSequence],
+        counts: List[int],
+        make_batch: Callable[[np.random.SeedSequence, int], Dict[str, np.ndarray]],
+        pool_task: Callable[['BatchGenerator', np.random.SeedSequence, int], Dict[str, np.ndarray]],
+        initializer=None,
+        initargs=(),
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Колонки батчей (массивы NumPy) по порядку, по одному. В параллельном режиме в работе не больше
+        2 * workers батчей, так что память не растет с объемом датасета.
+        """
+        if self.workers <= 1 or len(counts) <= 1:
+            for seed_seq, n in zip(seeds, counts):
+                yield make_batch(seed_seq, n)
+            return
         
-        all_patients = []
-        remaining = count
+        with self._process_pool(initializer, initargs) as pool:
+            pending = deque()
+            for seed_seq, n in zip(seeds, counts):
+                pending.append(pool.submit(pool_task, self, seed_seq, n))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    
+    def iter_patients(self, count: int = 10000) -> Iterator[pl.DataFrame]:
+        """
+        Потоковая генерация пациентов: батчи отдаются по мере готовности,
+        весь датасет в памяти не накапливается.
+        """
+        for arrays in self._iter_patient_arrays(count):
+            yield self._patient_frame(arrays)
+    
+    def _iter_patient_arrays(self, count: int) -> Iterator[Dict[str, np.ndarray]]:
+        seeds, counts = self._batch_plan(count, _PATIENTS_STREAM)
+        yield from self._iter_batches(seeds, counts, partial(_patient_batch_task, self), _patient_batch_task)
+    
+    def iter_visits(self, patients_df: pl.DataFrame, count: int = 50000) -> Iterator[pl.DataFrame]:
+        """
+        Потоковая генерация визитов к пациентам из patients_df.
+        В памяти одновременно только таблица пациентов и текущие батчи.
+        Внешний ключ хранится как patient_index - номер строки в patients_df.
+        """
+        for arrays in self._iter_visit_arrays(patients_df, count):
+            yield self._visit_frame(arrays)
+    
+    def _iter_visit_arrays(self, patients_df: pl.DataFrame, count: int) -> Iterator[Dict[str, np.ndarray]]:
+        # Атрибуты пациентов как массивы: родитель визита выбирается целым индексом
+        patient_ages = patients_df['age'].to_numpy()
+        patient_diabetes = patients_df['diabetes'].to_numpy()
         
-        while remaining > 0:
-            batch_count = min(self.batch_size, remaining)
-            
-            # Генерируем базовые поля
-            diabetes = np.random.random(batch_count) < 0.08
-            
-            # BMI с корреляцией
-            bmi = np.zeros(batch_count)
-            for i in range(batch_count):
-                if diabetes[i]:
-                    bmi[i] = np.random.normal(32, 4)
-                else:
-                    bmi[i] = np.random.normal(26, 5)
-                bmi[i] = np.clip(bmi[i], 16, 50)
-            
-            batch_data = {
-                'id': [str(uuid.uuid4()) for _ in range(batch_count)],
-                'first_name': [fake.first_name() for _ in range(batch_count)],
-                'last_name': [fake.last_name() for _ in range(batch_count)],
-                'age': np.random.normal(45, 18, batch_count).astype(int),
-                'gender': np.random.choice(['Male', 'Female'], batch_count, p=[0.48, 0.52]),
-                'height': np.random.normal(170, 10, batch_count).round(1),
-                'weight': np.random.normal(75, 15, batch_count).round(1),
-                'diabetes': diabetes.tolist(),
-                'bmi': bmi.round(1).tolist(),
-                'hypertension': np.random.random(batch_count) < 0.15,
-            }
-            
-            # Клиппинг значений
-            batch_data['age'] = np.clip(batch_data['age'], 0, 100).tolist()
-            batch_data['height'] = np.clip(batch_data['height'], 140, 210).tolist()
-            batch_data['weight'] = np.clip(batch_data['weight'], 40, 150).tolist()
-            
-            # Корреляция возраста и гипертонии
-            age_array = np.array(batch_data['age'])
-            hypertension_array = np.array(batch_data['hypertension'])
-            elderly_mask = age_array > 60
-            if np.sum(elderly_mask) > 0:
-                elderly_prob = np.random.random(np.sum(elderly_mask)) < 0.4
-                hypertension_array[elderly_mask] = elderly_prob
-            batch_data['hypertension'] = hypertension_array.tolist()
-            
-            batch_df = pl.DataFrame(batch_data)
-            all_patients.append(batch_df)
-            remaining -= batch_count
+        make_batch = partial(
+            _visit_batch_task, self, patient_ages=patient_ages, patient_diabetes=patient_diabetes
+        )
+        seeds, counts = self._batch_plan(count, _VISITS_STREAM)
+        yield from self._iter_batches(
+            seeds, counts, make_batch, _visit_batch_task,
+            initializer=_init_visit_worker, initargs=(patient_ages, patient_diabetes),
+        )
+    
+    def generate_patients(self, count: int = 10000, progress: Optional[ProgressTracker] = None) -> pl.DataFrame:
+        """
+        Генерация пациентов с реалистичными характеристиками.
+        """
+        logger.info(f"Генерация {count} пациентов...")
         
-        patients_df = pl.concat(all_patients) if len(all_patients) > 1 else all_patients[0]
+        if progress is not None:
+            progress.set_stage('patients')
+        patients_df = self._patient_frame(_fill_buffers(self._iter_patient_arrays(count), count, progress))
         logger.info(f"Сгенерировано {len(patients_df)} пациентов")
         return patients_df
     
-    def generate_visits(self, patients_df: pl.DataFrame, count: int = 50000) -> pl.DataFrame:
+    def _generate_patient_arrays(self, rng: np.random.Generator, batch_count: int) -> Dict[str, np.ndarray]:
+        """
+        Колоночная генерация одного батча пациентов.
+        Каждая колонка получается одной выборкой NumPy, корреляции - масками.
+        Имена и пол - целые коды, строки и Enum появляются в _patient_frame.
+        """
+        # Генерируем базовые поля
+        id_bytes, age, diabetes = _patient_keys(rng, batch_count)
+        
+        # BMI с корреляцией: одна стандартная нормальная выборка,
+        # масштабируемая по маске диабета (N(32, 4) / N(26, 5))
+        bmi = rng.standard_normal(batch_count)
+        bmi = np.where(
+            diabetes,
+            BMI_DIABETIC[0] + BMI_DIABETIC[1] * bmi,
+            BMI_NON_DIABETIC[0] + BMI_NON_DIABETIC[1] * bmi,
+        )
+        bmi = np.clip(bmi, *BMI_RANGE).round(1).astype(np.float32)
+        
+        # Корреляция возраста и гипертонии
+        hypertension = rng.random(batch_count) < 0.15
+        elderly_mask = age > 60
+        hypertension[elderly_mask] = rng.random(np.count_nonzero(elderly_mask)) < 0.4
+        
+        # Пол и имена в соответствии с полом из словаря локали
+        is_male = rng.random(batch_count) < 0.48
+        vocabulary = get_vocabulary(self.locale)
+        
+        return {
+            'id': id_bytes,
+            'first_name': vocabulary.sample_codes('first_names', is_male, rng),
+            'last_name': vocabulary.sample_codes('last_names', is_male, rng),
+            'age': age,
+            'gender': (~is_male).astype(np.uint8),
+            'height': np.clip(rng.normal(170, 10, batch_count).round(1), 140, 210).astype(np.float32),
+            'weight': np.clip(rng.normal(75, 15, batch_count).round(1), 40, 150).astype(np.float32),
+            'diabetes': diabetes,
+            'bmi': bmi,
+            'hypertension': hypertension,
+        }
+    
+    def _patient_frame(self, arrays: Dict[str, np.ndarray]) -> pl.DataFrame:
+        """
+        DataFrame пациентов из колонок NumPy. Числовые буферы передаются
+        в Polars без копирования, имена собираются одним gather по словарю.
+        """
+        vocabulary = get_vocabulary(self.locale)
+        columns = dict(arrays)
+        columns['id'] = pl.Series(arrays['id'])
+        columns['first_name'] = vocabulary.names_for('first_names', arrays['first_name'])
+        columns['last_name'] = vocabulary.names_for('last_names', arrays['last_name'])
+        columns['gender'] = pl.Series(arrays['gender']).cast(GENDER_ENUM)
+        return pl.DataFrame(columns, schema=PATIENT_SCHEMA)
+    
+    def generate_visits(
+        self,
+        patients_df: pl.DataFrame,
+        count: int = 50000,
+        progress: Optional[ProgressTracker] = None,
+    ) -> pl.DataFrame:
         """
         Генерация визитов к врачу с привязкой к пациентам.
         """
         logger.info(f"Генерация {count} визитов...")
         
-        patient_ids = patients_df['id'].to_list()
-        n_patients = len(patient_ids)
+        if progress is not None:
+            progress.set_stage('visits')
+        visits_df = self._visit_frame(_fill_buffers(self._iter_visit_arrays(patients_df, count), count, progress))
+        logger.info(f"Сгенерировано {len(visits_df)} визитов")
+        return visits_df
+    
+    def _generate_visit_arrays(
+        self,
+        rng: np.random.Generator,
+        parent_indices: np.ndarray,
+        parent_ages: np.ndarray,
+        parent_diabetes: np.ndarray,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Колоночная генерация одного батча визитов.
+        Даты, сезонные диагнозы и корреляции с пациентом считаются целыми массивами,
+        диагноз - код категории.
+        Внешний ключ - patient_index (номер строки пациента), id рендерится при экспорте.
+        """
+        batch_count = len(parent_indices)
         
-        # Создаем словари для быстрого доступа к данным пациентов
-        patient_ages = {}
-        patient_diabetes = {}
-        for row in patients_df.to_dicts():
-            patient_ages[row['id']] = row['age']
-            patient_diabetes[row['id']] = row['diabetes']
+        # Генерируем даты (2023-2024) смещениями в днях
+        dates = _VISITS_START_DATE + rng.integers(0, _VISITS_DATE_RANGE, batch_count)
+        months = dates.astype('datetime64[M]').astype(int) % 12 + 1
         
-        all_visits = []
-        remaining = count
+        # Базовые диагнозы: одна выборка обратной функцией распределения на сезон
+        diagnoses = np.empty(batch_count, dtype=np.uint8)
+        winter_mask = np.isin(months, _WINTER_MONTHS)
+        for mask, (codes, cdf) in ((winter_mask, _WINTER_DIAGNOSES), (~winter_mask, _SUMMER_DIAGNOSES)):
+            diagnoses[mask] = _sample_codes(codes, cdf, np.count_nonzero(mask), rng)
         
-        while remaining > 0:
-            batch_count = min(self.batch_size, remaining)
-            
-            # Распределяем визиты по пациентам
-            parent_indices = np.random.choice(n_patients, size=batch_count)
-            assigned_parent_ids = [patient_ids[i] for i in parent_indices]
-            
-            # Генерируем даты (2023-2024)
-            start_date = datetime(2023, 1, 1)
-            end_date = datetime(2024, 12, 31)
-            date_range = (end_date - start_date).days
-            
-            dates = []
-            months = []
-            for _ in range(batch_count):
-                days_offset = np.random.randint(0, date_range)
-                date = start_date + timedelta(days=days_offset)
-                dates.append(date)
-                months.append(date.month)
-            
-            # Базовые диагнозы
-            diagnoses = []
-            for month in months:
-                if month in [11, 12, 1, 2]:  # Зима
-                    diag = np.random.choice(
-                        ['Flu', 'Cold', 'Pneumonia', 'Bronchitis'],
-                        p=[0.4, 0.3, 0.2, 0.1]
-                    )
-                else:  # Лето
-                    diag = np.random.choice(
-                        ['Cold', 'Allergy', 'Hypertension', 'Arthritis', 'Flu'],
-                        p=[0.3, 0.25, 0.2, 0.15, 0.1]
-                    )
-                diagnoses.append(diag)
-            
-            # Получаем данные пациентов для корреляций
-            patient_ages_batch = [patient_ages.get(pid, 45) for pid in assigned_parent_ids]
-            patient_diabetes_batch = [patient_diabetes.get(pid, False) for pid in assigned_parent_ids]
-            
-            # Корреляция с диабетом
-            for i in range(batch_count):
-                if patient_diabetes_batch[i] and np.random.random() < 0.6:
-                    diagnoses[i] = 'Diabetes'
-            
-            # Корреляция с возрастом
-            for i in range(batch_count):
-                age = patient_ages_batch[i]
-                if age > 70 and np.random.random() < 0.25:
-                    diagnoses[i] = 'Pneumonia'
-                elif age < 12 and np.random.random() < 0.9:
-                    diagnoses[i] = 'Cold'
-            
-            # Стоимость визита
-            costs = np.random.normal(150, 80, batch_count)
-            costs = np.clip(costs, 30, 500).round(2)
-            
-            batch_data = {
-                'id': [str(uuid.uuid4()) for _ in range(batch_count)],
-                'patient_id': assigned_parent_ids,
-                'date': dates,
-                'diagnosis': diagnoses,
-                'cost': costs.tolist(),
-                'follow_up': np.random.random(batch_count) < 0.15,
-            }
+        # Корреляция с диабетом
+        diagnoses[parent_diabetes & (rng.random(batch_count) < 0.6)] = _DIAGNOSIS_CODES['Diabetes']
+        
+        # Корреляция с возрастом
+        age_roll = rng.random(batch_count)
+        diagnoses[(parent_ages > 70) & (age_roll < 0.25)] = _DIAGNOSIS_CODES['Pneumonia']
+        diagnoses[(parent_ages < 12) & (age_roll < 0.9)] = _DIAGNOSIS_CODES['Cold']
+        
+        # Стоимость визита
+        costs = rng.normal(*VISIT_COST, batch_count)
+        costs = np.clip(costs, *VISIT_COST_RANGE).round(2)
+        
+        return {
+            'id': _uuid4_bytes(batch_count, rng),
+            'patient_index': parent_indices.astype(np.uint32),
+            'date': dates,
+            'diagnosis': diagnoses,
+            'cost': costs,
+            'follow_up': rng.random(batch_count) < 0.15,
+        }
+    
+    @staticmethod
+    def _visit_frame(arrays: Dict[str, np.ndarray]) -> pl.DataFrame:
+        """DataFrame визитов из колонок NumPy"""
+        columns = dict(arrays)
+        columns['id'] = pl.Series(arrays['id'])
+        columns['diagnosis'] = pl.Series(arrays['diagnosis']).cast(DIAGNOSIS_ENUM)
+        return pl.DataFrame(columns, schema=VISIT_SCHEMA)
+    
+    def shard_count(self, count: int) -> int:
+        """Число шардов (батчей) для count записей"""
+        return -(-count // self.batch_size)
+    
+    def _shard_seed(self, stream: int, shard_index: int, count: int) -> Tuple[np.random.SeedSequence, int]:
+        """Seed и размер шарда; шард - это батч с тем же номером при полной генерации"""
+        if self.seed is None:
+            raise ValueError("Для генерации шардов нужен seed (set_seed)")
+        if not 0 <= shard_index < self.shard_count(count):
+            raise ValueError(f"Шард {shard_index} вне диапазона 0..{self.shard_count(count) - 1}")
+        return self._batch_seed(stream, shard_index), min(self.batch_size, count - shard_index * self.batch_size)
+    
+    def generate_patient_shard(self, shard_index: int, n_patients: int) -> pl.DataFrame:
+        """
+        Шард пациентов без генерации предыдущих шардов.
+        Совпадает со строками [shard_index * batch_size, ...) из generate_patients(n_patients)
+        при том же seed и batch_size.
+        """
+        seed_seq, count = self._shard_seed(_PATIENTS_STREAM, shard_index, n_patients)
+        return self._patient_frame(self._generate_patient_arrays(np.random.default_rng(seed_seq), count))
+    
+    def generate_visit_shard(
+        self,
+        shard_index: int,
+        n_patients: int,
+        n_visits: int,
+        patient_keys: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+    ) -> pl.DataFrame:
+        """
+        Шард визитов без генерации предыдущих шардов и без таблицы пациентов.
+        Возраст и диабет пациентов-родителей перегенерируются из их батчей
+        (только ключевые колонки), так что шарды можно строить на разных машинах.
+        patient_keys - готовый результат patient_keys(n_patients) для серии шардов.
+        """
+        seed_seq, count = self._shard_seed(_VISITS_STREAM, shard_index, n_visits)
+        rng = np.random.default_rng(seed_seq)
+        parent_indices = rng.integers(0, n_patients, count)
+        
+        if patient_keys is None:
+            _, parent_ages, parent_diabetes = self._patient_keys_at(parent_indices, n_patients)
+        else:
+            _, ages, diabetes = patient_keys
+            parent_ages, parent_diabetes = ages[parent_indices], diabetes[parent_indices]
+        return self._visit_frame(self._generate_visit_arrays(rng, parent_indices, parent_ages, parent_diabetes))
+    
+    def patient_keys(self, n_patients: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ключевые колонки всех пациентов (байты id, возраст, диабет) по порядку.
+        Для серии шардов визитов: один проход по батчам пациентов вместо прохода на каждый шард.
+        """
+        keys = [
+            _patient_keys(np.random.default_rng(seed_seq), count)
+            for seed_seq, count in (
+                self._shard_seed(_PATIENTS_STREAM, index, n_patients) for index in range(self.shard_count(n_patients))
+            )
+        ]
+        id_bytes, ages, diabetes = (np.concatenate(column) for column in zip(*keys))
+        return id_bytes, ages, diabetes
+    
+    def patient_ids_at(self, indices: np.ndarray, n_patients: int) -> pl.Series:
+        """
+        Бинарные id пациентов с номерами indices без таблицы пациентов,
+        например для render_visits по шарду визитов.
+        """
+        id_bytes, _, _ = self._patient_keys_at(indices, n_patients)
+        return pl.Series('id', id_bytes)
+    
+    def _patient_keys_at(self, indices: np.ndarray, n_patients: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Ключевые колонки пациентов с глобальными индексами indices, батч за батчем"""
+        id_bytes = np.empty((len(indices), 16), dtype=np.uint8)
+        ages = np.empty(len(indices), dtype=np.uint8)
+        diabetes = np.empty(len(indices), dtype=bool)
+        
+        batch_numbers = indices // self.batch_size
+        for batch_number in np.unique(batch_numbers):
+            mask = batch_numbers == batch_number
+            seed_seq, count = self._shard_seed(_PATIENTS_STREAM, int(batch_number), n_patients)
+            batch_bytes, batch_ages, batch_diabetes = _patient_keys(np.random.default_rng(seed_seq), count)
             
-            batch_df = pl.DataFrame(batch_data)
-            all_visits.append(batch_df)
-            remaining -= batch_count
+            local = indices[mask] - batch_number * self.batch_size
+            id_bytes[mask] = batch_bytes[local]
+            ages[mask] = batch_ages[local]
+            diabetes[mask] = batch_diabetes[local]
         
-        visits_df = pl.concat(all_visits) if len(all_visits) > 1 else all_visits[0]
-        logger.info(f"Сгенерировано {len(visits_df)} визитов")
-        return visits_df
+        return id_bytes, ages, diabetes
     
-    def generate_full_medical_dataset(self, n_patients: int = 10000, n_visits: int = 50000) -> Dict[str, pl.DataFrame]:
+    def generate_full_medical_dataset(
+        self,
+        n_patients: int = 10000,
+        n_visits: int = 50000,
+        progress_callback: Optional[ProgressCallback] = None,
+        progress_interval: float = 0.5,
+    ) -> Dict[str, pl.DataFrame]:
         """
         Генерация полного медицинского датасета.
+        progress_callback получает события ProgressTracker по батчам
+        (строки, скорость, ETA) не чаще progress_interval секунд.
         """
         logger.info("=" * 60)
         logger.info("НАЧАЛО ГЕНЕРАЦИИ МЕДИЦИНСКОГО ДАТАСЕТА")
         logger.info(f"Пациентов: {n_patients}, Визитов: {n_visits}")
         logger.info("=" * 60)
         
-        if self.seed:
-            np.random.seed(self.seed)
-            random.seed(self.seed)
-        
-        patients_df = self.generate_patients(n_patients)
-        visits_df = self.generate_visits(patients_df, n_visits)
+        progress = ProgressTracker(n_patients + n_visits, progress_callback, progress_interval)
+        patients_df = self.generate_patients(n_patients, progress)
+        visits_df = self.generate_visits(patients_df, n_visits, progress)
         
         # Статистика
         diabetes_rate = patients_df['diabetes'].mean()
@@ -227,32 +571,19 @@ class BatchGenerator:
         }
     
     def export_to_json(self, dataset: Dict[str, pl.DataFrame], filepath: str):
-        """Экспорт датасета в JSON"""
-        import json
+        """Потоковый экспорт датасета в JSON-документ {metadata, patients, visits}"""
+        from app.core.export import export_json
         
-        patients_list = dataset['patients'].to_dicts()
-        visits_list = dataset['visits'].to_dicts()
-        
-        for visit in visits_list:
-            if 'date' in visit and visit['date']:
-                if hasattr(visit['date'], 'isoformat'):
-                    visit['date'] = visit['date'].isoformat()
-                else:
-                    visit['date'] = str(visit['date'])
-        
-        output = {
-            'metadata': {
-                'generated_at': datetime.now().isoformat(),
-                'seed': self.seed,
-                'patients_count': len(patients_list),
-                'visits_count': len(visits_list)
-            },
-            'patients': patients_list,
-            'visits': visits_list
+        metadata = {
+            'generated_at': datetime.now().isoformat(),
+            'seed': self.seed,
+            'patients_count': len(dataset['patients']),
+            'visits_count': len(dataset['visits'])
         }
+        return export_json(dataset, filepath, metadata)
+    
+    def export_to_ndjson(self, dataset: Dict[str, pl.DataFrame], directory: str) -> Dict[str, str]:
+        """Потоковый экспорт датасета в NDJSON, файл на таблицу"""
+        from app.core.export import export_ndjson
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"✅ Датасет сохранен в {filepath}")
-        return filepath
+        return export_ndjson(dataset, directory)
@@ -0,0 +1,247 @@
+"""
+Кэш сгенерированных датасетов с адресацией по содержимому.
+Генерация детерминирована при фиксированном seed, поэтому результат
+определяется запросом (patients, visits, seed, параметры) и версией кода генератора.
+Готовые датасеты (Arrow IPC из save_dataset + сводка meta.json) хранятся на диске,
+при переполнении удаляются давно не использованные записи (LRU по размеру).
+Одинаковые одновременные запросы внутри процесса объединяются в одну генерацию,
+события ее прогресса получают все ожидающие.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from importlib import metadata
+from typing import Dict, Any, Callable, Awaitable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATASET_CACHE_DIR = os.getenv('DATASET_CACHE_DIR', 'data/cache/datasets')
+DATASET_CACHE_MAX_BYTES = int(os.getenv('DATASET_CACHE_MAX_BYTES', str(10 * 1024 ** 3)))
+
+# Модули, от которых зависят значения датасета
+_GENERATOR_SOURCES = ('batch_generator.py', 'schema.py', 'name_vocabulary.py')
+
+META_FILE = 'meta.json'
+
+ProgressHandler = Callable[[Dict[str, Any]], None]
+
+
+@lru_cache(maxsize=None)
+def generator_version() -> str:
+    """
+    Версия генератора: хэш исходников генерации и версий NumPy и Faker
+    (поток случайных чисел и словари имен). Меняется при любом изменении кода.
+    """
+    digest = hashlib.sha256()
+    core_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in _GENERATOR_SOURCES:
+        with open(os.path.join(core_dir, name), 'rb') as f:
+            digest.update(f.read())
+    digest.update(np.__version__.encode())
+    try:
+        digest.update(metadata.version('faker').encode())
+    except metadata.PackageNotFoundError:
+        pass
+    return digest.hexdigest()[:16]
+
+
+def dataset_cache_key(patients: int, visits: int, seed: int, **options) -> str:
+    """Ключ кэша: хэш всех параметров запроса и версии генератора"""
+    payload = {
+        'generator': generator_version(),
+        'patients': patients,
+        'visits': visits,
+        'seed': seed,
+        **options,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _dir_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Другая файловая система или нет поддержки жестких ссылок
+        shutil.copyfile(src, dst)
+
+
+class DatasetCache:
+    """
+    Записи кэша - каталоги root/<key> с файлами датасета и meta.json.
+    Время последнего обращения - mtime meta.json. Каталоги с точкой в начале имени -
+    незавершенные сборки и вытесненные записи, они не считаются записями.
+    """
+
+    def __init__(self, root: str = DATASET_CACHE_DIR, max_bytes: int = DATASET_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Обработчики прогресса ожидающих и последнее событие генерации по ключу
+        self._listeners: Dict[str, List[ProgressHandler]] = {}
+        self._last_progress: Dict[str, Dict[str, Any]] = {}
+        # Закрепленные записи (между get и link) не вытесняются; evict идет в другом потоке
+        self._pins: Dict[str, int] = {}
+        self._pins_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Сводка записи (dataset_path и статистика) или None; обращение продлевает жизнь записи"""
+        meta_path = os.path.join(self.entry_dir(key), META_FILE)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        meta['dataset_path'] = self.entry_dir(key)
+        return meta
+
+    @contextmanager
+    def pinned(self, key: str) -> Iterator[None]:
+        """Запись key не вытесняется, пока открыт контекст (например, от get до link)"""
+        with self._pins_lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._pins_lock:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+
+    async def get_or_build(
+        self,
+        key: str,
+        build: Callable[[str, ProgressHandler], Awaitable[Dict[str, Any]]],
+        on_progress: Optional[ProgressHandler] = None,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Сводка записи key и признак попадания в кэш (True - запись была готова).
+        При промахе build(directory, on_progress) сохраняет датасет в directory
+        и возвращает сводку; одновременные запросы с тем же ключом ждут одну генерацию
+        и получают ее события прогресса. Вызывается в потоке event loop.
+        """
+        meta = await asyncio.to_thread(self.get, key)
+        if meta is not None:
+            return meta, True
+
+        task = self._inflight.get(key)
+        if task is None:
+            self._listeners[key] = []
+            task = asyncio.ensure_future(self._build(key, build))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._finish_build(key))
+        elif on_progress is not None and key in self._last_progress:
+            # Присоединившийся позже сразу получает текущее состояние генерации
+            _notify(on_progress, self._last_progress[key])
+
+        listeners = self._listeners[key]
+        if on_progress is not None:
+            listeners.append(on_progress)
+        try:
+            # shield: отмена одного ожидающего не прерывает генерацию для остальных
+            return await asyncio.shield(task), False
+        finally:
+            if on_progress in listeners:
+                listeners.remove(on_progress)
+
+    def _progress(self, key: str, event: Dict[str, Any]):
+        self._last_progress[key] = event
+        for listener in list(self._listeners.get(key, ())):
+            _notify(listener, event)
+
+    def _finish_build(self, key: str):
+        self._inflight.pop(key, None)
+        self._listeners.pop(key, None)
+        self._last_progress.pop(key, None)
+
+    async def _build(self, key: str, build: Callable[[str, ProgressHandler], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        tmp_dir = os.path.join(self.root, f'.{key}.{uuid.uuid4().hex}.tmp')
+        try:
+            result = await build(tmp_dir, lambda event: self._progress(key, event))
+            meta = await asyncio.to_thread(self._commit, key, tmp_dir, result)
+        finally:
+            if os.path.exists(tmp_dir):
+                await asyncio.to_thread(shutil.rmtree, tmp_dir, True)
+        await asyncio.to_thread(self.evict, key)
+        return meta
+
+    def _commit(self, key: str, tmp_dir: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        meta = {k: v for k, v in result.items() if k != 'dataset_path'}
+        meta['key'] = key
+        meta['created_at'] = time.time()
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_dir, self.entry_dir(key))
+        except OSError:
+            # Запись уже создал другой процесс - используем ее
+            if not os.path.exists(os.path.join(self.entry_dir(key), META_FILE)):
+                raise
+        return self.get(key)
+
+    def link(self, meta: Dict[str, Any], directory: str) -> str:
+        """
+        Файлы датасета записи в directory жесткими ссылками: задача не копирует данные
+        и сохраняет их после вытеснения записи из кэша.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(meta['dataset_path']):
+            if entry.is_file() and entry.name != META_FILE:
+                target = os.path.join(directory, entry.name)
+                if not os.path.exists(target):
+                    _link_or_copy(entry.path, target)
+        return directory
+
+    def evict(self, keep: Optional[str] = None):
+        """Удаление давно не использованных записей, пока размер кэша больше max_bytes"""
+        entries = []
+        for entry in os.scandir(self.root):
+            meta_path = os.path.join(entry.path, META_FILE)
+            if entry.is_dir() and not entry.name.startswith('.') and os.path.exists(meta_path):
+                entries.append((os.path.getmtime(meta_path), entry.name, _dir_size(entry.path)))
+
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep or key in self._inflight:
+                continue
+            # Проверка закрепления и переименование - под одной блокировкой: запись,
+            # закрепленная после этого, уже не найдется через get и будет собрана заново
+            evicted_dir = os.path.join(self.root, f'.{key}.{uuid.uuid4().hex}.evicted')
+            with self._pins_lock:
+                if key in self._pins:
+                    continue
+                try:
+                    os.rename(self.entry_dir(key), evicted_dir)
+                except OSError:
+                    continue
+            shutil.rmtree(evicted_dir, ignore_errors=True)
+            total -= size
+            logger.info(f"Датасет {key[:12]} вытеснен из кэша ({size} байт)")
+
+
+def _notify(on_progress: ProgressHandler, event: Dict[str, Any]):
+    """Ошибка обработчика одного ожидающего не мешает остальным"""
+    try:
+        on_progress(event)
+    except Exception as e:
+        logger.warning(f"Ошибка обработчика прогресса: {e}")
@@ -0,0 +1,379 @@
+"""
+Потоковый экспорт сгенерированных датасетов.
+Таблицы пишутся срезами: текстовые UUID и JSON строятся только для одного
+среза за раз сериализатором Polars прямо из Arrow-буферов, поэтому память
+экспорта не зависит от размера датасета.
+
+Форматы: json, ndjson, parquet, ipc (Arrow IPC / Feather v2), csv.
+Колоночные форматы пишутся потоковыми sink'ами Polars.
+"""
+import io
+import os
+import json
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+
+import polars as pl
+from polars.io.plugins import register_io_source
+
+from app.core.batch_generator import render_patients, render_visits
+
+logger = logging.getLogger(__name__)
+
+# Строк в одном срезе экспорта
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '100000'))
+
+TABLES = ('patients', 'visits')
+
+# Форматы экспорта: допустимое и используемое по умолчанию сжатие.
+# IPC по умолчанию без сжатия - такой файл можно открыть через memory map.
+EXPORT_FORMATS = {
+    'json': {'compressions': (None,), 'default_compression': None},
+    'ndjson': {'compressions': (None,), 'default_compression': None},
+    'parquet': {'compressions': ('zstd', 'snappy', 'lz4', 'gzip', 'uncompressed'), 'default_compression': 'zstd'},
+    'ipc': {'compressions': ('uncompressed', 'lz4', 'zstd'), 'default_compression': 'uncompressed'},
+    'csv': {'compressions': ('uncompressed', 'gzip', 'zstd'), 'default_compression': 'uncompressed'},
+}
+FORMAT_ALIASES = {'feather': 'ipc', 'arrow': 'ipc', 'jsonl': 'ndjson'}
+
+
+def iter_rendered(dataset: Dict[str, pl.DataFrame], table: str, chunk_rows: int = None) -> Iterator[pl.DataFrame]:
+    """Срезы таблицы в экспортном виде: текстовые UUID, patient_id у визитов"""
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    frame = dataset[table]
+    for offset in range(0, len(frame), chunk_rows):
+        chunk = frame.slice(offset, chunk_rows)
+        if table == 'patients':
+            yield render_patients(chunk)
+        else:
+            parent_ids = dataset['patients']['id'].gather(chunk['patient_index'])
+            yield render_visits(chunk, parent_ids)
+
+
+def _rendered_schema(dataset: Dict[str, pl.DataFrame], table: str) -> pl.Schema:
+    patients_df = dataset['patients'].head(0)
+    if table == 'patients':
+        return render_patients(patients_df).schema
+    return render_visits(dataset['visits'].head(0), patients_df['id']).schema
+
+
+def scan_rendered(dataset: Dict[str, pl.DataFrame], table: str, chunk_rows: int = None) -> pl.LazyFrame:
+    """
+    LazyFrame поверх iter_rendered: срезы отдаются sink'ам Polars по мере записи,
+    весь экспортный вид таблицы в памяти не собирается.
+    """
+    def source(with_columns, predicate, n_rows, batch_size):
+        remaining = n_rows
+        for chunk in iter_rendered(dataset, table, chunk_rows):
+            if with_columns is not None:
+                chunk = chunk.select(with_columns)
+            if predicate is not None:
+                chunk = chunk.filter(predicate)
+            if remaining is not None:
+                chunk = chunk.head(remaining)
+                remaining -= len(chunk)
+            yield chunk
+            if remaining is not None and remaining <= 0:
+                break
+
+    return register_io_source(source, schema=_rendered_schema(dataset, table))
+
+
+def _ndjson_bytes(chunk: pl.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    chunk.write_ndjson(buffer)
+    return buffer.getvalue()
+
+
+def _csv_bytes(chunk: pl.DataFrame, include_header: bool) -> bytes:
+    buffer = io.BytesIO()
+    chunk.write_csv(buffer, include_header=include_header)
+    return buffer.getvalue()
+
+
+@contextmanager
+def atomic_path(filepath: str) -> Iterator[str]:
+    """
+    Временный путь для записи filepath; после успешной записи файл заменяет filepath.
+    Имя уникально для каждого писателя: одновременные запросы (потоки одного процесса)
+    не пишут в один временный файл. При ошибке временный файл удаляется.
+    """
+    tmp_path = f'{filepath}.{uuid.uuid4().hex}.tmp'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_chunks(filepath: str, chunks: Iterator[bytes]) -> str:
+    """Запись потока байт в файл через временный файл: читатели не увидят недописанный файл"""
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    with atomic_path(filepath) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+    return filepath
+
+
+def iter_ndjson(dataset: Dict[str, pl.DataFrame], table: str, chunk_rows: int = None) -> Iterator[bytes]:
+    """Таблица в NDJSON по срезам - по объекту на строку"""
+    for chunk in iter_rendered(dataset, table, chunk_rows):
+        yield _ndjson_bytes(chunk)
+
+
+def iter_json(dataset: Dict[str, pl.DataFrame], metadata: Dict[str, Any], chunk_rows: int = None) -> Iterator[bytes]:
+    """
+    Датасет одним JSON-документом {metadata, patients, visits} по срезам:
+    строки NDJSON среза разделяются запятыми (переводы строк внутри значений экранированы).
+    """
+    yield b'{"metadata": ' + json.dumps(metadata, ensure_ascii=False, default=str).encode('utf-8')
+    for table in TABLES:
+        yield f',\n"{table}": ['.encode('utf-8')
+        first = True
+        for rows in iter_ndjson(dataset, table, chunk_rows):
+            rows = rows.rstrip(b'\n')
+            if not rows:
+                continue
+            yield (b'\n' if first else b',\n') + rows.replace(b'\n', b',\n')
+            first = False
+        yield b'\n]'
+    yield b'}\n'
+
+
+def iter_csv(dataset: Dict[str, pl.DataFrame], table: str, chunk_rows: int = None) -> Iterator[bytes]:
+    """Таблица в CSV по срезам, заголовок - в первом срезе"""
+    include_header = True
+    for chunk in iter_rendered(dataset, table, chunk_rows):
+        yield _csv_bytes(chunk, include_header)
+        include_header = False
+    if include_header:
+        yield _csv_bytes(pl.DataFrame(schema=_rendered_schema(dataset, table)), True)
+
+
+# SQL: типы колонок экспортного вида и число строк в одном INSERT
+SQL_INSERT_ROWS = 1000
+SQL_MODES = ('insert', 'copy')
+
+
+def _sql_type(name: str, dtype: pl.DataType) -> str:
+    if name in ('id', 'patient_id'):
+        return 'VARCHAR(36)'
+    if isinstance(dtype, pl.Enum):
+        return 'VARCHAR(32)'
+    if dtype == pl.Boolean:
+        return 'BOOLEAN'
+    if dtype == pl.Date:
+        return 'DATE'
+    if dtype.is_float():
+        return 'DOUBLE PRECISION'
+    if dtype.is_integer():
+        return 'INTEGER'
+    return 'TEXT'
+
+
+def _create_table_sql(table: str, schema: pl.Schema) -> str:
+    columns = []
+    for name, dtype in schema.items():
+        column = f'    {name} {_sql_type(name, dtype)}'
+        if name == 'id':
+            column += ' PRIMARY KEY'
+        elif name == 'patient_id':
+            column += ' REFERENCES patients (id)'
+        columns.append(column)
+    return f'CREATE TABLE IF NOT EXISTS {table} (\n' + ',\n'.join(columns) + '\n);\n\n'
+
+
+def _sql_rows(chunk: pl.DataFrame) -> pl.Series:
+    """Кортежи значений SQL для строк среза, собираются выражениями Polars"""
+    values = []
+    for name, dtype in chunk.schema.items():
+        column = pl.col(name)
+        if dtype == pl.Boolean:
+            value = pl.when(column).then(pl.lit('TRUE')).otherwise(pl.lit('FALSE'))
+        elif dtype.is_numeric():
+            value = column.cast(pl.String)
+        else:
+            value = pl.concat_str(pl.lit("'"), column.cast(pl.String).str.replace_all("'", "''", literal=True), pl.lit("'"))
+        values.append(value.fill_null('NULL'))
+    return chunk.select(pl.concat_str(pl.lit('('), pl.concat_str(values, separator=', '), pl.lit(')'))).to_series()
+
+
+def iter_sql(dataset: Dict[str, pl.DataFrame], mode: str = 'insert', chunk_rows: int = None) -> Iterator[bytes]:
+    """
+    SQL-скрипт датасета по срезам: CREATE TABLE, затем данные -
+    многострочные INSERT (mode='insert') или COPY ... FROM stdin в CSV для PostgreSQL (mode='copy').
+    """
+    if mode not in SQL_MODES:
+        raise ValueError(f"Неизвестный режим SQL: {mode}. Доступны: {', '.join(SQL_MODES)}")
+    # Без времени выгрузки: повторная выгрузка дает те же байты (докачка по Range)
+    yield b'-- Digital Twin Factory Export\n\n'
+    for table in TABLES:
+        schema = _rendered_schema(dataset, table)
+        yield _create_table_sql(table, schema).encode('utf-8')
+        columns = ', '.join(schema.names())
+        if mode == 'copy':
+            yield f'COPY {table} ({columns}) FROM stdin WITH (FORMAT csv);\n'.encode('utf-8')
+            for chunk in iter_rendered(dataset, table, chunk_rows):
+                yield _csv_bytes(chunk, include_header=False)
+            yield b'\\.\n\n'
+            continue
+        for chunk in iter_rendered(dataset, table, chunk_rows):
+            rows = _sql_rows(chunk).to_list()
+            statements = [
+                f'INSERT INTO {table} ({columns}) VALUES\n' + ',\n'.join(rows[i:i + SQL_INSERT_ROWS]) + ';\n'
+                for i in range(0, len(rows), SQL_INSERT_ROWS)
+            ]
+            yield ''.join(statements).encode('utf-8')
+        yield b'\n'
+
+
+def write_ndjson(dataset: Dict[str, pl.DataFrame], table: str, filepath: str, chunk_rows: int = None) -> str:
+    """Таблица датасета в NDJSON - по объекту на строку"""
+    return write_chunks(filepath, iter_ndjson(dataset, table, chunk_rows))
+
+
+def write_parquet(
+    dataset: Dict[str, pl.DataFrame],
+    table: str,
+    filepath: str,
+    compression: str = 'zstd',
+    row_group_size: Optional[int] = None,
+    chunk_rows: int = None,
+) -> str:
+    with atomic_path(filepath) as tmp_path:
+        scan_rendered(dataset, table, chunk_rows).sink_parquet(tmp_path, compression=compression, row_group_size=row_group_size)
+    return filepath
+
+
+def write_ipc(
+    dataset: Dict[str, pl.DataFrame], table: str, filepath: str, compression: str = 'uncompressed', chunk_rows: int = None
+) -> str:
+    with atomic_path(filepath) as tmp_path:
+        scan_rendered(dataset, table, chunk_rows).sink_ipc(tmp_path, compression=compression)
+    return filepath
+
+
+def export_ndjson(dataset: Dict[str, pl.DataFrame], directory: str, chunk_rows: int = None) -> Dict[str, str]:
+    """Экспорт датасета в NDJSON: файл на таблицу (patients.ndjson, visits.ndjson)"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        table: write_ndjson(dataset, table, os.path.join(directory, f'{table}.ndjson'), chunk_rows)
+        for table in TABLES
+    }
+    logger.info(f"✅ Датасет сохранен в {directory} (NDJSON)")
+    return paths
+
+
+def export_json(dataset: Dict[str, pl.DataFrame], filepath: str, metadata: Dict[str, Any], chunk_rows: int = None) -> str:
+    """Экспорт датасета одним JSON-документом {metadata, patients, visits}"""
+    write_chunks(filepath, iter_json(dataset, metadata, chunk_rows))
+    logger.info(f"✅ Датасет сохранен в {filepath}")
+    return filepath
+
+
+def resolve_format(fmt: str, compression: Optional[str] = None) -> tuple:
+    """Каноническое имя формата и сжатие; ValueError для неизвестных значений"""
+    fmt = FORMAT_ALIASES.get(fmt.lower(), fmt.lower())
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}. Доступны: {', '.join(EXPORT_FORMATS)}")
+    spec = EXPORT_FORMATS[fmt]
+    compression = compression or spec['default_compression']
+    if compression not in spec['compressions']:
+        raise ValueError(f"Сжатие {compression} не поддерживается форматом {fmt}")
+    return fmt, compression
+
+
+def export_parquet(
+    dataset: Dict[str, pl.DataFrame],
+    directory: str,
+    compression: str = 'zstd',
+    row_group_size: Optional[int] = None,
+    chunk_rows: int = None,
+) -> Dict[str, str]:
+    """Экспорт в Parquet, файл на таблицу"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for table in TABLES:
+        paths[table] = write_parquet(
+            dataset, table, os.path.join(directory, f'{table}.parquet'), compression, row_group_size, chunk_rows
+        )
+    logger.info(f"✅ Датасет сохранен в {directory} (Parquet, {compression})")
+    return paths
+
+
+def export_ipc(
+    dataset: Dict[str, pl.DataFrame], directory: str, compression: str = 'uncompressed', chunk_rows: int = None
+) -> Dict[str, str]:
+    """Экспорт в Arrow IPC (Feather v2), файл на таблицу"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for table in TABLES:
+        paths[table] = write_ipc(dataset, table, os.path.join(directory, f'{table}.arrow'), compression, chunk_rows)
+    logger.info(f"✅ Датасет сохранен в {directory} (Arrow IPC, {compression})")
+    return paths
+
+
+def export_csv(
+    dataset: Dict[str, pl.DataFrame], directory: str, compression: str = 'uncompressed', chunk_rows: int = None
+) -> Dict[str, str]:
+    """Экспорт в CSV, файл на таблицу (при сжатии - .csv.gz / .csv.zst)"""
+    os.makedirs(directory, exist_ok=True)
+    suffix = {'uncompressed': '', 'gzip': '.gz', 'zstd': '.zst'}[compression]
+    paths = {}
+    for table in TABLES:
+        paths[table] = os.path.join(directory, f'{table}.csv{suffix}')
+        with atomic_path(paths[table]) as tmp_path:
+            scan_rendered(dataset, table, chunk_rows).sink_csv(
+                tmp_path, compression=compression, check_extension=False
+            )
+    logger.info(f"✅ Датасет сохранен в {directory} (CSV)")
+    return paths
+
+
+def export_dataset(
+    dataset: Dict[str, pl.DataFrame],
+    directory: str,
+    fmt: str = 'json',
+    compression: Optional[str] = None,
+    row_group_size: Optional[int] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> Dict[str, str]:
+    """
+    Экспорт датасета в каталог в выбранном формате.
+    Возвращает пути файлов по таблицам (для json - один файл 'dataset').
+    """
+    fmt, compression = resolve_format(fmt, compression)
+    if fmt == 'json':
+        os.makedirs(directory, exist_ok=True)
+        return {'dataset': export_json(dataset, os.path.join(directory, 'dataset.json'), metadata or {})}
+    if fmt == 'ndjson':
+        return export_ndjson(dataset, directory)
+    if fmt == 'parquet':
+        return export_parquet(dataset, directory, compression, row_group_size)
+    if fmt == 'ipc':
+        return export_ipc(dataset, directory, compression)
+    return export_csv(dataset, directory, compression)
+
+
+def save_dataset(dataset: Dict[str, pl.DataFrame], directory: str) -> str:
+    """
+    Сохранение датасета в компактном виде (бинарные id, patient_index) в Arrow IPC без сжатия:
+    при выгрузке файлы открываются через memory map, а не читаются в память.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for table in TABLES:
+        filepath = os.path.join(directory, f'{table}.ipc')
+        with atomic_path(filepath) as tmp_path:
+            dataset[table].write_ipc(tmp_path, compression='uncompressed')
+    return directory
+
+
+def load_dataset(directory: str) -> Dict[str, pl.DataFrame]:
+    return {
+        table: pl.read_ipc(os.path.join(directory, f'{table}.ipc'), memory_map=True)
+        for table in TABLES
+    }
@@ -0,0 +1,276 @@
+"""
+Выполнение задач генерации вне event loop.
+Генерация - CPU-bound работа, поэтому задачи уходят в пул процессов
+фиксированного размера: API остается отзывчивым, а одновременно
+выполняется не больше GENERATION_WORKERS задач, остальные ждут в очереди пула.
+"""
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from app.core.batch_generator import BatchGenerator
+from app.core.export import save_dataset
+from app.core.dataset_cache import DatasetCache, dataset_cache_key
+
+logger = logging.getLogger(__name__)
+
+GENERATION_WORKERS = int(os.getenv('GENERATION_WORKERS', '2'))
+# Максимум задач в пуле (выполняются + ждут); 0 - без ограничения
+GENERATION_QUEUE_LIMIT = int(os.getenv('GENERATION_QUEUE_LIMIT', '100'))
+
+
+class JobQueueFull(RuntimeError):
+    """Очередь задач генерации заполнена"""
+
+
+class JobCancelled(RuntimeError):
+    """Задача снята с очереди пула при его остановке (shutdown с cancel_futures)"""
+
+
+def generate_dataset_job(
+    patients: int,
+    visits: int,
+    seed: int,
+    batch_size: int = 10000,
+    dataset_dir: Optional[str] = None,
+    progress_queue=None,
+) -> Dict[str, Any]:
+    """
+    Генерация датасета в процессе пула. Таблицы не передаются обратно
+    через pickle: возвращается сводка, датасет при необходимости сохраняется в dataset_dir.
+    События прогресса по батчам отправляются в progress_queue (очередь Manager).
+    """
+    started = time.perf_counter()
+    generator = BatchGenerator(batch_size=batch_size, seed=seed)
+    callback = progress_queue.put if progress_queue is not None else None
+    dataset = generator.generate_full_medical_dataset(patients, visits, progress_callback=callback)
+
+    patients_df, visits_df = dataset['patients'], dataset['visits']
+    result = {
+        'patients': len(patients_df),
+        'visits': len(visits_df),
+        'statistics': {
+            'diabetes_rate': float(patients_df['diabetes'].mean() or 0),
+            'avg_bmi': float(patients_df['bmi'].mean() or 0),
+            'avg_cost': float(visits_df['cost'].mean() or 0),
+        },
+    }
+    if dataset_dir:
+        result['dataset_path'] = save_dataset(dataset, dataset_dir)
+    result['generation_time'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def generate_dataset_cached(
+    runner: 'JobRunner',
+    cache: DatasetCache,
+    patients: int,
+    visits: int,
+    seed: int,
+    dataset_dir: str,
+    batch_size: int = 10000,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Датасет задачи через кэш: повторный запрос связывает dataset_dir с готовой записью,
+    промах генерирует датасет в пуле прямо в кэш (с тем же ключом - одна генерация
+    на всех, прогресс получает каждый). В результате cached - был ли датасет готов.
+    """
+    key = dataset_cache_key(patients, visits, seed, batch_size=batch_size)
+    # Запись закреплена до связывания: вытеснение не удалит ее между get и link
+    with cache.pinned(key):
+        meta, cached = await cache.get_or_build(
+            key,
+            lambda directory, progress: runner.run(
+                generate_dataset_job, patients, visits, seed, batch_size,
+                dataset_dir=directory, on_progress=progress,
+            ),
+            on_progress,
+        )
+        dataset_path = await asyncio.to_thread(cache.link, meta, dataset_dir)
+    result = dict(meta)
+    result['dataset_path'] = dataset_path
+    result['cached'] = cached
+    return result
+
+
+def job_progress(
+    job: Dict[str, Any],
+    on_update: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Callable[[Dict[str, Any]], None]:
+    """
+    Обработчик событий прогресса, обновляющий запись задачи в jobs_db.
+    on_update(job) вызывается после каждого обновления (например, JobEventBus.publish).
+    """
+    def update(event: Dict[str, Any]):
+        job['progress'] = event['progress']
+        job['rows_done'] = event['rows_done']
+        job['rows_per_second'] = event['rows_per_second']
+        job['eta_seconds'] = event['eta_seconds']
+        job['message'] = f"Генерация: {event['stage']} ({event['rows_done']}/{event['rows_total']})"
+        if on_update is not None:
+            on_update(job)
+    return update
+
+
+class JobRunner:
+    """
+    Пул процессов для задач генерации, общий на приложение.
+    start() / shutdown() вызываются из событий жизненного цикла приложения.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_limit: Optional[int] = None):
+        self.workers = workers or GENERATION_WORKERS
+        self.queue_limit = GENERATION_QUEUE_LIMIT if queue_limit is None else queue_limit
+        self.pending = 0
+        self._pool = None
+        self._manager = None
+        self._queue = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._handlers: Dict[int, Tuple[asyncio.AbstractEventLoop, Callable, asyncio.Future]] = {}
+        self._tokens = itertools.count()
+        self._progress_lock = threading.Lock()
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            logger.info(f"Пул генерации запущен: {self.workers} процессов")
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+            logger.info("Пул генерации остановлен")
+        if self._dispatcher is not None:
+            self._queue.put(None)
+            self._dispatcher.join(timeout=5)
+            self._dispatcher = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+            self._queue = None
+
+    def is_full(self) -> bool:
+        return bool(self.queue_limit) and self.pending >= self.queue_limit
+
+    def _progress_queue(self):
+        """
+        Общая очередь событий прогресса из процессов пула и поток-диспетчер
+        (создаются при первой задаче с прогрессом). Один поток на все задачи:
+        ожидающие задачи не занимают потоки executor'а по умолчанию.
+        """
+        with self._progress_lock:
+            if self._queue is None:
+                self._manager = multiprocessing.get_context('spawn').Manager()
+                self._queue = self._manager.Queue()
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_progress, args=(self._queue,), name='job-progress', daemon=True
+                )
+                self._dispatcher.start()
+            return self._queue
+
+    def _dispatch_progress(self, queue):
+        """Поток-диспетчер: события (token, event) передаются в loop задачи; (token, None) - конец задачи"""
+        while True:
+            try:
+                item = queue.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            token, event = item
+            handler = self._handlers.get(token)
+            if handler is None:
+                continue
+            loop, on_progress, done = handler
+            if event is None:
+                loop.call_soon_threadsafe(_resolve, done)
+            else:
+                loop.call_soon_threadsafe(_deliver, on_progress, event)
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Выполнение fn(*args, **kwargs) в пуле; корутина ждет результат, не блокируя loop.
+        С on_progress fn получает progress_queue, а события из нее передаются
+        в on_progress в потоке event loop (можно напрямую менять jobs_db).
+        """
+        if self.is_full():
+            raise JobQueueFull(f"В очереди генерации уже {self.pending} задач")
+        self.start()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if on_progress is None:
+                return await self._in_pool(partial(fn, *args, **kwargs))
+
+            queue = self._queue or await asyncio.to_thread(self._progress_queue)
+            token = next(self._tokens)
+            done = loop.create_future()
+            self._handlers[token] = (loop, on_progress, done)
+            try:
+                channel = ProgressChannel(queue, token)
+                return await self._in_pool(partial(fn, *args, progress_queue=channel, **kwargs))
+            finally:
+                # Метка конца задачи идет за ее событиями: все они доставлены до выхода из run
+                await asyncio.to_thread(queue.put, (token, None))
+                try:
+                    await asyncio.wait_for(done, timeout=5)
+                except asyncio.TimeoutError:
+                    logger.warning("Не дождались последних событий прогресса задачи")
+                self._handlers.pop(token, None)
+        finally:
+            self.pending -= 1
+
+    async def _in_pool(self, call: Callable[[], Any]) -> Any:
+        """
+        Ожидание вызова в пуле. Future, отмененный самим пулом при shutdown, приходит
+        в корутину как asyncio.CancelledError без отмены задачи asyncio - он заменяется
+        на JobCancelled, чтобы вызывающий пометил задачу failed, а не потерял ее.
+        """
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            raise JobCancelled("Генерация отменена: пул процессов остановлен") from None
+
+
+class ProgressChannel:
+    """Канал прогресса задачи в общей очереди: события помечаются номером задачи"""
+
+    def __init__(self, queue, token: int):
+        self.queue = queue
+        self.token = token
+
+    def put(self, event: Dict[str, Any]):
+        self.queue.put((self.token, event))
+
+
+def _resolve(done: asyncio.Future):
+    if not done.done():
+        done.set_result(None)
+
+
+def _deliver(on_progress: Callable[[Dict[str, Any]], None], event: Dict[str, Any]):
+    """Вызов обработчика в потоке loop; ошибки обработчика не прерывают генерацию"""
+    try:
+        on_progress(event)
+    except Exception as e:
+        logger.warning(f"Ошибка обработчика прогресса: {e}")
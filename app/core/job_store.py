@@ -0,0 +1,392 @@
+"""
+Хранилище задач генерации вместо словаря jobs_db в памяти процесса.
+Задачи переживают перезапуск и видны всем воркерам uvicorn.
+По умолчанию - SQLite, для Postgres используется таблица generation_jobs (scripts/init_db.py).
+Список задач - keyset-пагинация по индексу (user_id, created_at, job_id):
+стоимость запроса зависит от размера страницы, а не от числа задач в истории.
+"""
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Set
+
+logger = logging.getLogger(__name__)
+
+JOB_STORE_URL = os.getenv('JOB_STORE_URL', 'sqlite:///data/jobs.db')
+# Минимальный интервал между сохранениями прогресса одной задачи (секунды)
+JOB_PROGRESS_SAVE_INTERVAL = float(os.getenv('JOB_PROGRESS_SAVE_INTERVAL', '1'))
+
+Job = Dict[str, Any]
+
+# Статусы задач, которые выполняются в процессе приложения: после перезапуска их никто не завершит
+INTERRUPTED_STATUSES = ('pending', 'processing')
+INTERRUPTED_ERROR = 'Генерация прервана перезапуском сервера'
+
+
+def encode_cursor(job: Job) -> str:
+    """Курсор страницы - (created_at, job_id) последней задачи"""
+    return f"{job['created_at']}|{job['job_id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    created_at, sep, job_id = cursor.rpartition('|')
+    if not sep:
+        raise ValueError(f"Некорректный курсор: {cursor}")
+    return created_at, job_id
+
+
+class JobStore:
+    """Интерфейс хранилища; запись задачи - словарь с job_id, user_id, status, created_at"""
+
+    def save(self, job: Job):
+        """Создание или полная перезапись задачи"""
+        raise NotImplementedError
+
+    def overwrite(self, job: Job) -> bool:
+        """
+        Перезапись существующей задачи. Удаленная задача не создается заново:
+        False, если записи нет.
+        """
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def delete(self, job_id: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def list(self, user_id: Optional[str] = None, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Job], Optional[str]]:
+        """
+        Страница задач от новых к старым (всех или пользователя user_id)
+        и курсор следующей страницы (None - страница последняя).
+        """
+        raise NotImplementedError
+
+    def count(self, status: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    def totals(self) -> Dict[str, int]:
+        """Число задач по итогам и объем данных завершенных задач: jobs, completed, failed, patients, visits"""
+        raise NotImplementedError
+
+    def fail_interrupted(self, error: str = INTERRUPTED_ERROR) -> int:
+        """
+        Задачи pending / processing, оставшиеся от прошлого запуска (генерация шла в пуле
+        процессов приложения), помечаются failed. Вызывается при старте приложения,
+        до приема новых задач. Возвращает число таких задач.
+        """
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        return job if self.overwrite(job) else None
+
+    @staticmethod
+    def _page(jobs: List[Job], limit: int) -> Tuple[List[Job], Optional[str]]:
+        # Запрашивается limit + 1 строка: лишняя строка означает, что есть следующая страница
+        if len(jobs) > limit:
+            jobs = jobs[:limit]
+            return jobs, encode_cursor(jobs[-1])
+        return jobs, None
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Задачи в файле SQLite (WAL - несколько процессов читают и пишут одновременно).
+    Индексируемые поля вынесены в колонки, запись целиком хранится в JSON.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs(user_id, created_at, job_id);
+                CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at, job_id);
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+            """)
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def save(self, job: Job):
+        self._execute(
+            "INSERT INTO jobs (job_id, user_id, status, created_at, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(job_id) DO UPDATE SET user_id = excluded.user_id, status = excluded.status, "
+            "created_at = excluded.created_at, data = excluded.data",
+            (job['job_id'], job.get('user_id'), job.get('status', 'pending'), job['created_at'],
+             json.dumps(job, ensure_ascii=False, default=str)),
+        )
+
+    def overwrite(self, job: Job) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET user_id = ?, status = ?, created_at = ?, data = ? WHERE job_id = ?",
+                (job.get('user_id'), job.get('status', 'pending'), job['created_at'],
+                 json.dumps(job, ensure_ascii=False, default=str), job['job_id']),
+            )
+            return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Job]:
+        rows = self._execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def delete(self, job_id: str):
+        self._execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def clear(self):
+        self._execute("DELETE FROM jobs")
+
+    def list(self, user_id: Optional[str] = None, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Job], Optional[str]]:
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if cursor:
+            conditions.append("(created_at, job_id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._execute(
+            f"SELECT data FROM jobs {where} ORDER BY created_at DESC, job_id DESC LIMIT ?",
+            (*params, limit + 1),
+        )
+        return self._page([json.loads(row[0]) for row in rows], limit)
+
+    def fail_interrupted(self, error: str = INTERRUPTED_ERROR) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', data = json_set(data, '$.status', 'failed', "
+                "'$.error', ?, '$.message', ?, '$.completed_at', ?) "
+                f"WHERE status IN ({', '.join('?' for _ in INTERRUPTED_STATUSES)})",
+                (error, error, datetime.now().isoformat(), *INTERRUPTED_STATUSES),
+            )
+            return cursor.rowcount
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status is None:
+            return self._execute("SELECT COUNT(*) FROM jobs")[0][0]
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,))[0][0]
+
+    def totals(self) -> Dict[str, int]:
+        row = self._execute("""
+            SELECT COUNT(*),
+                   COALESCE(SUM(status = 'completed'), 0),
+                   COALESCE(SUM(status = 'failed'), 0),
+                   COALESCE(SUM(CASE WHEN status = 'completed' THEN json_extract(data, '$.patients') END), 0),
+                   COALESCE(SUM(CASE WHEN status = 'completed' THEN json_extract(data, '$.visits') END), 0)
+            FROM jobs
+        """)[0]
+        return dict(zip(('jobs', 'completed', 'failed', 'patients', 'visits'), row))
+
+
+class PostgresJobStore(JobStore):
+    """
+    Задачи в таблице generation_jobs (scripts/init_db.py).
+    Запись целиком хранится в parameters (JSONB), индексируемые поля - в колонках.
+    """
+
+    def __init__(self, url: str):
+        from sqlalchemy import create_engine, text
+
+        self._text = text
+        self._engine = create_engine(url, pool_pre_ping=True)
+
+    def _execute(self, sql: str, **params) -> int:
+        with self._engine.begin() as conn:
+            return conn.execute(self._text(sql), params).rowcount
+
+    def _fetch(self, sql: str, **params) -> List[tuple]:
+        with self._engine.connect() as conn:
+            return conn.execute(self._text(sql), params).fetchall()
+
+    @staticmethod
+    def _params(job: Job) -> Dict[str, Any]:
+        patients = int(job.get('patients') or 0)
+        visits = int(job.get('visits') or 0)
+        return {
+            'id': job['job_id'],
+            'user_id': job.get('user_id'),
+            'status': job.get('status', 'pending'),
+            'job_type': job.get('job_type', 'medical'),
+            'row_count': int(job.get('records') or patients + visits),
+            'entity_counts': json.dumps({'patients': patients, 'visits': visits}),
+            'parameters': json.dumps(job, ensure_ascii=False, default=str),
+            'created_at': job['created_at'],
+            'completed_at': job.get('completed_at'),
+            'result_url': job.get('result_url'),
+            'error_message': job.get('error'),
+        }
+
+    def save(self, job: Job):
+        self._execute(
+            """
+            INSERT INTO generation_jobs (
+                id, user_id, status, job_type, row_count, entity_counts, parameters,
+                created_at, completed_at, result_url, error_message
+            ) VALUES (
+                CAST(:id AS UUID), :user_id, :status, :job_type, :row_count, CAST(:entity_counts AS JSONB),
+                CAST(:parameters AS JSONB), CAST(:created_at AS TIMESTAMP), CAST(:completed_at AS TIMESTAMP),
+                :result_url, :error_message
+            )
+            ON CONFLICT (id) DO UPDATE SET
+                user_id = EXCLUDED.user_id, status = EXCLUDED.status, row_count = EXCLUDED.row_count,
+                entity_counts = EXCLUDED.entity_counts, parameters = EXCLUDED.parameters,
+                completed_at = EXCLUDED.completed_at, result_url = EXCLUDED.result_url,
+                error_message = EXCLUDED.error_message
+            """,
+            **self._params(job),
+        )
+
+    def overwrite(self, job: Job) -> bool:
+        params = self._params(job)
+        del params['job_type'], params['created_at']
+        updated = self._execute(
+            """
+            UPDATE generation_jobs SET
+                user_id = :user_id, status = :status, row_count = :row_count,
+                entity_counts = CAST(:entity_counts AS JSONB), parameters = CAST(:parameters AS JSONB),
+                completed_at = CAST(:completed_at AS TIMESTAMP), result_url = :result_url,
+                error_message = :error_message
+            WHERE id = CAST(:id AS UUID)
+            """,
+            **params,
+        )
+        return updated > 0
+
+    def get(self, job_id: str) -> Optional[Job]:
+        rows = self._fetch("SELECT parameters FROM generation_jobs WHERE id = CAST(:id AS UUID)", id=job_id)
+        return dict(rows[0][0]) if rows else None
+
+    def delete(self, job_id: str):
+        self._execute("DELETE FROM generation_jobs WHERE id = CAST(:id AS UUID)", id=job_id)
+
+    def clear(self):
+        self._execute("DELETE FROM generation_jobs")
+
+    def list(self, user_id: Optional[str] = None, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Job], Optional[str]]:
+        conditions, params = [], {'limit': limit + 1}
+        if user_id is not None:
+            conditions.append("user_id = :user_id")
+            params['user_id'] = user_id
+        if cursor:
+            params['cursor_created'], params['cursor_id'] = decode_cursor(cursor)
+            conditions.append(
+                "(created_at, id) < (CAST(:cursor_created AS TIMESTAMP), CAST(:cursor_id AS UUID))"
+            )
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._fetch(
+            f"SELECT parameters FROM generation_jobs {where} ORDER BY created_at DESC, id DESC LIMIT :limit",
+            **params,
+        )
+        return self._page([dict(row[0]) for row in rows], limit)
+
+    def fail_interrupted(self, error: str = INTERRUPTED_ERROR) -> int:
+        return self._execute(
+            """
+            UPDATE generation_jobs SET
+                status = 'failed', error_message = :error, completed_at = CAST(:completed_at AS TIMESTAMP),
+                parameters = parameters || jsonb_build_object(
+                    'status', 'failed', 'error', CAST(:error AS TEXT), 'message', CAST(:error AS TEXT),
+                    'completed_at', CAST(:completed_at AS TEXT)
+                )
+            WHERE status = ANY(:statuses)
+            """,
+            error=error, completed_at=datetime.now().isoformat(), statuses=list(INTERRUPTED_STATUSES),
+        )
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status is None:
+            return self._fetch("SELECT COUNT(*) FROM generation_jobs")[0][0]
+        return self._fetch("SELECT COUNT(*) FROM generation_jobs WHERE status = :status", status=status)[0][0]
+
+    def totals(self) -> Dict[str, int]:
+        row = self._fetch("""
+            SELECT COUNT(*),
+                   COUNT(*) FILTER (WHERE status = 'completed'),
+                   COUNT(*) FILTER (WHERE status = 'failed'),
+                   COALESCE(SUM((entity_counts->>'patients')::BIGINT) FILTER (WHERE status = 'completed'), 0),
+                   COALESCE(SUM((entity_counts->>'visits')::BIGINT) FILTER (WHERE status = 'completed'), 0)
+            FROM generation_jobs
+        """)[0]
+        return dict(zip(('jobs', 'completed', 'failed', 'patients', 'visits'), row))
+
+
+class JobWriter:
+    """
+    Запись задач из event loop: вызовы хранилища выполняются в потоке (asyncio.to_thread),
+    записи одной задачи идут по порядку, прогресс сохраняется не чаще interval.
+    После создания задача только перезаписывается (JobStore.overwrite), поэтому
+    удаленная во время генерации задача не появляется снова.
+    """
+
+    def __init__(self, store: JobStore, interval: float = JOB_PROGRESS_SAVE_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._saved_at: Dict[str, float] = {}
+        self._pending: Set[asyncio.Task] = set()
+
+    async def save(self, job: Job, create: bool = False) -> bool:
+        """Сохранение снимка задачи; False - задача удалена"""
+        job_id = job['job_id']
+        snapshot = dict(job)
+        lock = self._locks.setdefault(job_id, asyncio.Lock())
+        async with lock:
+            self._saved_at[job_id] = time.monotonic()
+            if create:
+                await asyncio.to_thread(self.store.save, snapshot)
+                return True
+            return await asyncio.to_thread(self.store.overwrite, snapshot)
+
+    def save_progress(self, job: Job):
+        """
+        Из синхронного обработчика прогресса в потоке event loop:
+        фоновая запись, если с прошлой прошло не меньше interval.
+        """
+        job_id = job['job_id']
+        if time.monotonic() - self._saved_at.get(job_id, 0) < self.interval:
+            return
+        self._saved_at[job_id] = time.monotonic()
+        task = asyncio.get_running_loop().create_task(self.save(job))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def forget(self, job_id: str):
+        """Задача завершена: состояние записи больше не нужно"""
+        lock = self._locks.get(job_id)
+        if lock is not None and not lock.locked():
+            del self._locks[job_id]
+        self._saved_at.pop(job_id, None)
+
+
+def create_job_store(url: Optional[str] = None) -> JobStore:
+    """Хранилище по URL: sqlite:///path/to/jobs.db или postgresql://..."""
+    url = url or JOB_STORE_URL
+    if url.startswith('sqlite:///'):
+        return SQLiteJobStore(url[len('sqlite:///'):])
+    if url.startswith('postgresql'):
+        return PostgresJobStore(url)
+    raise ValueError(f"Неподдерживаемое хранилище задач: {url}")
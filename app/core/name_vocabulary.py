@@ -0,0 +1,146 @@
+"""
+Словари имен для генерации пациентов.
+Списки имен локали Faker извлекаются один раз, кэшируются на диске
+в виде массивов NumPy и сэмплируются векторно целыми индексами.
+Кэш на диске (NAME_VOCABULARY_DIR) - производные данные, в репозиторий не входит.
+"""
+import os
+import logging
+import zipfile
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+NAME_VOCABULARY_DIR = os.getenv('NAME_VOCABULARY_DIR', 'data/vocabularies')
+
+# Поврежденный или недописанный файл кэша: словарь извлекается из Faker заново
+_CACHE_ERRORS = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+_vocabularies: Dict[str, 'NameVocabulary'] = {}
+_vocabularies_lock = threading.Lock()
+
+# Списки, которые храним для каждой локали: имена и фамилии по полу
+NAME_LISTS = ('first_names_male', 'first_names_female', 'last_names_male', 'last_names_female')
+
+
+class NameVocabulary:
+    """
+    Имена одной локали: значения и веса частот (если Faker их задает).
+    Мужские и женские списки хранятся одной Series, чтобы выборка
+    по колонке пола была одним gather.
+    """
+
+    def __init__(self, locale: str, names: Dict[str, np.ndarray], weights: Dict[str, Optional[np.ndarray]]):
+        self.locale = locale
+        self.names = names
+        self.weights = weights
+        self._cdfs = {key: np.cumsum(w) if w is not None else None for key, w in weights.items()}
+        self._series = {
+            kind: pl.Series(np.concatenate([names[f'{kind}_male'], names[f'{kind}_female']]))
+            for kind in ('first_names', 'last_names')
+        }
+
+    @classmethod
+    def from_faker(cls, locale: str) -> 'NameVocabulary':
+        """Извлечение списков имен из провайдера person локали Faker"""
+        from faker import Faker
+
+        provider = Faker(locale).factories[0].provider('faker.providers.person')
+        names, weights = {}, {}
+        for key in NAME_LISTS:
+            # Если у локали нет списка по полу, берем общий (например, фамилии en_US)
+            elements = getattr(provider, key, None) or getattr(provider, key.rsplit('_', 1)[0])
+            if isinstance(elements, dict):
+                names[key] = np.array(list(elements.keys()))
+                weights[key] = np.fromiter(elements.values(), dtype=float, count=len(elements))
+            else:
+                names[key] = np.array(list(elements))
+                weights[key] = None
+        return cls(locale, names, weights)
+
+    @classmethod
+    def load(cls, path: str, locale: str) -> 'NameVocabulary':
+        with np.load(path, allow_pickle=False) as data:
+            names = {key: data[key] for key in NAME_LISTS}
+            weights = {key: data[f'{key}_weights'] if f'{key}_weights' in data else None for key in NAME_LISTS}
+        return cls(locale, names, weights)
+
+    def save(self, path: str):
+        # export импортирует batch_generator, который импортирует этот модуль
+        from app.core.export import atomic_path
+
+        arrays = dict(self.names)
+        arrays.update({f'{key}_weights': w for key, w in self.weights.items() if w is not None})
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Временный файл и замена: параллельные процессы не увидят половину файла
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+
+    def _draw(self, key: str, count: int, rng: np.random.Generator, weighted: bool) -> np.ndarray:
+        """Индексы в списке key: по весам частот или равномерно"""
+        cdf = self._cdfs[key]
+        if cdf is None or not weighted:
+            return rng.integers(0, len(self.names[key]), count)
+        positions = np.searchsorted(cdf, rng.random(count) * cdf[-1], side='right')
+        return np.minimum(positions, len(cdf) - 1)
+
+    def sample_codes(self, kind: str, is_male: np.ndarray, rng: np.random.Generator, weighted: bool = True) -> np.ndarray:
+        """
+        Коды имен kind ('first_names' / 'last_names') в соответствии с полом.
+        Строки получаются из кодов через names_for(); коды можно копить и собирать разом.
+        """
+        codes = np.empty(len(is_male), dtype=np.uint32)
+        n_male = np.count_nonzero(is_male)
+        codes[is_male] = self._draw(f'{kind}_male', n_male, rng, weighted)
+        codes[~is_male] = len(self.names[f'{kind}_male']) + self._draw(
+            f'{kind}_female', len(is_male) - n_male, rng, weighted
+        )
+        return codes
+
+    def names_for(self, kind: str, codes: np.ndarray) -> pl.Series:
+        return self._series[kind].gather(codes)
+
+    def sample(self, kind: str, is_male: np.ndarray, rng: np.random.Generator, weighted: bool = True) -> pl.Series:
+        """Выборка имен kind в соответствии с полом"""
+        return self.names_for(kind, self.sample_codes(kind, is_male, rng, weighted))
+
+
+def vocabulary_path(locale: str, cache_dir: Optional[str] = None) -> str:
+    return os.path.join(cache_dir or NAME_VOCABULARY_DIR, f'names_{locale}.npz')
+
+
+def get_vocabulary(locale: str = 'en_US') -> NameVocabulary:
+    """
+    Словарь имен локали: из памяти процесса, из кэша на диске
+    или (при первом обращении) из Faker с сохранением на диск.
+    Одновременные первые обращения из потоков строят словарь один раз.
+    """
+    vocabulary = _vocabularies.get(locale)
+    if vocabulary is not None:
+        return vocabulary
+    with _vocabularies_lock:
+        if locale not in _vocabularies:
+            _vocabularies[locale] = _load_or_build(locale)
+        return _vocabularies[locale]
+
+
+def _load_or_build(locale: str) -> NameVocabulary:
+    path = vocabulary_path(locale)
+    if os.path.exists(path):
+        try:
+            return NameVocabulary.load(path, locale)
+        except _CACHE_ERRORS as e:
+            logger.warning(f"Кэш словаря {path} поврежден, пересоздаем: {e}")
+
+    vocabulary = NameVocabulary.from_faker(locale)
+    try:
+        vocabulary.save(path)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить словарь имен {locale}: {e}")
+    logger.info(f"Словарь имен {locale} извлечен из Faker")
+    return vocabulary
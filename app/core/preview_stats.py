@@ -0,0 +1,52 @@
+"""
+Ожидаемая статистика датасета для предпросмотра при постановке задачи.
+Считается аналитически по параметрам распределений BatchGenerator
+(среднее нормального распределения, обрезанного clip), не зависит от seed
+и размера датасета и не требует генерации выборки.
+"""
+import math
+from functools import lru_cache
+from typing import Dict, Any, Tuple
+
+from app.core.batch_generator import (
+    DIABETES_RATE,
+    BMI_DIABETIC,
+    BMI_NON_DIABETIC,
+    BMI_RANGE,
+    VISIT_COST,
+    VISIT_COST_RANGE,
+)
+
+
+def _pdf(x: float) -> float:
+    return math.exp(-x * x / 2) / math.sqrt(2 * math.pi)
+
+
+def _cdf(x: float) -> float:
+    return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+
+
+def clipped_normal_mean(params: Tuple[float, float], bounds: Tuple[float, float]) -> float:
+    """Среднее clip(N(mu, sigma), low, high): значения за границами прижимаются к ним"""
+    mu, sigma = params
+    low, high = bounds
+    a, b = (low - mu) / sigma, (high - mu) / sigma
+    inside = mu * (_cdf(b) - _cdf(a)) + sigma * (_pdf(a) - _pdf(b))
+    return low * _cdf(a) + high * (1 - _cdf(b)) + inside
+
+
+@lru_cache(maxsize=1)
+def expected_statistics() -> Dict[str, Any]:
+    """Статистика в формате результата задачи генерации (diabetes_rate, avg_bmi, avg_cost, bmi_correlation)"""
+    diabetic_bmi = clipped_normal_mean(BMI_DIABETIC, BMI_RANGE)
+    non_diabetic_bmi = clipped_normal_mean(BMI_NON_DIABETIC, BMI_RANGE)
+    return {
+        'diabetes_rate': DIABETES_RATE,
+        'avg_bmi': DIABETES_RATE * diabetic_bmi + (1 - DIABETES_RATE) * non_diabetic_bmi,
+        'avg_cost': clipped_normal_mean(VISIT_COST, VISIT_COST_RANGE),
+        'bmi_correlation': {
+            'diabetic': round(diabetic_bmi, 1),
+            'non_diabetic': round(non_diabetic_bmi, 1),
+            'difference': round(diabetic_bmi - non_diabetic_bmi, 1),
+        },
+    }
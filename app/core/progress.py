@@ -0,0 +1,53 @@
+"""
+Прогресс генерации по батчам.
+ProgressTracker считает строки, скорость и ETA и передает события в callback
+не чаще min_interval секунд, чтобы частые батчи не перегружали хранилище задач (Redis, jobs_db).
+"""
+import time
+from typing import Dict, Any, Callable, Optional
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class ProgressTracker:
+    """
+    Счетчик прогресса одного задания из total_rows строк (пациенты + визиты).
+    Событие: stage, rows_done, rows_total, progress (0-100), rows_per_second, eta_seconds.
+    """
+
+    def __init__(self, total_rows: int, callback: Optional[ProgressCallback], min_interval: float = 0.5):
+        self.total_rows = total_rows
+        self.callback = callback
+        self.min_interval = min_interval
+        self.rows_done = 0
+        self.stage = None
+        self._started = time.perf_counter()
+        self._last_emit = None
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+
+    def advance(self, rows: int):
+        """Учет готового батча; событие отправляется с троттлингом, последнее - всегда"""
+        self.rows_done += rows
+        now = time.perf_counter()
+        finished = self.rows_done >= self.total_rows
+        if self.callback is None:
+            return
+        if not finished and self._last_emit is not None and now - self._last_emit < self.min_interval:
+            return
+        self._last_emit = now
+        self.callback(self.snapshot(now))
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        elapsed = (now or time.perf_counter()) - self._started
+        rate = self.rows_done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total_rows - self.rows_done, 0)
+        return {
+            'stage': self.stage,
+            'rows_done': self.rows_done,
+            'rows_total': self.total_rows,
+            'progress': round(100 * self.rows_done / self.total_rows, 1) if self.total_rows else 100.0,
+            'rows_per_second': round(rate),
+            'eta_seconds': round(remaining / rate, 1) if rate > 0 else None,
+        }
@@ -0,0 +1,37 @@
+"""
+Схемы колонок генерируемых таблиц.
+Компактные типы: UInt8 для возраста, Float32 для показателей,
+Enum для категорий, Date для дат визитов, 16 байт для UUID.
+"""
+import polars as pl
+
+GENDERS = ['Male', 'Female']
+DIAGNOSES = ['Flu', 'Cold', 'Pneumonia', 'Bronchitis', 'Allergy', 'Hypertension', 'Arthritis', 'Diabetes']
+
+GENDER_ENUM = pl.Enum(GENDERS)
+DIAGNOSIS_ENUM = pl.Enum(DIAGNOSES)
+
+# UUID в бинарном виде, текст только при экспорте
+UUID_DTYPE = pl.Array(pl.UInt8, 16)
+
+PATIENT_SCHEMA = {
+    'id': UUID_DTYPE,
+    'first_name': pl.String,
+    'last_name': pl.String,
+    'age': pl.UInt8,
+    'gender': GENDER_ENUM,
+    'height': pl.Float32,
+    'weight': pl.Float32,
+    'diabetes': pl.Boolean,
+    'bmi': pl.Float32,
+    'hypertension': pl.Boolean,
+}
+
+VISIT_SCHEMA = {
+    'id': UUID_DTYPE,
+    'patient_index': pl.UInt32,
+    'date': pl.Date,
+    'diagnosis': DIAGNOSIS_ENUM,
+    'cost': pl.Float64,
+    'follow_up': pl.Boolean,
+}
@@ -0,0 +1,160 @@
+"""
+Агрегаты для /api/v1/stats и /api/v1/admin/stats.
+Счетчики обновляются на событиях (создание и завершение задачи, регистрация,
+подтверждение email, запуск генерации), эндпоинты отдают готовый снимок
+без обхода задач и пользователей. Периодическая сверка с хранилищем
+исправляет расхождения (удаления, несколько воркеров, перезапуск).
+"""
+import os
+import copy
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, Iterable, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+STATS_RECONCILE_INTERVAL = float(os.getenv('STATS_RECONCILE_INTERVAL', '300'))
+
+FINAL_STATUSES = ('completed', 'failed')
+
+
+def job_totals(jobs: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Итоги по задачам в том же виде, что JobStore.totals() - для хранилища-словаря"""
+    totals = {'jobs': 0, 'completed': 0, 'failed': 0, 'patients': 0, 'visits': 0}
+    for job in jobs:
+        totals['jobs'] += 1
+        status = job.get('status')
+        if status == 'failed':
+            totals['failed'] += 1
+        elif status == 'completed':
+            totals['completed'] += 1
+            totals['patients'] += job.get('patients') or 0
+            totals['visits'] += job.get('visits') or 0
+    return totals
+
+
+class StatsAggregator:
+    """Счетчики задач и пользователей; snapshot() не зависит от числа задач и пользователей"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = self._empty_jobs()
+        self._users = self._empty_users()
+
+    @staticmethod
+    def _empty_jobs() -> Dict[str, int]:
+        return {'jobs': 0, 'processing': 0, 'completed': 0, 'failed': 0, 'patients': 0, 'visits': 0}
+
+    @staticmethod
+    def _empty_users() -> Dict[str, Any]:
+        return {
+            'total_users': 0,
+            'verified_users': 0,
+            'developer_count': 0,
+            'total_generations': 0,
+            'total_records': 0,
+            'total_patients': 0,
+            'total_visits': 0,
+            'industry_distribution': {},
+        }
+
+    # ---- задачи ----
+
+    def job_created(self, job: Dict[str, Any]):
+        with self._lock:
+            self._jobs['jobs'] += 1
+            self._jobs['processing'] += 1
+
+    def job_finished(self, job: Dict[str, Any]):
+        """Переход processing -> completed / failed"""
+        status = job.get('status')
+        if status not in FINAL_STATUSES:
+            return
+        with self._lock:
+            self._jobs['processing'] = max(self._jobs['processing'] - 1, 0)
+            self._jobs[status] += 1
+            if status == 'completed':
+                self._jobs['patients'] += job.get('patients') or 0
+                self._jobs['visits'] += job.get('visits') or 0
+
+    def job_deleted(self, job: Dict[str, Any]):
+        status = job.get('status')
+        with self._lock:
+            self._jobs['jobs'] = max(self._jobs['jobs'] - 1, 0)
+            key = status if status in FINAL_STATUSES else 'processing'
+            self._jobs[key] = max(self._jobs[key] - 1, 0)
+            if status == 'completed':
+                self._jobs['patients'] -= job.get('patients') or 0
+                self._jobs['visits'] -= job.get('visits') or 0
+
+    def jobs_cleared(self):
+        with self._lock:
+            self._jobs = self._empty_jobs()
+
+    def reconcile_jobs(self, totals: Dict[str, int]):
+        """Сверка с итогами хранилища (JobStore.totals() или job_totals())"""
+        jobs = self._empty_jobs()
+        jobs.update(totals)
+        jobs['processing'] = max(jobs['jobs'] - jobs['completed'] - jobs['failed'], 0)
+        with self._lock:
+            self._jobs = jobs
+
+    # ---- пользователи ----
+
+    def user_registered(self, user):
+        with self._lock:
+            self._add_user(self._users, user)
+
+    def user_verified(self, user):
+        with self._lock:
+            self._users['verified_users'] += 1
+
+    def generation_started(self, user, patients: int = 0, visits: int = 0, records: int = None):
+        """Учет генерации в статистике пользователя; records по умолчанию - patients + visits"""
+        with self._lock:
+            self._users['total_generations'] += 1
+            self._users['total_records'] += records if records is not None else patients + visits
+            self._users['total_patients'] += patients
+            self._users['total_visits'] += visits
+            industry = self._users['industry_distribution'].get(getattr(user, 'industry', None))
+            if industry is not None:
+                industry['generations'] += 1
+
+    def reconcile_users(self, users: Iterable):
+        users_stats = self._empty_users()
+        for user in users:
+            self._add_user(users_stats, user)
+        with self._lock:
+            self._users = users_stats
+
+    @staticmethod
+    def _add_user(users_stats: Dict[str, Any], user):
+        generations = getattr(user, 'total_generations', 0) or 0
+        users_stats['total_users'] += 1
+        users_stats['verified_users'] += int(bool(user.is_verified))
+        users_stats['developer_count'] += int(bool(user.is_developer))
+        users_stats['total_generations'] += generations
+        users_stats['total_records'] += getattr(user, 'total_records_generated', 0) or 0
+        users_stats['total_patients'] += getattr(user, 'total_patients_generated', 0) or 0
+        users_stats['total_visits'] += getattr(user, 'total_visits_generated', 0) or 0
+
+        industry = getattr(user, 'industry', None)
+        if industry is not None:
+            entry = users_stats['industry_distribution'].setdefault(industry, {'count': 0, 'generations': 0})
+            entry['count'] += 1
+            entry['generations'] += generations
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'jobs': dict(self._jobs), 'users': copy.deepcopy(self._users)}
+
+
+async def reconcile_periodically(reconcile: Callable[[], Awaitable[None]], interval: float = STATS_RECONCILE_INTERVAL):
+    """Фоновая сверка счетчиков; запускается из события startup"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile()
+        except Exception as e:
+            logger.warning(f"Ошибка сверки статистики: {e}")
@@ -13,7 +13,7 @@ import uuid
 from datetime import datetime
 import asyncio
 
-from app.core.batch_generator import BatchGenerator
+from app.core.job_runner import JobRunner, generate_dataset_job, job_progress
 
 # ============ ИНИЦИАЛИЗАЦИЯ APP ============
 app = FastAPI(
@@ -43,7 +43,15 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Хранилище задач
 jobs_db = {}
-generator = BatchGenerator(batch_size=10000)
+job_runner = JobRunner()
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    job_runner.shutdown()
 
 # ============ ФУНКЦИЯ ДЛЯ ЧТЕНИЯ HTML ============
 def read_html(filename):
@@ -874,9 +882,7 @@ async def generate_medical(patients: int = 10000, visits: int = 50000, seed: int
 
 async def run_generation(job_id, patients, visits, seed):
     try:
-        jobs_db[job_id]["progress"] = 30
-        generator.set_seed(seed)
-        dataset = generator.generate_full_medical_dataset(patients, visits)
+        await job_runner.run(generate_dataset_job, patients, visits, seed, on_progress=job_progress(jobs_db[job_id]))
         jobs_db[job_id]["progress"] = 100
         jobs_db[job_id]["status"] = "completed"
         jobs_db[job_id]["completed_at"] = datetime.now().isoformat()
@@ -2,9 +2,6 @@
 import sys
 import os
 import socket
-import io
-import csv
-import pandas as pd
 from datetime import datetime
 
 # Устанавливаем кодировку UTF-8 для вывода
@@ -13,8 +10,8 @@ if hasattr(sys.stdout, 'reconfigure'):
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, Request, Response
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
@@ -22,7 +19,13 @@ import json
 import uuid
 import asyncio
 
-from app.core.batch_generator import BatchGenerator
+from app.core.job_runner import JobRunner, generate_dataset_cached, job_progress
+from app.core.dataset_cache import DatasetCache
+from app.core.export import (
+    TABLES, SQL_MODES, FORMAT_ALIASES, load_dataset,
+    iter_json, iter_ndjson, iter_csv, iter_sql, write_parquet, write_ipc,
+)
+from app.api.downloads import file_download, stream_download, cached_export, cached_stream
 
 # Функция для поиска свободного порта
 def find_free_port(start_port=8000, max_port=8010):
@@ -64,7 +67,16 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Хранилище задач
 jobs_db = {}
-generator = BatchGenerator(batch_size=10000)
+job_runner = JobRunner()
+dataset_cache = DatasetCache()
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    job_runner.shutdown()
 
 # ============ ФУНКЦИЯ ДЛЯ ЧТЕНИЯ HTML ============
 def read_html(filename):
@@ -623,92 +635,68 @@ async def get_financial_analytics():
     }
 
 # 📋 ФИЧА 6: Экспорт в разные форматы
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "sql": "application/sql",
+    "parquet": "application/vnd.apache.parquet",
+    "ipc": "application/vnd.apache.arrow.file",
+}
+
 @app.get("/api/v1/export/{job_id}/{format}")
-async def export_dataset(job_id: str, format: str):
-    """Экспорт датасета в различные форматы"""
-    
+def export_job_dataset(request: Request, job_id: str, format: str, table: str = "patients", sql_mode: str = "insert"):
+    """
+    Выгрузка датасета задачи: json, ndjson, csv, sql, parquet, ipc (feather).
+    json/ndjson/csv/sql формируются по срезам и отдаются потоком, parquet/ipc - файлом.
+    table - таблица для табличных форматов (patients / visits), sql_mode - insert или copy.
+    Поддерживается Range для докачки.
+    """
     if job_id not in jobs_db:
         return JSONResponse(status_code=404, content={"error": "Job not found"})
     
     job = jobs_db[job_id]
+    if job["status"] != "completed" or not job.get("dataset_path"):
+        return JSONResponse(status_code=409, content={"error": "Dataset is not ready"})
     
-    # Создаем тестовые данные для экспорта
-    patients_data = [
-        {"id": "1", "age": 45, "gender": "Male", "diabetes": True, "bmi": 32.1, "visit_count": 3},
-        {"id": "2", "age": 52, "gender": "Female", "diabetes": False, "bmi": 25.9, "visit_count": 5},
-        {"id": "3", "age": 34, "gender": "Male", "diabetes": False, "bmi": 23.4, "visit_count": 2},
-        {"id": "4", "age": 67, "gender": "Female", "diabetes": True, "bmi": 33.2, "visit_count": 7},
-        {"id": "5", "age": 28, "gender": "Male", "diabetes": False, "bmi": 24.1, "visit_count": 1},
-    ]
-    
-    filename = f"digital_twin_export_{job_id[:8]}_{datetime.now().strftime('%Y%m%d')}"
-    
-    if format == "json":
-        return JSONResponse(
-            content={"job": job, "data": patients_data, "exported_at": datetime.now().isoformat()},
-            headers={"Content-Disposition": f'attachment; filename="{filename}.json"'}
-        )
-    
-    elif format == "csv":
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=patients_data[0].keys())
-        writer.writeheader()
-        writer.writerows(patients_data)
-        
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'}
-        )
-    
-    elif format == "excel":
-        df = pd.DataFrame(patients_data)
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Patients', index=False)
-        output.seek(0)
-        
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f'attachment; filename="{filename}.xlsx"'}
-        )
+    fmt = FORMAT_ALIASES.get(format.lower(), format.lower())
+    if fmt not in EXPORT_MEDIA_TYPES:
+        return JSONResponse(status_code=400, content={"error": "Unsupported format", "formats": list(EXPORT_MEDIA_TYPES)})
+    if table not in TABLES:
+        return JSONResponse(status_code=400, content={"error": "Unknown table", "tables": list(TABLES)})
+    if sql_mode not in SQL_MODES:
+        return JSONResponse(status_code=400, content={"error": "Unknown SQL mode", "modes": list(SQL_MODES)})
     
-    elif format == "parquet":
-        df = pd.DataFrame(patients_data)
-        output = io.BytesIO()
-        df.to_parquet(output, index=False)
-        output.seek(0)
-        
-        return StreamingResponse(
-            output,
-            media_type="application/parquet",
-            headers={"Content-Disposition": f'attachment; filename="{filename}.parquet"'}
-        )
+    dataset = load_dataset(job["dataset_path"])
+    media_type = EXPORT_MEDIA_TYPES[fmt]
+    filename = f"digital_twin_export_{job_id[:8]}"
     
-    elif format == "sql":
-        sql = f"-- Digital Twin Factory Export\n-- Job ID: {job_id}\n-- Exported: {datetime.now().isoformat()}\n\n"
-        sql += "CREATE TABLE IF NOT EXISTS patients (\n"
-        sql += "    id VARCHAR(36) PRIMARY KEY,\n"
-        sql += "    age INTEGER,\n"
-        sql += "    gender VARCHAR(10),\n"
-        sql += "    diabetes BOOLEAN,\n"
-        sql += "    bmi FLOAT,\n"
-        sql += "    visit_count INTEGER\n"
-        sql += ");\n\n"
-        
-        for p in patients_data:
-            sql += f"INSERT INTO patients (id, age, gender, diabetes, bmi, visit_count) VALUES "
-            sql += f"('{p['id']}', {p['age']}, '{p['gender']}', {p['diabetes']}, {p['bmi']}, {p['visit_count']});\n"
-        
-        return Response(
-            content=sql,
-            media_type="text/plain",
-            headers={"Content-Disposition": f'attachment; filename="{filename}.sql"'}
-        )
+    # Колоночные форматы нельзя отдавать по мере записи - строим файл один раз
+    if fmt == "parquet":
+        path = cached_export(job_id, f"{table}.parquet", lambda p: write_parquet(dataset, table, p))
+        return file_download(request, path, media_type, f"{filename}_{table}.parquet")
+    if fmt == "ipc":
+        path = cached_export(job_id, f"{table}.arrow", lambda p: write_ipc(dataset, table, p))
+        return file_download(request, path, media_type, f"{filename}_{table}.arrow")
     
+    if fmt == "json":
+        name = f"{filename}.json"
+        chunks = lambda: iter_json(dataset, {"job": job})
+    elif fmt == "sql":
+        name = f"{filename}_{sql_mode}.sql"
+        chunks = lambda: iter_sql(dataset, sql_mode)
+    elif fmt == "ndjson":
+        name = f"{filename}_{table}.ndjson"
+        chunks = lambda: iter_ndjson(dataset, table)
     else:
-        return JSONResponse(status_code=400, content={"error": "Unsupported format"})
+        name = f"{filename}_{table}.csv"
+        chunks = lambda: iter_csv(dataset, table)
+    
+    # Докачка: смещения должны указывать в одни и те же байты, поэтому отдаем из сохраненного файла
+    if "range" in request.headers:
+        path = cached_stream(job_id, name, chunks)
+        return file_download(request, path, media_type, name)
+    return stream_download(chunks(), media_type, name)
 
 # ============ ВЕБ-СТРАНИЦЫ ============
 
@@ -882,9 +870,6 @@ with open("app/templates/analytics_enhanced.html", "w", encoding="utf-8") as f:
                             <button class="export-btn" onclick="exportData('csv')">
                                 📊 CSV
                             </button>
-                            <button class="export-btn" onclick="exportData('excel')">
-                                📗 Excel
-                            </button>
                             <button class="export-btn" onclick="exportData('parquet')">
                                 📦 Parquet
                             </button>
@@ -900,7 +885,6 @@ with open("app/templates/analytics_enhanced.html", "w", encoding="utf-8") as f:
                             <ul style="list-style: none; padding: 0;">
                                 <li style="margin-bottom: 5px;">✓ JSON - универсальный формат</li>
                                 <li style="margin-bottom: 5px;">✓ CSV - для табличных процессоров</li>
-                                <li style="margin-bottom: 5px;">✓ Excel - Microsoft Excel</li>
                                 <li style="margin-bottom: 5px;">✓ Parquet - сжатый колоночный формат</li>
                                 <li style="margin-bottom: 5px;">✓ SQL - скрипт для базы данных</li>
                             </ul>
@@ -1190,12 +1174,21 @@ async def generate_medical(patients: int = 10000, visits: int = 50000, seed: int
 
 async def run_generation(job_id, patients, visits, seed):
     try:
-        jobs_db[job_id]["progress"] = 30
-        generator.set_seed(seed)
-        dataset = generator.generate_full_medical_dataset(patients, visits)
+        result = await generate_dataset_cached(
+            job_runner, dataset_cache, patients, visits, seed,
+            dataset_dir=os.path.join("data/generated", job_id),
+            on_progress=job_progress(jobs_db[job_id]),
+        )
+        jobs_db[job_id]["dataset_path"] = result["dataset_path"]
+        jobs_db[job_id]["cached"] = result["cached"]
         jobs_db[job_id]["progress"] = 100
         jobs_db[job_id]["status"] = "completed"
         jobs_db[job_id]["completed_at"] = datetime.now().isoformat()
+    except asyncio.CancelledError:
+        # Остановка приложения во время генерации: задача не остается processing
+        jobs_db[job_id]["status"] = "failed"
+        jobs_db[job_id]["error"] = "Генерация отменена"
+        raise
     except Exception as e:
         jobs_db[job_id]["status"] = "failed"
         jobs_db[job_id]["error"] = str(e)
@@ -1239,7 +1232,7 @@ if __name__ == "__main__":
         print("=" * 70)
         print("🎯 НОВЫЕ ФИЧИ:")
         print("  ✅ 1. Интерактивная визуализация корреляций")
-        print("  ✅ 6. Экспорт в CSV, Excel, Parquet, SQL")
+        print("  ✅ 6. Экспорт в CSV, Parquet, SQL")
         print("  ✅ 9. Финансовая аналитика")
         print("=" * 70)
         
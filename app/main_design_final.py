@@ -21,7 +21,6 @@ import json
 import uuid
 import asyncio
 
-from app.core.batch_generator import BatchGenerator
 
 # Функция для поиска свободного порта
 def find_free_port(start_port=8000, max_port=8010):
@@ -63,7 +62,6 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Хранилище задач
 jobs_db = {}
-generator = BatchGenerator(batch_size=10000)
 
 # ============ ФУНКЦИЯ ДЛЯ ЧТЕНИЯ HTML ============
 def read_html(filename):
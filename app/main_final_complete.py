@@ -14,7 +14,7 @@ if hasattr(sys.stdout, 'reconfigure'):
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, Request, Depends, HTTPException, status
+from fastapi import FastAPI, Request, Response, Depends, HTTPException, WebSocket, status
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
@@ -26,7 +26,10 @@ import jwt
 from app.auth import auth_handler
 from app.models.user import User, UserCreate, UserLogin, UserResponse, Token
 from app.models.tariffs import TARIFFS, get_tariff_limits, check_user_limits
-from app.core.batch_generator import BatchGenerator
+from app.core.job_runner import JobRunner, generate_dataset_job, job_progress
+from app.api.job_events import JobEventBus, job_event_stream, serve_job_socket
+from app.core.job_store import create_job_store, JobWriter
+from app.core.stats import StatsAggregator, reconcile_periodically
 from app.developer_account import create_developer_account, DEVELOPER_ACCOUNT
 
 # Функция поиска свободного порта
@@ -71,9 +74,46 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 users_db = {}  # username -> User
 email_db = {}  # email -> username
 tokens_db = {}  # token -> username
-jobs_db = {}  # job_id -> job
-
-generator = BatchGenerator(batch_size=10000)
+jobs_db = create_job_store()  # job_id -> job, SQLite / Postgres (JOB_STORE_URL)
+job_writer = JobWriter(jobs_db)
+
+job_runner = JobRunner()
+job_events = JobEventBus()
+stats = StatsAggregator()
+
+async def publish_job(job, create=False):
+    """
+    Сохранение задачи в хранилище (в потоке) и рассылка подписчикам.
+    False - задачу удалили, запись не восстанавливается.
+    """
+    if not await job_writer.save(job, create):
+        return False
+    job_events.publish(job)
+    return True
+
+def publish_progress(job):
+    """Прогресс из обработчика в потоке loop: рассылка сразу, сохранение не чаще раза в секунду"""
+    job_writer.save_progress(job)
+    job_events.publish(job)
+
+async def reconcile_stats():
+    """Сверка счетчиков статистики с пользователями и хранилищем задач"""
+    stats.reconcile_users(list(users_db.values()))
+    stats.reconcile_jobs(await asyncio.to_thread(jobs_db.totals))
+
+@app.on_event("startup")
+async def start_job_runner():
+    # Задачи прошлого запуска, прерванные перезапуском, не останутся processing
+    interrupted = await asyncio.to_thread(jobs_db.fail_interrupted)
+    if interrupted:
+        print(f"Задач, прерванных перезапуском: {interrupted} (помечены failed)")
+    job_runner.start()
+    await reconcile_stats()
+    asyncio.create_task(reconcile_periodically(reconcile_stats))
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    job_runner.shutdown()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login", auto_error=False)
 
@@ -115,6 +155,7 @@ def create_user(user_data: UserCreate) -> User:
     users_db[user.username] = user
     email_db[user.email] = user.username
     tokens_db[verification_token] = user.username
+    stats.user_registered(user)
     
     # Отправляем письмо для подтверждения
     auth_handler.send_verification_email(user.email, verification_token, user.username)
@@ -177,6 +218,7 @@ async def login(user_data: UserLogin):
     
     if not user.is_verified and user.username != DEVELOPER_ACCOUNT["username"]:
         # Для обычных пользователей автоматически подтверждаем
+        stats.user_verified(user)
         user.is_verified = True
         user.is_active = True
     
@@ -205,6 +247,8 @@ async def verify_email(token: str):
     if not user:
         return HTMLResponse(content="<h1>User not found</h1>")
     
+    if not user.is_verified:
+        stats.user_verified(user)
     user.is_verified = True
     user.is_active = True
     
@@ -254,7 +298,7 @@ async def generate_medical(
     
     job_id = str(uuid.uuid4())
     
-    jobs_db[job_id] = {
+    job = {
         "job_id": job_id,
         "user_id": current_user.id,
         "username": current_user.username,
@@ -264,43 +308,67 @@ async def generate_medical(
         "seed": seed,
         "created_at": datetime.now().isoformat()
     }
+    await publish_job(job, create=True)
+    stats.job_created(job)
     
     # Обновляем статистику (для разработчика считаем, но не ограничиваем)
     current_user.total_generations += 1
     current_user.total_patients_generated += patients
     current_user.total_visits_generated += visits
+    stats.generation_started(current_user, patients, visits)
     if not current_user.is_developer:
         current_user.api_calls_remaining -= 1
     
-    asyncio.create_task(run_generation(job_id, patients, visits, seed))
+    asyncio.create_task(run_generation(job, patients, visits, seed))
     
     return {"success": True, "job_id": job_id}
 
-async def run_generation(job_id, patients, visits, seed):
-    """Фоновая генерация данных"""
+async def run_generation(job, patients, visits, seed):
+    """Фоновая генерация данных; изменения задачи сохраняются и рассылаются подписчикам job_events"""
     try:
-        generator.set_seed(seed)
-        dataset = generator.generate_full_medical_dataset(patients, visits)
-        jobs_db[job_id]["status"] = "completed"
-        jobs_db[job_id]["completed_at"] = datetime.now().isoformat()
+        await job_runner.run(
+            generate_dataset_job, patients, visits, seed,
+            on_progress=job_progress(job, publish_progress),
+        )
+        job["status"] = "completed"
+        job["completed_at"] = datetime.now().isoformat()
+    except asyncio.CancelledError:
+        # Остановка приложения во время генерации: задача завершается как failed, отмена идет дальше
+        job["status"] = "failed"
+        job["error"] = "Генерация отменена"
+        await finish_generation(job)
+        raise
     except Exception as e:
-        jobs_db[job_id]["status"] = "failed"
-        jobs_db[job_id]["error"] = str(e)
+        job["status"] = "failed"
+        job["error"] = str(e)
+    await finish_generation(job)
+
+async def finish_generation(job):
+    # Задачу могли удалить во время генерации - тогда она не восстанавливается и не учитывается
+    if await publish_job(job):
+        stats.job_finished(job)
+    job_writer.forget(job["job_id"])
 
 @app.get("/api/v1/jobs")
-async def list_jobs(current_user: User = Depends(get_current_user)):
-    """Список задач пользователя"""
+async def list_jobs(
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Список задач пользователя; следующая страница - по курсору из заголовка X-Next-Cursor"""
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     # Для разработчика показываем все задачи, для обычных пользователей - только свои
-    if current_user.is_developer:
-        user_jobs = list(jobs_db.values())
-    else:
-        user_jobs = [job for job in jobs_db.values() if job.get("user_id") == current_user.id]
-    
-    user_jobs.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    return user_jobs[:50]
+    user_id = None if current_user.is_developer else current_user.id
+    try:
+        user_jobs, next_cursor = await asyncio.to_thread(jobs_db.list, user_id, min(max(limit, 1), 200), cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return user_jobs
 
 @app.get("/api/v1/jobs/{job_id}")
 async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
@@ -308,7 +376,7 @@ async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    job = jobs_db.get(job_id)
+    job = await asyncio.to_thread(jobs_db.get, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
@@ -320,6 +388,35 @@ async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Access denied")
     return job
 
+@app.get("/api/v1/jobs/{job_id}/events")
+async def job_events_stream(job_id: str, token: Optional[str] = None, header_token: Optional[str] = Depends(oauth2_scheme)):
+    """
+    SSE-поток прогресса задачи вместо опроса /api/v1/jobs/{job_id}.
+    EventSource не передает заголовки, поэтому токен можно передать в ?token=
+    """
+    current_user = await get_current_user(header_token or token)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    job = await asyncio.to_thread(jobs_db.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not current_user.is_developer and job.get("user_id") != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return job_event_stream(job_events, job, reload=lambda: asyncio.to_thread(jobs_db.get, job_id))
+
+@app.websocket("/api/v1/jobs/ws")
+async def jobs_socket(websocket: WebSocket, token: Optional[str] = None):
+    """WebSocket со всеми задачами пользователя (для разработчика - всеми задачами)"""
+    current_user = await get_current_user(token)
+    if not current_user:
+        await websocket.close(code=4401)
+        return
+    
+    user_id = None if current_user.is_developer else current_user.id
+    user_jobs, _ = await asyncio.to_thread(jobs_db.list, user_id, 50)
+    await serve_job_socket(websocket, job_events, user_jobs, user_id)
+
 @app.get("/api/v1/stats")
 async def get_stats(current_user: User = Depends(get_current_user)):
     """Статистика пользователя"""
@@ -354,24 +451,20 @@ async def get_all_users(dev: User = Depends(get_current_developer)):
 
 @app.get("/api/v1/admin/stats")
 async def get_admin_stats(dev: User = Depends(get_current_developer)):
-    """Полная статистика системы (только для разработчика)"""
-    total_users = len(users_db)
-    verified_users = sum(1 for u in users_db.values() if u.is_verified)
-    developer_count = sum(1 for u in users_db.values() if u.is_developer)
-    total_generations = sum(u.total_generations for u in users_db.values())
-    total_patients = sum(u.total_patients_generated for u in users_db.values())
-    total_visits = sum(u.total_visits_generated for u in users_db.values())
+    """Полная статистика системы (только для разработчика): снимок счетчиков StatsAggregator"""
+    snapshot = stats.snapshot()
+    users, jobs = snapshot["users"], snapshot["jobs"]
     
     return {
-        "total_users": total_users,
-        "verified_users": verified_users,
-        "developer_count": developer_count,
-        "total_generations": total_generations,
-        "total_patients": total_patients,
-        "total_visits": total_visits,
-        "jobs_count": len(jobs_db),
-        "completed_jobs": sum(1 for j in jobs_db.values() if j.get("status") == "completed"),
-        "failed_jobs": sum(1 for j in jobs_db.values() if j.get("status") == "failed"),
+        "total_users": users["total_users"],
+        "verified_users": users["verified_users"],
+        "developer_count": users["developer_count"],
+        "total_generations": users["total_generations"],
+        "total_patients": users["total_patients"],
+        "total_visits": users["total_visits"],
+        "jobs_count": jobs["jobs"],
+        "completed_jobs": jobs["completed"],
+        "failed_jobs": jobs["failed"],
         "system_version": "3.0.0",
         "environment": "development"
     }
@@ -385,7 +478,7 @@ async def generate_unlimited(
     """Безлимитная генерация для разработчика"""
     job_id = str(uuid.uuid4())
     
-    jobs_db[job_id] = {
+    job = {
         "job_id": job_id,
         "user_id": dev.id,
         "username": dev.username,
@@ -395,16 +488,19 @@ async def generate_unlimited(
         "created_at": datetime.now().isoformat(),
         "unlimited": True
     }
+    await publish_job(job, create=True)
+    stats.job_created(job)
     
-    asyncio.create_task(run_generation(job_id, patients, visits, 42))
+    asyncio.create_task(run_generation(job, patients, visits, 42))
     
     return {"success": True, "job_id": job_id, "message": f"Generating {patients} patients and {visits} visits"}
 
 @app.delete("/api/v1/admin/jobs/all")
 async def delete_all_jobs(dev: User = Depends(get_current_developer)):
     """Удаление всех задач (только для разработчика)"""
-    global jobs_db
-    jobs_db = {}
+    await asyncio.to_thread(jobs_db.clear)
+    stats.jobs_cleared()
+    job_events.publish_cleared()
     return {"message": "All jobs deleted successfully"}
 
 # ============ ВЕБ-СТРАНИЦЫ ============
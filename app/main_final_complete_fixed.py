@@ -27,7 +27,6 @@ import jwt
 from app.auth import auth_handler
 from app.models.user import User, UserCreate, UserLogin, UserResponse, Token, INDUSTRIES, IndustryResponse
 from app.models.tariffs import TARIFFS, get_tariff_limits, check_user_limits
-from app.core.batch_generator import BatchGenerator
 from app.developer_account import create_developer_account, DEVELOPER_ACCOUNT
 
 # Функция поиска свободного порта
@@ -79,8 +78,6 @@ email_db = {}  # email -> username
 tokens_db = {}  # token -> username
 jobs_db = {}  # job_id -> job
 
-generator = BatchGenerator(batch_size=10000)
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login", auto_error=False)
 
 # Создаем аккаунт разработчика при запуске
@@ -326,7 +323,6 @@ async def generate_data(
 async def run_generation(job_id, records, seed, industry):
     """Фоновая генерация данных с учетом отрасли"""
     try:
-        generator.set_seed(seed)
         jobs_db[job_id]["status"] = "completed"
         jobs_db[job_id]["completed_at"] = datetime.now().isoformat()
     except Exception as e:
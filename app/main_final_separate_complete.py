@@ -27,7 +27,8 @@ import jwt
 from app.auth import auth_handler
 from app.models.user import User, UserCreate, UserLogin, UserResponse, Token, INDUSTRIES, IndustryResponse
 from app.models.tariffs import TARIFFS, get_tariff_limits, check_user_limits
-from app.core.batch_generator import BatchGenerator
+from app.core.job_runner import JobRunner, generate_dataset_job, job_progress
+from app.core.stats import StatsAggregator, job_totals, reconcile_periodically
 from app.developer_account import create_developer_account, DEVELOPER_ACCOUNT
 
 # Функция поиска свободного порта
@@ -78,7 +79,23 @@ email_db = {}  # email -> username
 tokens_db = {}  # token -> username
 jobs_db = {}  # job_id -> job
 
-generator = BatchGenerator(batch_size=10000)
+job_runner = JobRunner()
+stats = StatsAggregator()
+
+async def reconcile_stats():
+    """Сверка счетчиков статистики с пользователями и задачами"""
+    stats.reconcile_users(list(users_db.values()))
+    stats.reconcile_jobs(job_totals(list(jobs_db.values())))
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+    await reconcile_stats()
+    asyncio.create_task(reconcile_periodically(reconcile_stats))
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    job_runner.shutdown()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login", auto_error=False)
 
@@ -126,6 +143,7 @@ def create_user(user_data: UserCreate) -> User:
     users_db[user.username] = user
     email_db[user.email] = user.username
     tokens_db[verification_token] = user.username
+    stats.user_registered(user)
     
     # Отправляем письмо для подтверждения
     auth_handler.send_verification_email(
@@ -192,6 +210,7 @@ async def login(user_data: UserLogin):
     
     if not user.is_verified and user.username != DEVELOPER_ACCOUNT["username"]:
         # Для обычных пользователей автоматически подтверждаем
+        stats.user_verified(user)
         user.is_verified = True
         user.is_active = True
     
@@ -227,6 +246,8 @@ async def verify_email(token: str):
     if not user:
         return HTMLResponse(content="<h1>User not found</h1>")
     
+    if not user.is_verified:
+        stats.user_verified(user)
     user.is_verified = True
     user.is_active = True
     
@@ -404,6 +425,9 @@ async def generate_medical(
         if not can_proceed:
             raise HTTPException(status_code=403, detail=message)
     
+    if job_runner.is_full():
+        raise HTTPException(status_code=503, detail="Generation queue is full, try again later")
+    
     job_id = str(uuid.uuid4())
     
     jobs_db[job_id] = {
@@ -417,10 +441,12 @@ async def generate_medical(
         "seed": seed,
         "created_at": datetime.now().isoformat()
     }
+    stats.job_created(jobs_db[job_id])
     
     # Обновляем статистику (для разработчика считаем, но не ограничиваем)
     current_user.total_generations += 1
     current_user.total_records_generated += patients + visits
+    stats.generation_started(current_user, patients, visits)
     if not current_user.is_developer:
         current_user.api_calls_remaining -= 1
     
@@ -431,13 +457,13 @@ async def generate_medical(
 async def run_generation(job_id, patients, visits, seed):
     """Фоновая генерация данных"""
     try:
-        generator.set_seed(seed)
-        dataset = generator.generate_full_medical_dataset(patients, visits)
+        await job_runner.run(generate_dataset_job, patients, visits, seed, on_progress=job_progress(jobs_db[job_id]))
         jobs_db[job_id]["status"] = "completed"
         jobs_db[job_id]["completed_at"] = datetime.now().isoformat()
     except Exception as e:
         jobs_db[job_id]["status"] = "failed"
         jobs_db[job_id]["error"] = str(e)
+    stats.job_finished(jobs_db[job_id])
 
 @app.get("/api/v1/jobs")
 async def list_jobs(current_user: User = Depends(get_current_user)):
@@ -507,32 +533,20 @@ async def get_all_users(dev: User = Depends(get_current_developer)):
 
 @app.get("/api/v1/admin/stats")
 async def get_admin_stats(dev: User = Depends(get_current_developer)):
-    """Полная статистика системы (только для разработчика)"""
-    total_users = len(users_db)
-    verified_users = sum(1 for u in users_db.values() if u.is_verified)
-    developer_count = sum(1 for u in users_db.values() if u.is_developer)
-    total_generations = sum(u.total_generations for u in users_db.values())
-    total_records = sum(u.total_records_generated for u in users_db.values())
-    
-    # Статистика по отраслям
-    industry_stats = {}
-    for user in users_db.values():
-        ind = user.industry
-        if ind not in industry_stats:
-            industry_stats[ind] = {"count": 0, "generations": 0}
-        industry_stats[ind]["count"] += 1
-        industry_stats[ind]["generations"] += user.total_generations
+    """Полная статистика системы (только для разработчика): снимок счетчиков StatsAggregator"""
+    snapshot = stats.snapshot()
+    users, jobs = snapshot["users"], snapshot["jobs"]
     
     return {
-        "total_users": total_users,
-        "verified_users": verified_users,
-        "developer_count": developer_count,
-        "total_generations": total_generations,
-        "total_records": total_records,
-        "industry_distribution": industry_stats,
-        "jobs_count": len(jobs_db),
-        "completed_jobs": sum(1 for j in jobs_db.values() if j.get("status") == "completed"),
-        "failed_jobs": sum(1 for j in jobs_db.values() if j.get("status") == "failed"),
+        "total_users": users["total_users"],
+        "verified_users": users["verified_users"],
+        "developer_count": users["developer_count"],
+        "total_generations": users["total_generations"],
+        "total_records": users["total_records"],
+        "industry_distribution": users["industry_distribution"],
+        "jobs_count": jobs["jobs"],
+        "completed_jobs": jobs["completed"],
+        "failed_jobs": jobs["failed"],
         "system_version": "3.0.0",
         "environment": "development"
     }
@@ -544,6 +558,9 @@ async def generate_unlimited(
     dev: User = Depends(get_current_developer)
 ):
     """Безлимитная генерация для разработчика"""
+    if job_runner.is_full():
+        raise HTTPException(status_code=503, detail="Generation queue is full, try again later")
+    
     job_id = str(uuid.uuid4())
     
     jobs_db[job_id] = {
@@ -557,6 +574,7 @@ async def generate_unlimited(
         "created_at": datetime.now().isoformat(),
         "unlimited": True
     }
+    stats.job_created(jobs_db[job_id])
     
     asyncio.create_task(run_generation(job_id, patients, visits, 42))
     
@@ -567,6 +585,7 @@ async def delete_all_jobs(dev: User = Depends(get_current_developer)):
     """Удаление всех задач (только для разработчика)"""
     global jobs_db
     jobs_db = {}
+    stats.jobs_cleared()
     return {"message": "All jobs deleted successfully"}
 
 # ============ МИДЛВАР ДЛЯ КЭШИРОВАНИЯ ============
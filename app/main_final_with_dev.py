@@ -26,7 +26,7 @@ import jwt
 from app.auth import auth_handler
 from app.models.user import User, UserCreate, UserLogin, UserResponse, Token
 from app.models.tariffs import TARIFFS, get_tariff_limits, check_user_limits
-from app.core.batch_generator import BatchGenerator
+from app.core.job_runner import JobRunner, generate_dataset_job, job_progress
 from app.developer_account import create_developer_account, DEVELOPER_ACCOUNT
 
 # Функция поиска свободного порта
@@ -73,7 +73,15 @@ email_db = {}  # email -> username
 tokens_db = {}  # token -> username
 jobs_db = {}  # job_id -> job
 
-generator = BatchGenerator(batch_size=10000)
+job_runner = JobRunner()
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    job_runner.shutdown()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login", auto_error=False)
 
@@ -274,8 +282,7 @@ async def generate_medical(
 async def run_generation(job_id, patients, visits, seed):
     """Фоновая генерация данных"""
     try:
-        generator.set_seed(seed)
-        dataset = generator.generate_full_medical_dataset(patients, visits)
+        await job_runner.run(generate_dataset_job, patients, visits, seed, on_progress=job_progress(jobs_db[job_id]))
         jobs_db[job_id]["status"] = "completed"
         jobs_db[job_id]["completed_at"] = datetime.now().isoformat()
     except Exception as e:
@@ -5,8 +5,8 @@ import os
 # Добавляем корневую папку проекта в путь Python
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, Request, HTTPException, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
@@ -19,7 +19,13 @@ from typing import Optional
 import asyncio
 
 # Импортируем наш генератор
-from app.core.batch_generator import BatchGenerator
+from app.core.batch_generator import render_patients, render_visits
+from app.core.export import load_dataset
+from app.core.job_runner import JobRunner, generate_dataset_cached, job_progress
+from app.core.dataset_cache import DatasetCache
+from app.api.job_events import JobEventBus, job_event_stream, serve_job_socket
+from app.core.job_store import create_job_store, JobWriter
+from app.core.stats import StatsAggregator, reconcile_periodically
 
 app = FastAPI(
     title="Digital Twin Factory",
@@ -53,9 +59,46 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 # Шаблоны
 templates = Jinja2Templates(directory="app/templates")
 
-# Хранилище задач
-jobs_db = {}
-generator = BatchGenerator(batch_size=10000)
+# Хранилище задач: SQLite / Postgres (JOB_STORE_URL)
+jobs_db = create_job_store()
+job_writer = JobWriter(jobs_db)
+job_runner = JobRunner()
+dataset_cache = DatasetCache()
+job_events = JobEventBus()
+stats = StatsAggregator()
+
+async def publish_job(job, create=False):
+    """
+    Сохранение задачи в хранилище (в потоке) и рассылка подписчикам.
+    False - задачу удалили, запись не восстанавливается.
+    """
+    if not await job_writer.save(job, create):
+        return False
+    job_events.publish(job)
+    return True
+
+def publish_progress(job):
+    """Прогресс из обработчика в потоке loop: рассылка сразу, сохранение не чаще раза в секунду"""
+    job_writer.save_progress(job)
+    job_events.publish(job)
+
+async def reconcile_stats():
+    """Сверка счетчиков статистики с хранилищем задач"""
+    stats.reconcile_jobs(await asyncio.to_thread(jobs_db.totals))
+
+@app.on_event("startup")
+async def start_job_runner():
+    # Задачи прошлого запуска, прерванные перезапуском, не останутся processing
+    interrupted = await asyncio.to_thread(jobs_db.fail_interrupted)
+    if interrupted:
+        print(f"Задач, прерванных перезапуском: {interrupted} (помечены failed)")
+    job_runner.start()
+    await reconcile_stats()
+    asyncio.create_task(reconcile_periodically(reconcile_stats))
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    job_runner.shutdown()
 
 # Веб-страницы
 @app.get("/", response_class=HTMLResponse)
@@ -163,7 +206,7 @@ async def generate_medical(
     job_id = str(uuid.uuid4())
     
     # Сохраняем задачу
-    jobs_db[job_id] = {
+    job = {
         "job_id": job_id,
         "status": "processing",
         "patients": patients,
@@ -174,8 +217,11 @@ async def generate_medical(
         "message": "Задача создана"
     }
     
+    await publish_job(job, create=True)
+    stats.job_created(job)
+    
     # Запускаем генерацию в фоне
-    asyncio.create_task(run_generation(job_id, patients, visits, seed))
+    asyncio.create_task(run_generation(job, patients, visits, seed))
     
     return {
         "success": True,
@@ -183,93 +229,142 @@ async def generate_medical(
         "message": f"Генерация {patients} пациентов и {visits} визитов запущена"
     }
 
-async def run_generation(job_id: str, patients: int, visits: int, seed: int):
+def write_dataset_preview(job_id: str, dataset_path: str, filepath: str):
+    """JSON с первыми записями датасета: 100 пациентов и 200 визитов для примера"""
+    dataset = load_dataset(dataset_path)
+    total_patients = len(dataset['patients'])
+    total_visits = len(dataset['visits'])
+    # Рендерятся только строки примера; визитам нужны лишь бинарные id их пациентов
+    patients_df, visits_df = dataset['patients'], dataset['visits'].head(200)
+    patients_list = render_patients(patients_df.head(100)).to_dicts()
+    visits_list = render_visits(visits_df, patients_df['id'].gather(visits_df['patient_index'])).to_dicts()
+    
+    # Конвертируем даты в строки
+    for visit in visits_list:
+        if 'date' in visit and visit['date']:
+            if hasattr(visit['date'], 'isoformat'):
+                visit['date'] = visit['date'].isoformat()
+            else:
+                visit['date'] = str(visit['date'])
+    
+    output = {
+        'generated_at': datetime.now().isoformat(),
+        'job_id': job_id,
+        'total_patients': total_patients,
+        'total_visits': total_visits,
+        'patients': patients_list,
+        'visits': visits_list
+    }
+    
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+
+async def finish_cancelled(job: dict):
+    job["status"] = "failed"
+    job["error"] = job["message"] = "Генерация отменена"
+    job["completed_at"] = datetime.now().isoformat()
+    if await publish_job(job):
+        stats.job_finished(job)
+
+async def run_generation(job: dict, patients: int, visits: int, seed: int):
     """Фоновая генерация данных"""
+    job_id = job["job_id"]
     try:
-        jobs_db[job_id]["progress"] = 10
-        jobs_db[job_id]["message"] = "Инициализация генератора..."
-        
-        generator.set_seed(seed)
-        
-        jobs_db[job_id]["progress"] = 30
-        jobs_db[job_id]["message"] = "Генерация пациентов..."
+        job["message"] = "Генерация пациентов и визитов..."
         
-        dataset = generator.generate_full_medical_dataset(patients, visits)
+        # Генерация в пуле процессов или готовый датасет из кэша, датасет сохраняется на диск
+        result = await generate_dataset_cached(
+            job_runner, dataset_cache, patients, visits, seed,
+            dataset_dir=os.path.join("data/generated", job_id),
+            on_progress=job_progress(job, publish_progress),
+        )
+        job["cached"] = result["cached"]
+        job["statistics"] = result.get("statistics")
         
-        jobs_db[job_id]["progress"] = 70
-        jobs_db[job_id]["message"] = "Генерация визитов..."
+        job["message"] = "Сохранение результатов..."
+        if not await publish_job(job):
+            return
         
-        # Сохраняем результат
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"medical_dataset_{timestamp}.json"
-        filepath = os.path.join("data/generated", filename)
-        
-        # Конвертируем datetime в строки
-        patients_list = dataset['patients'].to_dicts()
-        visits_list = dataset['visits'].to_dicts()
-        
-        for visit in visits_list:
-            if 'date' in visit and visit['date']:
-                if hasattr(visit['date'], 'isoformat'):
-                    visit['date'] = visit['date'].isoformat()
-                else:
-                    visit['date'] = str(visit['date'])
-        
-        # Сохраняем в JSON
-        output = {
-            'generated_at': datetime.now().isoformat(),
-            'job_id': job_id,
-            'total_patients': len(patients_list),
-            'total_visits': len(visits_list),
-            'patients': patients_list[:100],  # Сохраняем только первые 100 для примера
-            'visits': visits_list[:200]       # Сохраняем только первые 200 для примера
-        }
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
+        await asyncio.to_thread(
+            write_dataset_preview, job_id, result["dataset_path"], os.path.join("data/generated", filename)
+        )
         
-        jobs_db[job_id]["progress"] = 100
-        jobs_db[job_id]["status"] = "completed"
-        jobs_db[job_id]["completed_at"] = datetime.now().isoformat()
-        jobs_db[job_id]["result_url"] = f"/api/v1/datasets/{job_id}"
-        jobs_db[job_id]["file"] = filename
-        jobs_db[job_id]["message"] = "Готово!"
+        job["progress"] = 100
+        job["status"] = "completed"
+        job["completed_at"] = datetime.now().isoformat()
+        job["result_url"] = f"/api/v1/datasets/{job_id}"
+        job["file"] = filename
+        job["message"] = "Готово!"
+        if await publish_job(job):
+            stats.job_finished(job)
         
+    except asyncio.CancelledError:
+        # Остановка приложения во время генерации: задача завершается как failed, отмена идет дальше
+        await finish_cancelled(job)
+        raise
     except Exception as e:
-        jobs_db[job_id]["status"] = "failed"
-        jobs_db[job_id]["error"] = str(e)
-        jobs_db[job_id]["completed_at"] = datetime.now().isoformat()
-        jobs_db[job_id]["message"] = f"Ошибка: {str(e)}"
+        job["status"] = "failed"
+        job["error"] = str(e)
+        job["completed_at"] = datetime.now().isoformat()
+        job["message"] = f"Ошибка: {str(e)}"
+        if await publish_job(job):
+            stats.job_finished(job)
         print(f"Error in generation {job_id}: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        job_writer.forget(job_id)
 
 @app.get("/api/v1/jobs")
-async def list_jobs():
-    """Список задач"""
-    jobs_list = list(jobs_db.values())
-    jobs_list.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    return jobs_list[:50]
+async def list_jobs(response: Response, limit: int = 50, cursor: Optional[str] = None):
+    """Список задач; следующая страница - по курсору из заголовка X-Next-Cursor"""
+    try:
+        jobs_list, next_cursor = await asyncio.to_thread(jobs_db.list, limit=min(max(limit, 1), 200), cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return jobs_list
 
 @app.get("/api/v1/jobs/{job_id}")
 async def get_job(job_id: str):
     """Детали задачи"""
-    if job_id not in jobs_db:
+    job = await asyncio.to_thread(jobs_db.get, job_id)
+    if not job:
         raise HTTPException(status_code=404, detail="Job not found")
-    return jobs_db[job_id]
+    return job
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def job_events_stream(job_id: str):
+    """SSE-поток прогресса задачи вместо опроса /api/v1/jobs/{job_id}"""
+    job = await asyncio.to_thread(jobs_db.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_event_stream(job_events, job, reload=lambda: asyncio.to_thread(jobs_db.get, job_id))
+
+@app.websocket("/api/v1/jobs/ws")
+async def jobs_socket(websocket: WebSocket):
+    """WebSocket: последние 50 задач, затем их обновления"""
+    jobs_list, _ = await asyncio.to_thread(jobs_db.list, limit=50)
+    await serve_job_socket(websocket, job_events, jobs_list)
 
 @app.delete("/api/v1/jobs/{job_id}")
 async def delete_job(job_id: str):
     """Удаление задачи"""
-    if job_id in jobs_db:
-        del jobs_db[job_id]
+    job = await asyncio.to_thread(jobs_db.get, job_id)
+    if job:
+        await asyncio.to_thread(jobs_db.delete, job_id)
+        stats.job_deleted(job)
+        job_events.publish_deleted(job_id, job.get("user_id"))
     return {"success": True}
 
 @app.get("/api/v1/tasks/{task_id}")
 async def get_task_status(task_id: str):
     """Статус задачи для совместимости"""
-    if task_id in jobs_db:
-        job = jobs_db[task_id]
+    job = await asyncio.to_thread(jobs_db.get, task_id)
+    if job:
         return {
             "state": "SUCCESS" if job["status"] == "completed" else 
                     "FAILURE" if job["status"] == "failed" else
@@ -284,25 +379,23 @@ async def get_task_status(task_id: str):
 @app.get("/api/v1/stats")
 async def get_stats():
     """Статистика"""
-    completed = [j for j in jobs_db.values() if j["status"] == "completed"]
-    total_patients = sum(j.get("patients", 0) for j in completed)
-    total_visits = sum(j.get("visits", 0) for j in completed)
+    totals = stats.snapshot()["jobs"]
     
     return {
-        "total_generations": len(jobs_db),
-        "successful_jobs": len(completed),
-        "total_patients": total_patients,
-        "total_visits": total_visits,
-        "success_rate": f"{(len(completed)/len(jobs_db)*100 if jobs_db else 0):.1f}%"
+        "total_generations": totals["jobs"],
+        "successful_jobs": totals["completed"],
+        "total_patients": totals["patients"],
+        "total_visits": totals["visits"],
+        "success_rate": f"{(totals['completed']/totals['jobs']*100 if totals['jobs'] else 0):.1f}%"
     }
 
 @app.get("/api/v1/datasets/{job_id}")
 async def download_dataset(job_id: str):
     """Скачать датасет"""
-    if job_id not in jobs_db:
+    job = await asyncio.to_thread(jobs_db.get, job_id)
+    if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job = jobs_db[job_id]
     if "file" not in job:
         raise HTTPException(status_code=404, detail="File not found")
     
@@ -1,16 +1,21 @@
-from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi import FastAPI, Request, BackgroundTasks, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from celery.result import AsyncResult
 import uuid
-from
+import asyncio
 from datetime import datetime
+from typing import Optional
 import os
 
 from app.workers.celery_app import celery_app
-from app.workers.tasks import generate_medical_dataset
-from app.core.batch_generator import BatchGenerator
+from app.workers.tasks import dispatch_generation
+from app.core.export import resolve_format
+from app.workers.task_status import TaskStatusCache
+from app.workers.artifacts import read_artifact
+from app.core.preview_stats import expected_statistics
+from app.core.stats import StatsAggregator
 
 app = FastAPI(
     title="Digital Twin Factory",
@@ -36,6 +41,30 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Хранилище заданий
 jobs = {}
+stats = StatsAggregator()
+
+
+def on_task_ready(task_id: str, state: str):
+    """Итог задачи из события воркера или backend - учет в статистике один раз"""
+    job = jobs.get(task_id)
+    if job is None or job.get('finished_at'):
+        return
+    job['finished_at'] = datetime.now().isoformat()
+    stats.job_finished({**job, 'status': 'completed' if state == 'SUCCESS' else 'failed'})
+
+
+task_statuses = TaskStatusCache(celery_app, on_ready=on_task_ready)
+
+
+@app.on_event("startup")
+async def startup():
+    task_statuses.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    task_statuses.shutdown()
+
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -67,12 +96,25 @@ async def health():
 async def generate_medical(
     patients: int = 10000,
     visits: int = 50000,
-    seed: int = 42
+    seed: int = 42,
+    export_format: str = 'json',
+    compression: Optional[str] = None,
+    row_group_size: Optional[int] = None,
 ):
-    """Запуск генерации медицинского датасета через Celery"""
-    
-    # Создаем задачу в Celery
-    task = generate_medical_dataset.delay(patients, visits, seed)
+    """
+    Запуск генерации медицинского датасета через Celery.
+    export_format: json, ndjson, parquet, ipc (feather), csv; compression и row_group_size -
+    параметры формата (см. app.core.export). Большие задачи в parquet выполняются
+    шардами на всех воркерах, слишком большие задачи в других форматах отклоняются.
+    """
+    
+    # Неизвестный формат или сжатие, слишком большая задача без шардов - 400 сразу, а не упавшая задача
+    try:
+        export_format, compression = resolve_format(export_format, compression)
+        # Создаем задачу в Celery
+        task = dispatch_generation(patients, visits, seed, export_format, compression, row_group_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     job_id = task.id
     
@@ -83,17 +125,15 @@ async def generate_medical(
         "patients": patients,
         "visits": visits,
         "seed": seed,
+        "format": export_format,
+        "compression": compression,
         "created_at": datetime.now().isoformat()
     }
+    stats.job_created(jobs[job_id])
+    task_statuses.track(job_id)
     
-    # Быстрая статистика для предпросмотра
-    generator = BatchGenerator(batch_size=1000)
-    generator.set_seed(seed)
-    patients_sample = generator.generate_patients(10)
-    visits_sample = generator.generate_visits(patients_sample, 20)
-    
-    diabetic_bmi = patients_sample.filter(pl.col('diabetes') == True)['bmi'].mean() or 0
-    non_diabetic_bmi = patients_sample.filter(pl.col('diabetes') == False)['bmi'].mean() or 0
+    # Ожидаемая статистика для предпросмотра: аналитически, без генерации выборки
+    preview = expected_statistics()
     
     return {
         "success": True,
@@ -102,14 +142,10 @@ async def generate_medical(
         "statistics": {
             "patients": patients,
             "visits": visits,
-            "diabetes_rate": f"{patients_sample['diabetes'].mean():.1%}",
-            "average_bmi": round(patients_sample['bmi'].mean(), 1),
-            "average_visit_cost": f"${round(visits_sample['cost'].mean(), 2)}",
-            "bmi_correlation": {
-                "diabetic": round(diabetic_bmi, 1),
-                "non_diabetic": round(non_diabetic_bmi, 1),
-                "difference": round(diabetic_bmi - non_diabetic_bmi, 1)
-            }
+            "diabetes_rate": f"{preview['diabetes_rate']:.1%}",
+            "average_bmi": round(preview['avg_bmi'], 1),
+            "average_visit_cost": f"${round(preview['avg_cost'], 2)}",
+            "bmi_correlation": preview['bmi_correlation']
         }
     }
 
@@ -150,51 +186,58 @@ async def get_task_status(task_id: str):
     
     return response
 
+@app.get("/api/v1/tasks/{task_id}/statistics")
+async def get_task_statistics(task_id: str):
+    """Полная статистика и примеры строк из сопроводительного файла датасета"""
+    task = AsyncResult(task_id, app=celery_app)
+    if task.state != 'SUCCESS':
+        raise HTTPException(status_code=409, detail=f"Задача не завершена: {task.state}")
+    
+    artifact = (task.result or {}).get('artifact')
+    if not artifact:
+        raise HTTPException(status_code=404, detail="Статистика задачи не найдена")
+    try:
+        return await asyncio.to_thread(read_artifact, artifact)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Файл статистики удален")
+
 @app.get("/api/v1/jobs")
 async def list_jobs():
     """Список последних заданий"""
     # Получаем последние 10 заданий
     recent_jobs = list(jobs.values())[-10:]
     
-    # Добавляем статусы из Celery
+    # Статусы из карты событий; незавершенные - одним MGET к backend
+    states = await asyncio.to_thread(task_statuses.states, [job['task_id'] for job in recent_jobs])
     for job in recent_jobs:
-        task = AsyncResult(job['task_id'], app=celery_app)
-        job['status'] = task.state.lower()
+        job['status'] = states[job['task_id']].lower()
+        if job['status'] == 'success':
+            job['progress'] = 100
+        elif job['status'] == 'progress':
+            # Прогресс задачи или сумма готовых шардов (report_shard_progress)
+            info = (task_statuses.get(job['task_id']) or {}).get('info')
+            job['progress'] = info.get('progress', 0) if isinstance(info, dict) else 0
     
     return recent_jobs[::-1]  # Переворачиваем для отображения последних первыми
 
 @app.get("/api/v1/stats")
 async def get_stats():
-    """Общая статистика"""
-    total_jobs = len(jobs)
-    
-    # Считаем успешные
-    successful = 0
-    total_patients = 0
-    total_visits = 0
-    
-    for job_id in jobs:
-        task = AsyncResult(job_id, app=celery_app)
-        if task.state == 'SUCCESS':
-            successful += 1
-            if task.result:
-                total_patients += task.result.get('patients', 0)
-                total_visits += task.result.get('visits', 0)
+    """Общая статистика: счетчики обновляются по событиям задач, Redis не опрашивается"""
+    job_stats = stats.snapshot()['jobs']
     
     return {
-        "total_jobs": total_jobs,
-        "successful_jobs": successful,
-        "total_patients": total_patients,
-        "total_visits": total_visits,
+        "total_jobs": job_stats['jobs'],
+        "successful_jobs": job_stats['completed'],
+        "total_patients": job_stats['patients'],
+        "total_visits": job_stats['visits'],
         "redis_status": "active"
     }
 
 if __name__ == "__main__":
     import uvicorn
-    import pl
     
     print("=" * 70)
-print("DIGITAL TWIN FACTORY - FULL VERSION")
+    print("DIGITAL TWIN FACTORY - FULL VERSION")
     print("=" * 70)
     print("FastAPI сервер")
     print("PostgreSQL база данных")
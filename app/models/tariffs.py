@@ -15,7 +15,7 @@ class TariffPlan(BaseModel):
     is_popular: bool = False
     storage_gb: int
     support_level: str  # basic, priority, dedicated
-    export_formats: List[str]  # json, csv, excel, parquet, sql
+    export_formats: List[str]  # json, ndjson, csv, parquet, ipc, sql (app.core.export)
 
 # Предопределенные тарифы
 TARIFFS = {
@@ -52,7 +52,7 @@ TARIFFS = {
             "До 10,000 пациентов в месяц",
             "До 50,000 визитов в месяц",
             "Расширенные корреляции",
-            "Экспорт в JSON, CSV, Excel",
+            "Экспорт в JSON, NDJSON, CSV",
             "Приоритетная поддержка",
             "История генераций 30 дней"
         ],
@@ -60,7 +60,7 @@ TARIFFS = {
         is_popular=True,
         storage_gb=10,
         support_level="priority",
-        export_formats=["json", "csv", "excel"]
+        export_formats=["json", "ndjson", "csv"]
     ),
     "pro": TariffPlan(
         id="pro",
@@ -84,7 +84,7 @@ TARIFFS = {
         is_popular=False,
         storage_gb=100,
         support_level="dedicated",
-        export_formats=["json", "csv", "excel", "parquet", "sql"]
+        export_formats=["json", "ndjson", "csv", "parquet", "ipc", "sql"]
     ),
     "enterprise": TariffPlan(
         id="enterprise",
@@ -107,7 +107,7 @@ TARIFFS = {
         is_popular=False,
         storage_gb=1000,
         support_level="dedicated",
-        export_formats=["json", "csv", "excel", "parquet", "sql", "avro"]
+        export_formats=["json", "ndjson", "csv", "parquet", "ipc", "sql", "avro"]
     )
 }
 
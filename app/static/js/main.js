@@ -138,6 +138,8 @@ function updateJobsUI(jobs) {
     jobs.slice(0, 10).forEach(job => {
         const statusClass = getStatusClass(job.status);
         const statusIcon = getStatusIcon(job.status);
+        const inProgress = job.progress != null && !['completed', 'success', 'failed', 'failure'].includes(job.status);
+        const progressLabel = inProgress ? ` ${Math.round(job.progress)}%` : '';
         
         html += `
             <tr class="fade-in">
@@ -146,7 +148,7 @@ function updateJobsUI(jobs) {
                 <td>${job.visits || 0}</td>
                 <td>
                     <span class="badge ${statusClass}">
-                        ${statusIcon} ${job.status || 'pending'}
+                        ${statusIcon} ${job.status || 'pending'}${progressLabel}
                     </span>
                 </td>
                 <td>${job.created_at ? new Date(job.created_at).toLocaleString() : 'N/A'}</td>
@@ -204,13 +206,21 @@ async function handleGenerate(e) {
         const patients = formData.get('patients') || 10000;
         const visits = formData.get('visits') || 50000;
         const seed = formData.get('seed') || 42;
+        const params = new URLSearchParams({ patients, visits, seed });
+        // Формат и сжатие - если в форме есть такие поля (по умолчанию json)
+        for (const name of ['export_format', 'compression']) {
+            if (formData.get(name)) params.set(name, formData.get(name));
+        }
         
-        const response = await fetch(`/api/v1/generate/medical?patients=${patients}&visits=${visits}&seed=${seed}`, {
+        const response = await fetch(`/api/v1/generate/medical?${params}`, {
             method: 'POST'
         });
         
         const data = await response.json();
         
+        if (!response.ok) {
+            throw new Error(data.detail || 'Ошибка генерации');
+        }
         if (data.success) {
             appState.currentJob = data.job_id;
             showAlert(`✅ Генерация запущена! ID задачи: ${data.job_id.substring(0, 8)}...`, 'success');
@@ -234,8 +244,47 @@ async function handleGenerate(e) {
     }
 }
 
-// Отслеживание прогресса
-async function trackProgress(jobId) {
+// Отслеживание прогресса: SSE-поток задачи, при недоступности - опрос /api/v1/tasks
+function trackProgress(jobId) {
+    if (!window.EventSource) {
+        pollProgress(jobId);
+        return;
+    }
+    
+    const progressText = document.getElementById('progress-text');
+    const source = new EventSource(`/api/v1/jobs/${jobId}/events`);
+    let finished = false;
+    
+    source.onmessage = (event) => {
+        const job = JSON.parse(event.data);
+        finished = ['completed', 'failed', 'deleted'].includes(job.status);
+        if (job.status === 'completed') {
+            source.close();
+            updateProgress(100);
+            if (progressText) progressText.textContent = '✅ Готово!';
+            setTimeout(() => hideProgress(), 2000);
+            loadJobs();
+            showAlert('✅ Генерация успешно завершена!', 'success');
+        } else if (job.status === 'failed') {
+            source.close();
+            hideProgress();
+            showAlert(`❌ Ошибка: ${job.error || 'Неизвестная ошибка'}`, 'error');
+        } else if (job.status === 'deleted') {
+            source.close();
+            hideProgress();
+            loadJobs();
+        } else {
+            updateProgress(job.progress || 0);
+            if (progressText) progressText.textContent = job.message || 'Генерация...';
+        }
+    };
+    source.onerror = () => {
+        source.close();
+        if (!finished) pollProgress(jobId);
+    };
+}
+
+async function pollProgress(jobId) {
     const progressBar = document.getElementById('progress-bar');
     const progressText = document.getElementById('progress-text');
     
@@ -0,0 +1,75 @@
+"""
+Сопроводительный файл датасета (statistics.json): полная статистика и примеры строк.
+В result backend остается только компактная запись задачи со ссылкой на файл,
+API читает его по запросу.
+"""
+import os
+import json
+from typing import Dict, Any
+
+import polars as pl
+
+from app.core.export import atomic_path
+
+ARTIFACT_FILE = 'statistics.json'
+# Строк каждой таблицы в примере
+SAMPLE_ROWS = int(os.getenv('ARTIFACT_SAMPLE_ROWS', '5'))
+
+
+def artifact_path(filepath: str) -> str:
+    """Путь сопроводительного файла: в каталоге датасета или рядом с файлом JSON"""
+    if os.path.isdir(filepath):
+        return os.path.join(filepath, ARTIFACT_FILE)
+    return f'{os.path.splitext(filepath)[0]}.{ARTIFACT_FILE}'
+
+
+def write_artifact(path: str, payload: Dict[str, Any]) -> str:
+    with atomic_path(path) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2, default=str)
+    return path
+
+
+def read_artifact(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def sample_rows(rendered: pl.DataFrame, rows: int = None) -> list:
+    """Первые строки таблицы в экспортном виде, значения приведены к JSON"""
+    return json.loads(rendered.head(rows or SAMPLE_ROWS).write_json())
+
+
+def visit_breakdown(visits_df: pl.DataFrame) -> Dict[str, Any]:
+    """
+    Частичные суммы визитов по месяцам (число, стоимость) и по диагнозам.
+    Складываются между шардами через merge_breakdowns.
+    """
+    by_month = (
+        visits_df.group_by(pl.col('date').dt.strftime('%Y-%m').alias('month'))
+        .agg(pl.len().alias('visits'), pl.col('cost').cast(pl.Float64).sum().alias('cost_sum'))
+    )
+    by_diagnosis = visits_df.group_by(pl.col('diagnosis').cast(pl.String)).agg(pl.len().alias('visits'))
+    return {
+        'by_month': {row['month']: {'visits': row['visits'], 'cost_sum': row['cost_sum']} for row in by_month.iter_rows(named=True)},
+        'by_diagnosis': {row['diagnosis']: row['visits'] for row in by_diagnosis.iter_rows(named=True)},
+    }
+
+
+def merge_breakdowns(breakdowns) -> Dict[str, Any]:
+    """Сумма частичных разбивок и средняя стоимость по месяцам"""
+    by_month: Dict[str, Dict[str, float]] = {}
+    by_diagnosis: Dict[str, int] = {}
+    for breakdown in breakdowns:
+        for month, values in breakdown['by_month'].items():
+            entry = by_month.setdefault(month, {'visits': 0, 'cost_sum': 0.0})
+            entry['visits'] += values['visits']
+            entry['cost_sum'] += values['cost_sum']
+        for diagnosis, count in breakdown['by_diagnosis'].items():
+            by_diagnosis[diagnosis] = by_diagnosis.get(diagnosis, 0) + count
+    return {
+        'by_month': {
+            month: {'visits': entry['visits'], 'avg_cost': round(entry['cost_sum'] / entry['visits'], 2)}
+            for month, entry in sorted(by_month.items())
+        },
+        'by_diagnosis': dict(sorted(by_diagnosis.items(), key=lambda item: -item[1])),
+    }
@@ -0,0 +1,94 @@
+"""
+Подготовка процесса воркера Celery.
+worker_process_init загружает словари имен и прогревает NumPy/Polars
+пробным батчем до первой задачи; задачи берут генератор процесса через
+worker_generator вместо создания нового, шарды визитов одной задачи - общие
+ключевые колонки пациентов (worker_patient_keys). Накладные расходы задачи до начала
+генерации (от task_prerun до готового генератора) пишутся в лог и отправляются
+событием task-startup.
+"""
+import os
+import time
+import logging
+from typing import Dict, Tuple
+
+import numpy as np
+from celery.signals import worker_process_init, task_prerun, task_postrun
+
+from app.core.batch_generator import BatchGenerator
+from app.core.name_vocabulary import get_vocabulary
+
+logger = logging.getLogger(__name__)
+
+# Локали, словари которых загружаются при старте процесса
+WORKER_LOCALES = [locale.strip() for locale in os.getenv('WORKER_LOCALES', 'en_US').split(',') if locale.strip()]
+
+_generators: Dict[Tuple[int, str], BatchGenerator] = {}
+_patient_keys: Dict[Tuple[int, int, int], Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+_task_started: Dict[str, float] = {}
+_warm = False
+
+
+def worker_generator(seed, batch_size: int = 10000, locale: str = 'en_US') -> BatchGenerator:
+    """
+    Генератор процесса для (batch_size, locale) с новым seed.
+    Задачи в процессе prefork выполняются по одной, поэтому экземпляр можно переиспользовать.
+    """
+    generator = _generators.get((batch_size, locale))
+    if generator is None:
+        generator = _generators[(batch_size, locale)] = BatchGenerator(batch_size=batch_size, locale=locale)
+    generator.set_seed(seed)
+    return generator
+
+
+def worker_patient_keys(generator: BatchGenerator, n_patients: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Ключевые колонки пациентов для шардов визитов. Хранится одна задача:
+    следующие шарды визитов той же задачи в этом процессе их не пересчитывают.
+    """
+    key = (generator.seed, generator.batch_size, n_patients)
+    if key not in _patient_keys:
+        _patient_keys.clear()
+        _patient_keys[key] = generator.patient_keys(n_patients)
+    return _patient_keys[key]
+
+
+@worker_process_init.connect
+def warm_worker_process(**kwargs):
+    """Загрузка словарей и пробный батч: первые вызовы NumPy и Polars не достаются задаче"""
+    global _warm
+    started = time.perf_counter()
+    for locale in WORKER_LOCALES:
+        get_vocabulary(locale)
+        generator = worker_generator(0, locale=locale)
+        generator.generate_patient_shard(0, 16)
+        generator.generate_visit_shard(0, 16, 16)
+    _warm = True
+    logger.info(f"Процесс воркера {os.getpid()} подготовлен за {time.perf_counter() - started:.2f} с ({', '.join(WORKER_LOCALES)})")
+
+
+@task_prerun.connect
+def _remember_task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _forget_task_start(task_id=None, **kwargs):
+    _task_started.pop(task_id, None)
+
+
+def report_startup(task) -> float:
+    """
+    Время от начала задачи до готового генератора (секунды): лог и событие task-startup.
+    Вызывается задачей сразу после worker_generator.
+    """
+    started = _task_started.get(task.request.id)
+    if started is None:
+        return 0.0
+    seconds = time.perf_counter() - started
+    logger.info(f"Задача {task.request.id}: подготовка {seconds * 1000:.1f} мс (процесс {'прогрет' if _warm else 'холодный'})")
+    try:
+        task.send_event('task-startup', startup_seconds=seconds, warm=_warm)
+    except Exception as e:
+        logger.debug(f"Событие task-startup не отправлено: {e}")
+    return seconds
@@ -11,12 +11,22 @@ celery_app = Celery(
 )
 
 celery_app.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    # msgpack компактнее и быстрее JSON; json принимается от клиентов старых версий
+    task_serializer='msgpack',
+    accept_content=['msgpack', 'json'],
+    result_serializer='msgpack',
+    result_accept_content=['msgpack', 'json'],
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
     task_time_limit=3600,  # 1 час
     worker_max_tasks_per_child=200,
+    # Воркеры слушают generation,export,validation (docker-compose), очередь celery не обслуживается
+    task_default_queue='generation',
+    task_routes={'merge_dataset_shards': {'queue': 'export'}},
+    # Шарды длинные: воркер берет следующий только после текущего, нагрузка делится поровну
+    worker_prefetch_multiplier=1,
+    # События задач для карты статусов в API (app.workers.task_status)
+    worker_send_task_events=True,
+    task_send_sent_event=True,
 )
@@ -0,0 +1,185 @@
+"""
+Статусы задач Celery для списков и статистики без AsyncResult на каждую задачу.
+Карта статусов в памяти процесса обновляется событиями воркеров (task-started,
+task-succeeded, task-failed, ...) только для отслеживаемых задач - подзадачи
+(шарды) в карту не попадают. Незавершенные задачи, которых нет в карте,
+читаются из result backend одним MGET на запрос. Завершенные записи
+удаляются из карты через STATUS_CACHE_TTL секунд, незавершенные - через
+STATUS_PENDING_TTL, размер карты ограничен STATUS_CACHE_MAX_ENTRIES.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, Iterable, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+STATUS_CACHE_TTL = float(os.getenv('STATUS_CACHE_TTL', '3600'))
+# Незавершенные записи (задача потеряна, результат истек в backend) - по умолчанию сутки, как result_expires
+STATUS_PENDING_TTL = float(os.getenv('STATUS_PENDING_TTL', '86400'))
+STATUS_CACHE_MAX_ENTRIES = int(os.getenv('STATUS_CACHE_MAX_ENTRIES', '10000'))
+
+READY_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+# Событие воркера -> состояние задачи
+_EVENT_STATES = {
+    'task-sent': 'PENDING',
+    'task-received': 'PENDING',
+    'task-started': 'STARTED',
+    'task-succeeded': 'SUCCESS',
+    'task-failed': 'FAILURE',
+    'task-rejected': 'FAILURE',
+    'task-revoked': 'REVOKED',
+}
+
+
+def _progress(info: Any) -> float:
+    return info.get('progress') or 0 if isinstance(info, dict) else 0
+
+
+class TaskStatusCache:
+    """
+    Карта task_id -> {'state', 'info', 'updated'}.
+    on_ready(task_id, state) вызывается один раз при переходе задачи в итоговое состояние.
+    """
+
+    def __init__(
+        self,
+        celery_app,
+        ttl: float = STATUS_CACHE_TTL,
+        on_ready: Optional[Callable[[str, str], None]] = None,
+        pending_ttl: float = STATUS_PENDING_TTL,
+        max_entries: int = STATUS_CACHE_MAX_ENTRIES,
+    ):
+        self.celery_app = celery_app
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.max_entries = max_entries
+        self.on_ready = on_ready
+        self._statuses: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._receiver = None
+        self._expired_at = time.monotonic()
+
+    def _set(self, task_id: str, state: str, info: Any = None, known_only: bool = False):
+        with self._lock:
+            previous = self._statuses.get(task_id)
+            if previous is None and known_only:
+                return
+            if previous is not None and previous['state'] in READY_STATES:
+                # Итоговое состояние не откатывается запоздавшим событием
+                return
+            if info is None and previous is not None:
+                # Событие без метаданных не стирает прогресс, прочитанный из backend
+                info = previous['info']
+            if state == 'PROGRESS' and _progress(info) < _progress(previous and previous['info']):
+                # Шарды пишут прогресс параллельно: запоздавшая запись не откатывает его назад
+                info = previous['info']
+            self._statuses[task_id] = {'state': state, 'info': info, 'updated': time.monotonic()}
+            if len(self._statuses) > self.max_entries:
+                self._evict_oldest()
+        if state in READY_STATES and self.on_ready is not None:
+            self.on_ready(task_id, state)
+
+    def track(self, task_id: str):
+        """Регистрация только что отправленной задачи"""
+        self._set(task_id, 'PENDING')
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            status = self._statuses.get(task_id)
+            return dict(status) if status is not None else None
+
+    def states(self, task_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Состояния задач task_ids. Итоговые берутся из карты, остальные
+        (и неизвестные процессу) - одним MGET из result backend.
+        """
+        task_ids = list(task_ids)
+        if time.monotonic() - self._expired_at > min(self.ttl, 60):
+            self.expire()
+        with self._lock:
+            known = {task_id: self._statuses.get(task_id) for task_id in task_ids}
+        stale = [task_id for task_id, status in known.items() if status is None or status['state'] not in READY_STATES]
+        if stale:
+            self.refresh(stale)
+        with self._lock:
+            return {
+                task_id: self._statuses[task_id]['state'] if task_id in self._statuses else 'PENDING'
+                for task_id in task_ids
+            }
+
+    def refresh(self, task_ids: Iterable[str]):
+        """Чтение метаданных задач из backend одним MGET"""
+        task_ids = list(task_ids)
+        backend = self.celery_app.backend
+        try:
+            values = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать статусы задач из backend: {e}")
+            return
+        for task_id, value in zip(task_ids, values):
+            if value is None:
+                # Метаданных еще нет: задача в очереди
+                continue
+            meta = backend.decode_result(value)
+            self._set(task_id, meta['status'], meta.get('result'))
+
+    def expire(self):
+        """Удаление итоговых записей старше ttl и незавершенных старше pending_ttl"""
+        self._expired_at = now = time.monotonic()
+        with self._lock:
+            expired = [
+                task_id for task_id, status in self._statuses.items()
+                if status['updated'] < now - (self.ttl if status['state'] in READY_STATES else self.pending_ttl)
+            ]
+            for task_id in expired:
+                del self._statuses[task_id]
+        return len(expired)
+
+    def _evict_oldest(self):
+        """Переполнение карты: удаляется десятая часть записей, сначала итоговые, затем самые старые"""
+        by_age = sorted(
+            self._statuses.items(),
+            key=lambda item: (item[1]['state'] not in READY_STATES, item[1]['updated']),
+        )
+        for task_id, _ in by_age[:max(len(by_age) // 10, 1)]:
+            del self._statuses[task_id]
+
+    # ---- события воркеров ----
+
+    def _on_event(self, event: Dict[str, Any]):
+        state = _EVENT_STATES.get(event.get('type'))
+        if state is not None and event.get('uuid'):
+            # События шардов, merge и задач других процессов не создают записей
+            self._set(event['uuid'], state, known_only=True)
+
+    def _listen(self):
+        handlers = {event_type: self._on_event for event_type in _EVENT_STATES}
+        while not self._stop.is_set():
+            try:
+                with self.celery_app.connection_for_read() as connection:
+                    self._receiver = self.celery_app.events.Receiver(connection, handlers=handlers)
+                    # Блокирующий цикл до shutdown (should_stop проверяется раз в секунду)
+                    self._receiver.capture(limit=None, timeout=None, wakeup=False)
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                logger.warning(f"Подписка на события Celery прервана: {e}")
+                self._stop.wait(5)
+
+    def start(self):
+        """Подписка на события воркеров в фоновом потоке (из события startup)"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._listen, name='celery-events', daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._receiver is not None:
+            self._receiver.should_stop = True
+        self._thread = None
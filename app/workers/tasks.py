@@ -1,5 +1,11 @@
 from app.workers.celery_app import celery_app
-from app.core.batch_generator import BatchGenerator
+from app.workers.bootstrap import worker_generator, worker_patient_keys, report_startup
+from app.workers.artifacts import (
+    artifact_path, write_artifact, sample_rows, visit_breakdown, merge_breakdowns, SAMPLE_ROWS
+)
+from app.core.batch_generator import render_patients, render_visits
+from app.core.export import atomic_path, export_dataset, resolve_format
+from celery import chord, group, uuid
 import json
 import os
 from datetime import datetime
@@ -8,60 +14,392 @@ import polars as pl
 
 logger = logging.getLogger(__name__)
 
+# Минимальный интервал между обновлениями прогресса в result backend (секунды)
+PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', '2'))
+# Доля шкалы прогресса на генерацию, остаток - сохранение файлов
+GENERATION_PROGRESS_SHARE = 0.9
+
+GENERATION_BATCH_SIZE = 10000
+# Задачи больше SHARD_THRESHOLD_ROWS (пациенты + визиты) с выводом в Parquet
+# делятся на подзадачи по SHARD_ROWS строк, которые выполняются на всех воркерах
+SHARD_THRESHOLD_ROWS = int(os.getenv('SHARD_THRESHOLD_ROWS', '1000000'))
+SHARD_ROWS = int(os.getenv('SHARD_ROWS', '500000'))
+SHARDED_FORMATS = ('parquet',)
+# Предел для задачи без шардов (остальные форматы пишутся одним воркером):
+# больше не уложиться в task_time_limit, такие задачи отклоняются при постановке
+MAX_UNSHARDED_ROWS = int(os.getenv('MAX_UNSHARDED_ROWS', '5000000'))
+# Время жизни счетчика готовых строк шардированной задачи в Redis (секунды)
+SHARD_PROGRESS_TTL = int(os.getenv('SHARD_PROGRESS_TTL', '86400'))
+MANIFEST_FILE = 'manifest.json'
+
 @celery_app.task(bind=True, name='generate_medical_dataset')
-def generate_medical_dataset(self, patients_count, visits_count, seed=42):
+def generate_medical_dataset(
+    self,
+    patients_count,
+    visits_count,
+    seed=42,
+    export_format='json',
+    compression=None,
+    row_group_size=None,
+):
     """
-    Фоновая задача для генерации медицинского датасета
+    Фоновая задача для генерации медицинского датасета.
+    export_format: json, ndjson, parquet, ipc (feather), csv;
+    compression и row_group_size - параметры формата (см. app.core.export).
     """
     task_id = self.request.id
     logger.info(f"Задача {task_id}: Начало генерации {patients_count} пациентов, {visits_count} визитов")
     
-    self.update_state(state='PROGRESS', meta={'progress': 10, 'status': 'Инициализация генератора...'})
+    export_format, compression = resolve_format(export_format, compression)
+    if is_sharded(patients_count, visits_count, export_format):
+        # Результат задачи - результат merge_dataset_shards, AsyncResult(task_id) работает как прежде;
+        # до merge прогресс задачи обновляют шарды (report_shard_progress)
+        self.update_state(state='PROGRESS', meta={
+            'progress': 0, 'rows_done': 0, 'rows_total': patients_count + visits_count,
+            'status': 'Распределение шардов...',
+        })
+        raise self.replace(sharded_generation(
+            task_id, patients_count, visits_count, seed, compression, row_group_size
+        ))
+    check_generation_size(patients_count, visits_count, export_format)
+    
+    self.update_state(state='PROGRESS', meta={'progress': 0, 'status': 'Инициализация генератора...'})
+    
+    def report_progress(event):
+        # События приходят по батчам не чаще PROGRESS_UPDATE_INTERVAL
+        meta = dict(event)
+        meta['progress'] = round(event['progress'] * GENERATION_PROGRESS_SHARE, 1)
+        meta['status'] = f"Генерация: {event['stage']} ({event['rows_done']}/{event['rows_total']})"
+        self.update_state(state='PROGRESS', meta=meta)
     
     try:
-        generator = BatchGenerator(batch_size=10000)
-        generator.set_seed(seed)
+        generator = worker_generator(seed, GENERATION_BATCH_SIZE)
+        startup_seconds = report_startup(self)
         
-        self.update_state(state='PROGRESS', meta={'progress': 30, 'status': 'Генерация пациентов...'})
-        dataset = generator.generate_full_medical_dataset(patients_count, visits_count)
+        dataset = generator.generate_full_medical_dataset(
+            patients_count, visits_count,
+            progress_callback=report_progress,
+            progress_interval=PROGRESS_UPDATE_INTERVAL,
+        )
         
-        self.update_state(state='PROGRESS', meta={'progress': 70, 'status': 'Сохранение результатов...'})
+        self.update_state(state='PROGRESS', meta={
+            'progress': round(100 * GENERATION_PROGRESS_SHARE), 'status': 'Сохранение результатов...'
+        })
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"medical_dataset_{timestamp}_p{patients_count}_v{visits_count}.json"
-        filepath = os.path.join('data/generated', filename)
-        
         os.makedirs('data/generated', exist_ok=True)
         
-        # Сохраняем в JSON
-        generator.export_to_json(dataset, filepath)
+        if export_format == 'json':
+            filename = f"medical_dataset_{timestamp}_p{patients_count}_v{visits_count}.json"
+            filepath = os.path.join('data/generated', filename)
+            generator.export_to_json(dataset, filepath)
+            files = {'dataset': filepath}
+        else:
+            # Колоночные форматы и NDJSON - каталог с файлом на таблицу
+            filename = f"medical_dataset_{timestamp}_p{patients_count}_v{visits_count}_{export_format}"
+            filepath = os.path.join('data/generated', filename)
+            files = export_dataset(dataset, filepath, export_format, compression, row_group_size)
         
         # Статистика
-        diabetic_bmi = dataset['patients'].filter(pl.col('diabetes') == True)['bmi'].mean() or 0
-        non_diabetic_bmi = dataset['patients'].filter(pl.col('diabetes') == False)['bmi'].mean() or 0
-        
-        self.update_state(state='PROGRESS', meta={'progress': 100, 'status': 'Готово!'})
+        patients_df, visits_df = dataset['patients'], dataset['visits']
+        diabetic_bmi = patients_df.filter(pl.col('diabetes') == True)['bmi'].mean() or 0
+        non_diabetic_bmi = patients_df.filter(pl.col('diabetes') == False)['bmi'].mean() or 0
+        sample_visits = visits_df.head(SAMPLE_ROWS)
         
-        return {
-            'status': 'success',
+        artifact = write_artifact(artifact_path(filepath), {
             'task_id': task_id,
-            'file': filename,
-            'filepath': filepath,
             'patients': patients_count,
             'visits': visits_count,
             'statistics': {
-                'diabetes_rate': float(dataset['patients']['diabetes'].mean()),
-                'avg_bmi': float(dataset['patients']['bmi'].mean()),
-                'avg_cost': float(dataset['visits']['cost'].mean()),
+                'diabetes_rate': float(patients_df['diabetes'].mean()),
+                'avg_bmi': float(patients_df['bmi'].mean()),
+                'avg_cost': float(visits_df['cost'].mean()),
                 'bmi_correlation': {
                     'diabetic': round(float(diabetic_bmi), 1),
                     'non_diabetic': round(float(non_diabetic_bmi), 1),
                     'difference': round(float(diabetic_bmi - non_diabetic_bmi), 1)
-                }
-            }
-        }
+                },
+                'visits': merge_breakdowns([visit_breakdown(visits_df)]),
+            },
+            'sample': {
+                'patients': sample_rows(render_patients(patients_df.head(SAMPLE_ROWS))),
+                'visits': sample_rows(render_visits(
+                    sample_visits, patients_df['id'].gather(sample_visits['patient_index'])
+                )),
+            },
+        })
+        
+        self.update_state(state='PROGRESS', meta={'progress': 100, 'status': 'Готово!'})
+        
+        return task_record(
+            task_id, filepath, export_format, compression, patients_count, visits_count, artifact,
+            files=files, startup_seconds=round(startup_seconds, 4),
+        )
         
     except Exception as e:
         logger.error(f"Задача {task_id}: Ошибка - {str(e)}")
         self.update_state(state='FAILURE', meta={'error': str(e)})
         raise e
+
+
+def task_record(task_id, filepath, export_format, compression, patients_count, visits_count, artifact, **extra):
+    """
+    Результат задачи в result backend: статус и ссылки на файлы.
+    Полная статистика и примеры строк - в сопроводительном файле artifact.
+    """
+    return {
+        'status': 'success',
+        'task_id': task_id,
+        'file': os.path.basename(filepath),
+        'filepath': filepath,
+        'format': export_format,
+        'compression': compression,
+        'patients': patients_count,
+        'visits': visits_count,
+        'artifact': artifact,
+        **extra,
+    }
+
+
+# ---- Шардированная генерация: group подзадач + merge (chord) ----
+
+def is_sharded(patients_count, visits_count, export_format):
+    """Задача выполняется шардами (export_format - каноническое имя из resolve_format)"""
+    return export_format in SHARDED_FORMATS and patients_count + visits_count > SHARD_THRESHOLD_ROWS
+
+
+def check_generation_size(patients_count, visits_count, export_format):
+    """ValueError для задачи без шардов больше MAX_UNSHARDED_ROWS строк"""
+    rows = patients_count + visits_count
+    if not is_sharded(patients_count, visits_count, export_format) and rows > MAX_UNSHARDED_ROWS:
+        raise ValueError(
+            f"Задача на {rows} строк в формате {export_format} слишком большая "
+            f"(не больше {MAX_UNSHARDED_ROWS}); для больших датасетов используйте "
+            f"{', '.join(SHARDED_FORMATS)}"
+        )
+
+
+def dispatch_generation(patients_count, visits_count, seed=42, export_format='json', compression=None, row_group_size=None):
+    """
+    Постановка задачи генерации из API. Большая задача сразу отправляется chord'ом шардов
+    (без промежуточной задачи, которая только заменяет себя), остальные - generate_medical_dataset.
+    Возвращает AsyncResult; его id - id задачи для /api/v1/tasks.
+    ValueError - неизвестный формат или сжатие, слишком большая задача без шардов.
+    """
+    export_format, compression = resolve_format(export_format, compression)
+    if is_sharded(patients_count, visits_count, export_format):
+        task_id = uuid()
+        return sharded_generation(
+            task_id, patients_count, visits_count, seed, compression, row_group_size
+        ).apply_async()
+    check_generation_size(patients_count, visits_count, export_format)
+    return generate_medical_dataset.delay(
+        patients_count, visits_count, seed, export_format, compression, row_group_size
+    )
+
+
+def shard_ranges(count, shard_rows=None, batch_size=GENERATION_BATCH_SIZE):
+    """
+    Диапазоны батчей генератора [first, last) для подзадач.
+    Граница подзадачи совпадает с границей батча, поэтому датасет
+    не отличается от генерации одной задачей с тем же seed.
+    """
+    batches_per_shard = max((shard_rows or SHARD_ROWS) // batch_size, 1)
+    total_batches = -(-count // batch_size)
+    return [
+        (first, min(first + batches_per_shard, total_batches))
+        for first in range(0, total_batches, batches_per_shard)
+    ]
+
+
+def sharded_generation(task_id, patients_count, visits_count, seed, compression='zstd', row_group_size=None):
+    """
+    Workflow для большой задачи: шарды пациентов и визитов пишут части
+    patients/part-*.parquet и visits/part-*.parquet в общий каталог,
+    merge_dataset_shards собирает манифест и статистику.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"medical_dataset_{timestamp}_p{patients_count}_v{visits_count}_parquet"
+    filepath = os.path.join('data/generated', filename)
+    
+    shards = [
+        generate_patient_shard.s(
+            filepath, first, last, patients_count, seed, compression, row_group_size,
+            parent_id=task_id, total_rows=patients_count + visits_count,
+        )
+        for first, last in shard_ranges(patients_count)
+    ] + [
+        generate_visit_shard.s(
+            filepath, first, last, patients_count, visits_count, seed, compression, row_group_size,
+            parent_id=task_id, total_rows=patients_count + visits_count,
+        )
+        for first, last in shard_ranges(visits_count)
+    ]
+    logger.info(f"Задача {task_id}: {len(shards)} шардов в {filepath}")
+    # merge получает id задачи: AsyncResult(task_id) - результат merge, прогресс шардов пишется туда же
+    merge = merge_dataset_shards.s(task_id, filepath, patients_count, visits_count, seed, compression).set(task_id=task_id)
+    return chord(group(shards), merge)
+
+
+def report_shard_progress(task, parent_id, rows, total_rows):
+    """
+    Готовый шард: его строки добавляются к счетчику задачи в Redis (INCRBY - атомарно
+    для параллельных шардов), общий прогресс записывается состоянием PROGRESS
+    родительской задачи. До merge прогресс не превышает 99%.
+    """
+    if not parent_id or not total_rows:
+        return
+    backend = task.backend
+    key = f'shard-progress-{parent_id}'
+    try:
+        rows_done = backend.client.incrby(key, rows)
+        backend.client.expire(key, SHARD_PROGRESS_TTL)
+        backend.store_result(parent_id, {
+            'progress': min(round(100 * rows_done / total_rows, 1), 99),
+            'rows_done': rows_done,
+            'rows_total': total_rows,
+            'status': f"Генерация шардов ({rows_done}/{total_rows})",
+        }, 'PROGRESS')
+    except Exception as e:
+        # Прогресс не должен ронять шард (например, backend без Redis-клиента)
+        logger.warning(f"Прогресс задачи {parent_id} не обновлен: {e}")
+
+
+def _write_part(filepath, frame, compression, row_group_size):
+    with atomic_path(filepath) as tmp_path:
+        frame.write_parquet(tmp_path, compression=compression, row_group_size=row_group_size)
+    return filepath
+
+
+def _part_path(directory, table, first):
+    os.makedirs(os.path.join(directory, table), exist_ok=True)
+    return os.path.join(directory, table, f'part-{first:05d}.parquet')
+
+
+@celery_app.task(bind=True, name='generate_patient_shard')
+def generate_patient_shard(
+    self, directory, first, last, patients_count, seed, compression='zstd', row_group_size=None,
+    parent_id=None, total_rows=None,
+):
+    """
+    Батчи пациентов [first, last) в одну часть Parquet.
+    Возвращает частичные суммы для статистики, а не сами строки.
+    """
+    generator = worker_generator(seed, GENERATION_BATCH_SIZE)
+    startup_seconds = report_startup(self)
+    patients_df = pl.concat([generator.generate_patient_shard(index, patients_count) for index in range(first, last)])
+    path = _write_part(_part_path(directory, 'patients', first), render_patients(patients_df), compression, row_group_size)
+    
+    diabetic = patients_df['diabetes']
+    bmi = patients_df['bmi'].cast(pl.Float64)
+    partial = {
+        'table': 'patients',
+        'file': path,
+        'rows': len(patients_df),
+        'startup_seconds': startup_seconds,
+        'diabetes': int(diabetic.sum()),
+        'bmi_sum': float(bmi.sum()),
+        'diabetic_bmi_sum': float(bmi.filter(diabetic).sum()),
+    }
+    if first == 0:
+        partial['sample'] = sample_rows(render_patients(patients_df.head(SAMPLE_ROWS)))
+    report_shard_progress(self, parent_id, len(patients_df), total_rows)
+    return partial
+
+
+@celery_app.task(bind=True, name='generate_visit_shard')
+def generate_visit_shard(
+    self, directory, first, last, patients_count, visits_count, seed, compression='zstd', row_group_size=None,
+    parent_id=None, total_rows=None,
+):
+    """
+    Батчи визитов [first, last) в одну часть Parquet.
+    Ключевые колонки пациентов строятся один раз на процесс воркера и задачу.
+    """
+    generator = worker_generator(seed, GENERATION_BATCH_SIZE)
+    startup_seconds = report_startup(self)
+    patient_keys = worker_patient_keys(generator, patients_count)
+    visits_df = pl.concat([
+        generator.generate_visit_shard(index, patients_count, visits_count, patient_keys)
+        for index in range(first, last)
+    ])
+    parent_ids = pl.Series('id', patient_keys[0][visits_df['patient_index'].to_numpy()])
+    rendered = render_visits(visits_df, parent_ids)
+    path = _write_part(_part_path(directory, 'visits', first), rendered, compression, row_group_size)
+    partial = {
+        'table': 'visits',
+        'file': path,
+        'rows': len(visits_df),
+        'startup_seconds': startup_seconds,
+        'cost_sum': float(visits_df['cost'].cast(pl.Float64).sum()),
+        'breakdown': visit_breakdown(visits_df),
+    }
+    if first == 0:
+        partial['sample'] = sample_rows(rendered)
+    report_shard_progress(self, parent_id, len(visits_df), total_rows)
+    return partial
+
+
+def combine_shard_statistics(partials):
+    """Статистика датасета из частичных сумм шардов - та же, что у generate_medical_dataset"""
+    patients = [p for p in partials if p['table'] == 'patients']
+    visits = [p for p in partials if p['table'] == 'visits']
+    n_patients = sum(p['rows'] for p in patients)
+    n_visits = sum(p['rows'] for p in visits)
+    n_diabetic = sum(p['diabetes'] for p in patients)
+    bmi_sum = sum(p['bmi_sum'] for p in patients)
+    diabetic_bmi_sum = sum(p['diabetic_bmi_sum'] for p in patients)
+    
+    diabetic_bmi = diabetic_bmi_sum / n_diabetic if n_diabetic else 0
+    non_diabetic_bmi = (bmi_sum - diabetic_bmi_sum) / (n_patients - n_diabetic) if n_patients > n_diabetic else 0
+    return {
+        'diabetes_rate': n_diabetic / n_patients if n_patients else 0.0,
+        'avg_bmi': bmi_sum / n_patients if n_patients else 0.0,
+        'avg_cost': sum(p['cost_sum'] for p in visits) / n_visits if n_visits else 0.0,
+        'bmi_correlation': {
+            'diabetic': round(diabetic_bmi, 1),
+            'non_diabetic': round(non_diabetic_bmi, 1),
+            'difference': round(diabetic_bmi - non_diabetic_bmi, 1),
+        },
+        'visits': merge_breakdowns([p['breakdown'] for p in visits]),
+    }
+
+
+@celery_app.task(name='merge_dataset_shards')
+def merge_dataset_shards(partials, task_id, directory, patients_count, visits_count, seed, compression='zstd'):
+    """
+    Завершение chord: манифест с частями по таблицам и сопроводительный файл
+    с общей статистикой. Данные не перечитываются - только частичные суммы из результатов шардов.
+    """
+    files = {
+        table: sorted(p['file'] for p in partials if p['table'] == table)
+        for table in ('patients', 'visits')
+    }
+    artifact = write_artifact(artifact_path(directory), {
+        'task_id': task_id,
+        'patients': patients_count,
+        'visits': visits_count,
+        'statistics': combine_shard_statistics(partials),
+        'sample': {p['table']: p['sample'] for p in partials if 'sample' in p},
+    })
+    manifest = {
+        'format': 'parquet',
+        'compression': compression,
+        'seed': seed,
+        'batch_size': GENERATION_BATCH_SIZE,
+        'patients': patients_count,
+        'visits': visits_count,
+        'files': {table: [os.path.relpath(path, directory) for path in paths] for table, paths in files.items()},
+        'statistics': os.path.relpath(artifact, directory),
+    }
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with atomic_path(manifest_path) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"Задача {task_id}: {len(partials)} шардов объединены в {directory}")
+    
+    return task_record(
+        task_id, directory, 'parquet', compression, patients_count, visits_count, artifact,
+        files={'manifest': manifest_path},
+        shards=len(partials),
+        startup_seconds=round(max(p['startup_seconds'] for p in partials), 4),
+    )
@@ -3,7 +3,7 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app.core.batch_generator import BatchGenerator
+from app.core.batch_generator import BatchGenerator, render_ids
 import time
 import json
 from datetime import datetime
@@ -31,6 +31,7 @@ try:
     dataset = generator.generate_full_medical_dataset(10000, 50000)
     
     # Конвертируем Polars DataFrame в список словарей
+    dataset = render_ids(dataset)
     patients_list = dataset['patients'].to_dicts()
     visits_list = dataset['visits'].to_dicts()
     
@@ -3,7 +3,7 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app.core.batch_generator import BatchGenerator
+from app.core.batch_generator import BatchGenerator, render_ids
 import time
 import json
 from datetime import datetime
@@ -29,6 +29,7 @@ timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 filename = f'data/generated/medical_dataset_{timestamp}.json'
 
 # Конвертируем Polars DataFrame в список словарей
+dataset = render_ids(dataset)
 patients_list = dataset['patients'].to_dicts()
 visits_list = dataset['visits'].to_dicts()
 
@@ -43,6 +43,8 @@ def init_database():
         result_url VARCHAR(500),
         error_message TEXT
     );
+    -- Владелец задачи (хранилище задач веб-приложения, app/core/job_store.py)
+    ALTER TABLE generation_jobs ADD COLUMN IF NOT EXISTS user_id VARCHAR(64);
 
     -- Correlation rules
     CREATE TABLE IF NOT EXISTS correlation_rules (
@@ -75,7 +77,10 @@ def init_database():
     CREATE INDEX IF NOT EXISTS idx_schemas_user ON schemas(user_id);
     CREATE INDEX IF NOT EXISTS idx_correlation_schema ON correlation_rules(schema_id);
     CREATE INDEX IF NOT EXISTS idx_generation_status ON generation_jobs(status);
-    CREATE INDEX IF NOT EXISTS idx_generation_created ON generation_jobs(created_at);
+    -- Старый одноколоночный индекс не подходит для keyset-пагинации (created_at, id)
+    DROP INDEX IF EXISTS idx_generation_created;
+    CREATE INDEX IF NOT EXISTS idx_generation_created_id ON generation_jobs(created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_generation_user_created ON generation_jobs(user_id, created_at DESC, id DESC);
     """
     
     try:
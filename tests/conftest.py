@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Тесты запускаются из корня репозитория: python -m pytest tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Кэш словарей имен - во временном каталоге, а не в data/ репозитория
+# (через окружение, чтобы его получили и процессы пула генерации)
+os.environ.setdefault('NAME_VOCABULARY_DIR', tempfile.mkdtemp(prefix='name-vocabularies-'))
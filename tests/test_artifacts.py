@@ -0,0 +1,65 @@
+"""
+Сопроводительный файл датасета и запись задачи: разбивки по шардам
+складываются в разбивку целого датасета, запись задачи переживает
+msgpack без потерь, файл пишется атомарно.
+"""
+import os
+
+import polars as pl
+import pytest
+from kombu.serialization import dumps, loads
+
+from app.core.batch_generator import BatchGenerator, render_patients
+from app.workers import artifacts
+from app.workers.artifacts import (
+    artifact_path, write_artifact, read_artifact, sample_rows, visit_breakdown, merge_breakdowns,
+)
+from app.workers.tasks import task_record
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    return BatchGenerator(batch_size=300, seed=5).generate_full_medical_dataset(600, 2000)
+
+
+def test_shard_breakdowns_merge_to_full(dataset):
+    visits_df = dataset['visits']
+    full = merge_breakdowns([visit_breakdown(visits_df)])
+    shards = [visit_breakdown(visits_df.slice(offset, 700)) for offset in range(0, visits_df.height, 700)]
+    assert merge_breakdowns(shards) == full
+
+    assert sum(full['by_diagnosis'].values()) == visits_df.height
+    assert sum(entry['visits'] for entry in full['by_month'].values()) == visits_df.height
+    assert list(full['by_month']) == sorted(full['by_month'])
+    counts = list(full['by_diagnosis'].values())
+    assert counts == sorted(counts, reverse=True)
+
+
+def test_artifact_round_trip(dataset, tmp_path):
+    payload = {
+        'statistics': {'avg_bmi': float(dataset['patients']['bmi'].mean())},
+        'sample': {'patients': sample_rows(render_patients(dataset['patients']), rows=3)},
+    }
+    path = write_artifact(artifact_path(str(tmp_path / 'dataset.json')), payload)
+    assert path == str(tmp_path / f'dataset.{artifacts.ARTIFACT_FILE}')
+    assert read_artifact(path) == payload
+    assert len(payload['sample']['patients']) == 3
+    assert artifact_path(str(tmp_path)) == os.path.join(str(tmp_path), artifacts.ARTIFACT_FILE)
+
+
+def test_failed_artifact_write_leaves_no_files(tmp_path):
+    with pytest.raises(TypeError):
+        write_artifact(str(tmp_path / artifacts.ARTIFACT_FILE), {object(): 1})
+    assert os.listdir(tmp_path) == []
+
+
+def test_task_record_survives_msgpack(tmp_path):
+    record = task_record(
+        'task-1', str(tmp_path / 'dataset'), 'parquet', 'zstd', 100, 500,
+        str(tmp_path / 'dataset' / artifacts.ARTIFACT_FILE),
+        files={'manifest': 'manifest.json'}, shards=3, startup_seconds=0.25,
+    )
+    content_type, encoding, body = dumps(record, serializer='msgpack')
+    assert loads(body, content_type, encoding, accept={content_type}) == record
+    assert record['file'] == 'dataset'
+    assert 'statistics' not in record
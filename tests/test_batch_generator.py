@@ -0,0 +1,87 @@
+"""
+Воспроизводимость BatchGenerator: при одном seed результат не зависит
+от числа процессов и от того, строится датасет целиком или по шардам.
+"""
+import numpy as np
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from app.core.batch_generator import BatchGenerator
+
+SEED = 1234
+BATCH_SIZE = 500
+N_PATIENTS = 1700
+N_VISITS = 3100
+
+
+@pytest.fixture(scope='module')
+def serial_dataset():
+    generator = BatchGenerator(batch_size=BATCH_SIZE, workers=1, seed=SEED)
+    return generator.generate_full_medical_dataset(N_PATIENTS, N_VISITS)
+
+
+def test_parallel_equals_serial(serial_dataset):
+    generator = BatchGenerator(batch_size=BATCH_SIZE, workers=2, seed=SEED)
+    parallel = generator.generate_full_medical_dataset(N_PATIENTS, N_VISITS)
+    
+    assert_frame_equal(parallel['patients'], serial_dataset['patients'])
+    assert_frame_equal(parallel['visits'], serial_dataset['visits'])
+
+
+def test_same_seed_same_dataset(serial_dataset):
+    again = BatchGenerator(batch_size=BATCH_SIZE, seed=SEED).generate_full_medical_dataset(N_PATIENTS, N_VISITS)
+    other = BatchGenerator(batch_size=BATCH_SIZE, seed=SEED + 1).generate_patients(N_PATIENTS)
+    
+    assert_frame_equal(again['patients'], serial_dataset['patients'])
+    assert_frame_equal(again['visits'], serial_dataset['visits'])
+    assert not other.equals(serial_dataset['patients'])
+
+
+def test_iterators_match_full_generation(serial_dataset):
+    generator = BatchGenerator(batch_size=BATCH_SIZE, seed=SEED)
+    patients = pl.concat(generator.iter_patients(N_PATIENTS))
+    visits = pl.concat(generator.iter_visits(patients, N_VISITS))
+    
+    assert_frame_equal(patients, serial_dataset['patients'])
+    assert_frame_equal(visits, serial_dataset['visits'])
+
+
+def test_patient_shards_are_slices(serial_dataset):
+    generator = BatchGenerator(batch_size=BATCH_SIZE, seed=SEED)
+    shards = [generator.generate_patient_shard(index, N_PATIENTS) for index in range(generator.shard_count(N_PATIENTS))]
+    
+    assert [len(shard) for shard in shards] == [500, 500, 500, 200]
+    assert_frame_equal(shards[2], serial_dataset['patients'].slice(2 * BATCH_SIZE, BATCH_SIZE))
+    assert_frame_equal(pl.concat(shards), serial_dataset['patients'])
+
+
+def test_visit_shards_are_slices(serial_dataset):
+    generator = BatchGenerator(batch_size=BATCH_SIZE, seed=SEED)
+    indices = range(generator.shard_count(N_VISITS))
+    # Без таблицы пациентов и с общими ключевыми колонками - одинаковый результат
+    standalone = pl.concat([generator.generate_visit_shard(index, N_PATIENTS, N_VISITS) for index in indices])
+    keys = generator.patient_keys(N_PATIENTS)
+    with_keys = pl.concat([generator.generate_visit_shard(index, N_PATIENTS, N_VISITS, keys) for index in indices])
+    
+    assert_frame_equal(standalone, serial_dataset['visits'])
+    assert_frame_equal(with_keys, serial_dataset['visits'])
+
+
+def test_patient_keys_match_patients(serial_dataset):
+    generator = BatchGenerator(batch_size=BATCH_SIZE, seed=SEED)
+    id_bytes, ages, diabetes = generator.patient_keys(N_PATIENTS)
+    patients = serial_dataset['patients']
+    
+    assert np.array_equal(ages, patients['age'].to_numpy())
+    assert np.array_equal(diabetes, patients['diabetes'].to_numpy())
+    assert generator.patient_ids_at(np.array([0, 1699]), N_PATIENTS).to_list() == patients['id'].gather([0, 1699]).to_list()
+    assert len(id_bytes) == N_PATIENTS
+
+
+def test_shard_requires_seed():
+    generator = BatchGenerator(batch_size=BATCH_SIZE)
+    with pytest.raises(ValueError):
+        generator.generate_patient_shard(0, N_PATIENTS)
+    with pytest.raises(ValueError):
+        BatchGenerator(batch_size=BATCH_SIZE, seed=SEED).generate_patient_shard(4, N_PATIENTS)
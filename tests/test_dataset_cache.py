@@ -0,0 +1,142 @@
+"""
+DatasetCache: одновременные запросы объединяются в одну генерацию и получают
+ее прогресс, cached - только для готовых записей, вытеснение удаляет старые
+записи и не трогает закрепленные (между get и link).
+"""
+import os
+import asyncio
+
+from app.core.dataset_cache import DatasetCache, META_FILE
+
+ENTRY_BYTES = 1000
+
+
+def _builder(calls, gate=None, size=ENTRY_BYTES):
+    async def build(directory, on_progress):
+        calls.append(directory)
+        os.makedirs(directory)
+        on_progress({'progress': 10})
+        if gate is not None:
+            await gate.wait()
+        on_progress({'progress': 90})
+        with open(os.path.join(directory, 'patients.arrow'), 'wb') as f:
+            f.write(b'x' * size)
+        return {'statistics': {'patients': 1}}
+    return build
+
+
+def _age(cache, key, seconds):
+    meta_path = os.path.join(cache.entry_dir(key), META_FILE)
+    mtime = os.path.getmtime(meta_path) - seconds
+    os.utime(meta_path, (mtime, mtime))
+
+
+def test_concurrent_requests_share_one_build(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    calls = []
+
+    async def scenario():
+        gate = asyncio.Event()
+        build = _builder(calls, gate)
+        first_events, second_events = [], []
+        first = asyncio.ensure_future(cache.get_or_build('key', build, first_events.append))
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(cache.get_or_build('key', build, second_events.append))
+        await asyncio.sleep(0.05)
+        gate.set()
+        results = await asyncio.gather(first, second)
+        again = await cache.get_or_build('key', build)
+        return results, again, first_events, second_events
+
+    results, again, first_events, second_events = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [cached for _, cached in results] == [False, False]
+    assert results[0][0] == results[1][0]
+    assert again == (results[0][0], True)
+    assert first_events == [{'progress': 10}, {'progress': 90}]
+    # Присоединившийся получает текущее событие и все следующие
+    assert second_events == [{'progress': 10}, {'progress': 90}]
+    assert not cache._listeners and not cache._last_progress
+
+
+def test_cancelled_waiter_does_not_stop_build(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    calls = []
+
+    async def scenario():
+        gate = asyncio.Event()
+        build = _builder(calls, gate)
+        cancelled_events, events = [], []
+        first = asyncio.ensure_future(cache.get_or_build('key', build, cancelled_events.append))
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(cache.get_or_build('key', build, events.append))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        return await second, cancelled_events, events
+
+    (meta, cached), cancelled_events, events = asyncio.run(scenario())
+    assert len(calls) == 1 and not cached
+    assert os.path.exists(os.path.join(meta['dataset_path'], 'patients.arrow'))
+    assert cancelled_events == [{'progress': 10}]
+    assert events == [{'progress': 10}, {'progress': 90}]
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    calls = []
+
+    async def scenario():
+        for index, key in enumerate(('old', 'used', 'new')):
+            await cache.get_or_build(key, _builder(calls))
+            _age(cache, key, 100 - index)
+        cache.max_bytes = 3 * ENTRY_BYTES + 500
+        # Обращение продлевает жизнь записи
+        await cache.get_or_build('old', _builder(calls))
+        await cache.get_or_build('newest', _builder(calls))
+
+    asyncio.run(scenario())
+    assert len(calls) == 4
+    assert sorted(os.listdir(tmp_path)) == ['new', 'newest', 'old']
+
+
+def test_pinned_entry_survives_eviction(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=0)
+    asyncio.run(cache.get_or_build('key', _builder([])))
+    target = tmp_path / 'job'
+
+    with cache.pinned('key'):
+        meta = cache.get('key')
+        cache.evict()
+        cache.link(meta, str(target))
+    assert os.listdir(target) == ['patients.arrow']
+
+    cache.evict()
+    assert cache.get('key') is None
+    assert os.listdir(tmp_path) == ['job']
+    # Связанные файлы задачи переживают вытеснение записи
+    assert (target / 'patients.arrow').read_bytes() == b'x' * ENTRY_BYTES
+
+
+def test_evicted_entry_is_rebuilt(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=0)
+    calls = []
+
+    async def scenario():
+        await cache.get_or_build('key', _builder(calls))
+        cache.evict()
+        return await cache.get_or_build('key', _builder(calls))
+
+    meta, cached = asyncio.run(scenario())
+    assert len(calls) == 2 and not cached
+    assert os.path.exists(os.path.join(meta['dataset_path'], 'patients.arrow'))
+
+
+def test_evict_skips_unfinished_builds(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=0)
+    unfinished = tmp_path / '.key.0.tmp'
+    unfinished.mkdir()
+    (unfinished / META_FILE).write_text('{}')
+    cache.evict()
+    assert unfinished.exists()
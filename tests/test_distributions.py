@@ -0,0 +1,80 @@
+"""
+Колоночная генерация сохраняет распределения исходного построчного генератора:
+доли диабета, пола и гипертонии, сезонные диагнозы и корреляции визитов
+с возрастом и диабетом пациента. Допуск - четыре стандартные ошибки доли.
+"""
+import math
+from datetime import date
+
+import polars as pl
+import pytest
+
+from app.core.batch_generator import BatchGenerator
+
+WINTER = {'Flu': 0.4, 'Cold': 0.3, 'Pneumonia': 0.2, 'Bronchitis': 0.1}
+SUMMER = {'Cold': 0.3, 'Allergy': 0.25, 'Hypertension': 0.2, 'Arthritis': 0.15, 'Flu': 0.1}
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    return BatchGenerator(batch_size=10000, seed=2024).generate_full_medical_dataset(50000, 300000)
+
+
+@pytest.fixture(scope='module')
+def visits(dataset):
+    """Визиты с возрастом и диабетом пациента и признаком зимнего сезона"""
+    patients_df = dataset['patients']
+    return dataset['visits'].with_columns(
+        age=patients_df['age'].gather(dataset['visits']['patient_index']),
+        diabetes=patients_df['diabetes'].gather(dataset['visits']['patient_index']),
+        winter=pl.col('date').dt.month().is_in([11, 12, 1, 2]),
+        diagnosis=pl.col('diagnosis').cast(pl.String),
+    )
+
+
+def _assert_share(mask: pl.Series, expected: float):
+    n = len(mask)
+    assert n > 1000
+    assert mask.mean() == pytest.approx(expected, abs=4 * math.sqrt(expected * (1 - expected) / n) + 1e-9)
+
+
+def test_patient_shares(dataset):
+    patients_df = dataset['patients']
+    _assert_share(patients_df['diabetes'], 0.08)
+    _assert_share(patients_df['gender'].cast(pl.String) == 'Female', 0.52)
+    _assert_share(patients_df.filter(pl.col('age') > 60)['hypertension'], 0.4)
+    _assert_share(patients_df.filter(pl.col('age') <= 60)['hypertension'], 0.15)
+    assert patients_df['age'].min() >= 0 and patients_df['age'].max() <= 100
+    assert patients_df['bmi'].min() >= 16 and patients_df['bmi'].max() <= 50
+
+
+@pytest.mark.parametrize('winter, probabilities', [(True, WINTER), (False, SUMMER)])
+def test_seasonal_diagnoses(visits, winter, probabilities):
+    # Пациенты без диабета и возрастных поправок
+    base = visits.filter((pl.col('winter') == winter) & ~pl.col('diabetes') & pl.col('age').is_between(12, 70))
+    assert set(base['diagnosis'].unique()) == set(probabilities)
+    for diagnosis, probability in probabilities.items():
+        _assert_share(base['diagnosis'] == diagnosis, probability)
+
+
+def test_patient_correlations(visits):
+    adults = pl.col('age').is_between(12, 70)
+    _assert_share(visits.filter(adults & pl.col('diabetes'))['diagnosis'] == 'Diabetes', 0.6)
+
+    children = visits.filter((pl.col('age') < 12) & ~pl.col('diabetes'))
+    # 0.9 - поправка на возраст, иначе Cold с сезонной вероятностью 0.3
+    _assert_share(children['diagnosis'] == 'Cold', 0.9 + 0.1 * 0.3)
+
+    elderly = visits.filter((pl.col('age') > 70) & ~pl.col('diabetes'))
+    _assert_share(elderly.filter(pl.col('winter'))['diagnosis'] == 'Pneumonia', 0.25 + 0.75 * WINTER['Pneumonia'])
+    _assert_share(elderly.filter(~pl.col('winter'))['diagnosis'] == 'Pneumonia', 0.25)
+
+
+def test_visit_dates_costs_and_follow_up(visits):
+    assert visits['date'].min() == date(2023, 1, 1)
+    assert visits['date'].max() == date(2024, 12, 30)
+    # Даты равномерны по дням: доля зимних месяцев - доля зимних дней периода
+    days = pl.date_range(date(2023, 1, 1), date(2024, 12, 30), eager=True)
+    _assert_share(visits['winter'], days.dt.month().is_in([11, 12, 1, 2]).mean())
+    assert visits['cost'].min() >= 30 and visits['cost'].max() <= 500
+    _assert_share(visits['follow_up'], 0.15)
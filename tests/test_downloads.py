@@ -0,0 +1,110 @@
+"""
+Выгрузка файлов: разбор заголовка Range, ответы 200/206/416
+и однократное построение файла выгрузки при одновременных запросах.
+"""
+import os
+import threading
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.api import downloads
+from app.api.downloads import parse_range, file_download, cached_export
+
+CONTENT = bytes(range(256)) * 40
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=990-5000', (990, 999)),
+    ('bytes=999-999', (999, 999)),
+    ('items=0-10', None),
+    ('bytes=0-10,20-30', None),
+    ('bytes=abc-', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=500-100', 'bytes=-0'])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / 'dataset.bin'
+    path.write_bytes(CONTENT)
+    app = FastAPI()
+
+    @app.get('/file')
+    def get_file(request: Request):
+        return file_download(request, str(path), 'application/octet-stream', 'dataset.bin')
+
+    return TestClient(app)
+
+
+def test_full_download(client):
+    response = client.get('/file')
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers['accept-ranges'] == 'bytes'
+
+
+def test_partial_download(client):
+    response = client.get('/file', headers={'Range': 'bytes=1000-2047'})
+    assert response.status_code == 206
+    assert response.content == CONTENT[1000:2048]
+    assert response.headers['content-range'] == f'bytes 1000-2047/{len(CONTENT)}'
+    assert response.headers['content-length'] == '1048'
+
+
+def test_resume_download(client):
+    first = client.get('/file', headers={'Range': 'bytes=0-4095'}).content
+    rest = client.get('/file', headers={'Range': 'bytes=4096-'}).content
+    assert first + rest == CONTENT
+
+
+def test_suffix_range(client):
+    response = client.get('/file', headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-10:]
+
+
+def test_range_not_satisfiable(client):
+    response = client.get('/file', headers={'Range': f'bytes={len(CONTENT)}-'})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == f'bytes */{len(CONTENT)}'
+
+
+def test_cached_export_builds_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloads, 'EXPORTS_DIR', str(tmp_path))
+    builds = []
+    start = threading.Barrier(8)
+
+    def build(path):
+        builds.append(path)
+        with open(path, 'wb') as f:
+            f.write(CONTENT)
+        return path
+
+    paths = []
+
+    def request():
+        start.wait()
+        paths.append(cached_export('job-1', 'dataset.csv', build))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert set(paths) == {os.path.join(str(tmp_path), 'job-1', 'dataset.csv')}
+    assert not downloads._build_locks
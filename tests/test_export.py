@@ -0,0 +1,107 @@
+"""
+Round-trip форматов экспорта: файл, прочитанный обратно, совпадает
+с экспортным видом датасета (render_ids). Срезы экспорта уменьшены,
+чтобы таблицы писались в несколько срезов.
+"""
+import os
+import json
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from app.core import export
+from app.core.batch_generator import BatchGenerator, render_ids
+from app.core.export import export_dataset, resolve_format, save_dataset, load_dataset, TABLES
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    return BatchGenerator(batch_size=300, seed=99).generate_full_medical_dataset(700, 1500)
+
+
+@pytest.fixture(scope='module')
+def expected(dataset):
+    return render_ids(dataset)
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_CHUNK_ROWS', 256)
+
+
+def _typed(frame: pl.DataFrame, schema: pl.Schema) -> pl.DataFrame:
+    """Типы экспортного вида для форматов без схемы (строки дат, категорий)"""
+    return frame.select(pl.col(name).cast(dtype) for name, dtype in schema.items())
+
+
+def test_json_round_trip(dataset, expected, tmp_path):
+    paths = export_dataset(dataset, str(tmp_path), 'json', metadata={'seed': 99})
+    with open(paths['dataset'], encoding='utf-8') as f:
+        document = json.load(f)
+    
+    assert document['metadata'] == {'seed': 99}
+    for table in TABLES:
+        assert_frame_equal(_typed(pl.DataFrame(document[table]), expected[table].schema), expected[table])
+
+
+def test_ndjson_round_trip(dataset, expected, tmp_path):
+    paths = export_dataset(dataset, str(tmp_path), 'jsonl')
+    for table in TABLES:
+        assert_frame_equal(_typed(pl.read_ndjson(paths[table]), expected[table].schema), expected[table])
+
+
+@pytest.mark.parametrize('compression', ['zstd', 'snappy', 'uncompressed'])
+def test_parquet_round_trip(dataset, expected, tmp_path, compression):
+    paths = export_dataset(dataset, str(tmp_path), 'parquet', compression, row_group_size=500)
+    for table in TABLES:
+        assert_frame_equal(pl.read_parquet(paths[table]), expected[table])
+
+
+@pytest.mark.parametrize('fmt, compression', [('ipc', None), ('feather', 'lz4'), ('arrow', 'zstd')])
+def test_ipc_round_trip(dataset, expected, tmp_path, fmt, compression):
+    paths = export_dataset(dataset, str(tmp_path), fmt, compression)
+    for table in TABLES:
+        assert paths[table].endswith('.arrow')
+        assert_frame_equal(pl.read_ipc(paths[table], memory_map=False), expected[table])
+
+
+@pytest.mark.parametrize('compression', ['uncompressed', 'gzip', 'zstd'])
+def test_csv_round_trip(dataset, expected, tmp_path, compression):
+    paths = export_dataset(dataset, str(tmp_path), 'csv', compression)
+    for table in TABLES:
+        assert_frame_equal(pl.read_csv(paths[table], schema=expected[table].schema), expected[table])
+
+
+def test_empty_visits_csv_has_header(dataset, tmp_path):
+    empty = {'patients': dataset['patients'], 'visits': dataset['visits'].head(0)}
+    paths = export_dataset(empty, str(tmp_path), 'csv')
+    assert pl.read_csv(paths['visits']).columns == ['id', 'patient_id', 'date', 'diagnosis', 'cost', 'follow_up']
+
+
+def test_failed_csv_export_leaves_no_files(dataset, tmp_path, monkeypatch):
+    def broken_scan(dataset, table, chunk_rows=None):
+        return pl.LazyFrame({'id': [1]}).select(pl.col('id').str.to_uppercase())
+
+    monkeypatch.setattr(export, 'scan_rendered', broken_scan)
+    with pytest.raises(Exception):
+        export_dataset(dataset, str(tmp_path), 'csv')
+    assert os.listdir(tmp_path) == []
+
+
+def test_compact_dataset_round_trip(dataset, tmp_path):
+    save_dataset(dataset, str(tmp_path))
+    loaded = load_dataset(str(tmp_path))
+    
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    for table in TABLES:
+        assert_frame_equal(loaded[table], dataset[table])
+
+
+def test_resolve_format():
+    assert resolve_format('Feather') == ('ipc', 'uncompressed')
+    assert resolve_format('parquet') == ('parquet', 'zstd')
+    with pytest.raises(ValueError):
+        resolve_format('xlsx')
+    with pytest.raises(ValueError):
+        resolve_format('json', 'gzip')
@@ -0,0 +1,96 @@
+"""
+SSE-поток задачи: итоговое состояние не теряется, если задача завершилась
+между чтением снимка и подпиской, и поток закрывается при удалении задачи.
+"""
+import json
+import asyncio
+
+from app.api.job_events import JobEventBus, job_event_stream
+
+
+def _events(chunks):
+    return [json.loads(chunk[len('data: '):]) for chunk in chunks if chunk.startswith('data: ')]
+
+
+async def _collect(response, timeout=2):
+    chunks = []
+
+    async def read():
+        async for chunk in response.body_iterator:
+            chunks.append(chunk)
+
+    await asyncio.wait_for(read(), timeout)
+    return _events(chunks)
+
+
+def test_finished_before_subscribe():
+    bus = JobEventBus()
+    store = {'job-1': {'job_id': 'job-1', 'status': 'processing', 'progress': 40}}
+    snapshot = dict(store['job-1'])
+    # Задача завершилась после чтения snapshot, но до подписки потока: рассылка никого не застала
+    store['job-1'] = {'job_id': 'job-1', 'status': 'completed', 'progress': 100}
+    bus.publish(store['job-1'])
+
+    async def reload():
+        return store.get('job-1')
+
+    events = asyncio.run(_collect(job_event_stream(bus, snapshot, reload=reload)))
+    assert [event['status'] for event in events] == ['completed']
+
+
+def test_deleted_before_subscribe():
+    bus = JobEventBus()
+
+    async def reload():
+        return None
+
+    response = job_event_stream(bus, {'job_id': 'job-1', 'status': 'processing'}, reload=reload)
+    events = asyncio.run(_collect(response))
+    assert [event['status'] for event in events] == ['deleted']
+
+
+def test_updates_until_deleted():
+    bus = JobEventBus()
+    job = {'job_id': 'job-1', 'user_id': 7, 'status': 'processing', 'progress': 0}
+
+    async def reload():
+        return dict(job)
+
+    async def scenario():
+        reader = asyncio.ensure_future(_collect(job_event_stream(bus, job, reload=reload)))
+        await asyncio.sleep(0.05)
+        bus.publish({**job, 'progress': 50})
+        bus.publish_deleted('job-1', 7)
+        return await reader
+
+    events = asyncio.run(scenario())
+    assert [(event['status'], event.get('progress')) for event in events] == [
+        ('processing', 0), ('processing', 50), ('deleted', None),
+    ]
+
+
+def test_cleared_closes_every_stream():
+    bus = JobEventBus()
+
+    async def scenario():
+        readers = [
+            asyncio.ensure_future(_collect(job_event_stream(bus, {'job_id': job_id, 'status': 'processing'})))
+            for job_id in ('job-1', 'job-2')
+        ]
+        await asyncio.sleep(0.05)
+        bus.publish_cleared()
+        return await asyncio.gather(*readers)
+
+    for events in asyncio.run(scenario()):
+        assert events[-1]['status'] == 'deleted'
+
+
+def test_deleted_reaches_user_subscribers():
+    bus = JobEventBus()
+
+    async def scenario():
+        with bus.subscribe(user_id=7) as queue:
+            bus.publish_deleted('job-1', 7)
+            return queue.get_nowait()
+
+    assert asyncio.run(scenario()) == {'job_id': 'job-1', 'user_id': 7, 'status': 'deleted'}
@@ -0,0 +1,62 @@
+"""
+JobRunner: доставка прогресса из процессов пула, задачи, снятые с очереди
+при остановке пула, и отмена задачи asyncio.
+"""
+import time
+import asyncio
+
+import pytest
+
+from app.core.job_runner import JobRunner, JobCancelled, generate_dataset_job
+
+
+def test_pending_job_cancelled_on_shutdown():
+    async def scenario():
+        runner = JobRunner(workers=1)
+        jobs = [asyncio.ensure_future(runner.run(time.sleep, 0.3)) for _ in range(4)]
+        await asyncio.sleep(0.2)
+        await asyncio.to_thread(runner.shutdown)
+        return await asyncio.gather(*jobs, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    # Переданные процессу задачи дорабатывают, ждущие в очереди пула - JobCancelled, а не CancelledError
+    assert results[0] is None
+    assert isinstance(results[-1], JobCancelled)
+    assert all(result is None or isinstance(result, JobCancelled) for result in results)
+
+
+def test_task_cancellation_propagates():
+    async def scenario():
+        runner = JobRunner(workers=1)
+        task = asyncio.ensure_future(runner.run(time.sleep, 0.5))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        try:
+            await task
+        finally:
+            await asyncio.to_thread(runner.shutdown)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(scenario())
+
+
+def test_progress_events_delivered_before_result():
+    async def scenario():
+        runner = JobRunner(workers=2)
+        events = {0: [], 1: []}
+        try:
+            results = await asyncio.gather(*(
+                runner.run(generate_dataset_job, 3000, 6000, index, 1000, on_progress=events[index].append)
+                for index in (0, 1)
+            ))
+        finally:
+            await asyncio.to_thread(runner.shutdown)
+        return results, events
+
+    results, events = asyncio.run(scenario())
+    assert [result['patients'] for result in results] == [3000, 3000]
+    for job_events in events.values():
+        assert job_events, "нет событий прогресса"
+        # Последнее событие - конец генерации; все события пришли до результата run
+        assert job_events[-1]['rows_done'] == 9000
+        assert job_events[-1]['progress'] == 100
@@ -0,0 +1,157 @@
+"""
+SQLiteJobStore: keyset-пагинация (границы страниц, курсор, фильтр по
+пользователю, задачи с одинаковым created_at) и запись задач через JobWriter.
+"""
+import asyncio
+
+import pytest
+
+from app.core.job_store import SQLiteJobStore, JobWriter, create_job_store, encode_cursor, decode_cursor
+
+
+def _job(index: int, user_id: str = 'alice', created_at: str = None, **fields):
+    job = {
+        'job_id': f'job-{index:03d}',
+        'user_id': user_id,
+        'status': 'processing',
+        'created_at': created_at or f'2024-01-01T00:00:{index:02d}',
+    }
+    job.update(fields)
+    return job
+
+
+@pytest.fixture
+def store(tmp_path):
+    return create_job_store(f"sqlite:///{tmp_path / 'jobs.db'}")
+
+
+def _all_pages(store, limit, user_id=None):
+    pages, cursor = [], None
+    while True:
+        jobs, cursor = store.list(user_id=user_id, limit=limit, cursor=cursor)
+        pages.append([job['job_id'] for job in jobs])
+        if cursor is None:
+            return pages
+
+
+def test_pages_newest_first(store):
+    for index in range(7):
+        store.save(_job(index))
+
+    assert _all_pages(store, 3) == [
+        ['job-006', 'job-005', 'job-004'],
+        ['job-003', 'job-002', 'job-001'],
+        ['job-000'],
+    ]
+
+
+def test_exact_multiple_has_no_empty_page(store):
+    for index in range(6):
+        store.save(_job(index))
+
+    jobs, cursor = store.list(limit=3)
+    jobs, cursor = store.list(limit=3, cursor=cursor)
+    assert [job['job_id'] for job in jobs] == ['job-002', 'job-001', 'job-000']
+    assert cursor is None
+
+
+def test_empty_store(store):
+    assert store.list(limit=10) == ([], None)
+
+
+def test_same_created_at_ordered_by_job_id(store):
+    for index in range(5):
+        store.save(_job(index, created_at='2024-01-01T00:00:00'))
+
+    pages = _all_pages(store, 2)
+    assert pages == [['job-004', 'job-003'], ['job-002', 'job-001'], ['job-000']]
+
+
+def test_user_filter(store):
+    for index in range(6):
+        store.save(_job(index, user_id='alice' if index % 2 else 'bob'))
+
+    assert _all_pages(store, 2, user_id='alice') == [['job-005', 'job-003'], ['job-001']]
+    assert _all_pages(store, 5, user_id='bob') == [['job-004', 'job-002', 'job-000']]
+    assert store.list(user_id='carol') == ([], None)
+
+
+def test_new_jobs_do_not_shift_pages(store):
+    for index in range(4):
+        store.save(_job(index))
+    _, cursor = store.list(limit=2)
+    store.save(_job(10))
+
+    second, _ = store.list(limit=2, cursor=cursor)
+    assert [job['job_id'] for job in second] == ['job-001', 'job-000']
+
+
+def test_cursor_round_trip():
+    job = _job(1, created_at='2024-01-01T10:00:00|x')
+    assert decode_cursor(encode_cursor(job)) == ('2024-01-01T10:00:00|x', 'job-001')
+    with pytest.raises(ValueError):
+        decode_cursor('no-separator')
+
+
+def test_counts_and_totals(store):
+    store.save(_job(0, status='completed', patients=10, visits=40))
+    store.save(_job(1, status='completed', patients=5, visits=20))
+    store.save(_job(2, status='failed', patients=100, visits=100))
+    store.save(_job(3))
+
+    assert store.count() == 4
+    assert store.count('completed') == 2
+    assert store.totals() == {'jobs': 4, 'completed': 2, 'failed': 1, 'patients': 15, 'visits': 60}
+
+
+def test_update_and_overwrite_deleted(store):
+    store.save(_job(0))
+    assert store.update('job-000', status='completed', progress=100)['status'] == 'completed'
+    assert store.get('job-000')['progress'] == 100
+
+    store.delete('job-000')
+    assert store.overwrite(_job(0, status='failed')) is False
+    assert store.update('job-000', status='failed') is None
+    assert store.get('job-000') is None
+
+
+def test_writer_does_not_recreate_deleted_job(store):
+    async def scenario():
+        writer = JobWriter(store, interval=0)
+        job = _job(0)
+        assert await writer.save(job, create=True)
+        job['progress'] = 50
+        assert await writer.save(job)
+        store.delete(job['job_id'])
+        job['status'] = 'completed'
+        saved = await writer.save(job)
+        writer.forget(job['job_id'])
+        return saved
+
+    assert asyncio.run(scenario()) is False
+    assert store.get('job-000') is None
+
+
+def test_store_survives_reopen(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    SQLiteJobStore(path).save(_job(0, status='completed'))
+    assert SQLiteJobStore(path).get('job-000')['status'] == 'completed'
+
+
+def test_unsupported_url():
+    with pytest.raises(ValueError):
+        create_job_store('mongodb://localhost/jobs')
+
+
+def test_fail_interrupted(store):
+    store.save(_job(0, status='completed'))
+    store.save(_job(1, status='processing', progress=40))
+    store.save(_job(2, status='pending'))
+
+    assert store.fail_interrupted('restart') == 2
+    assert store.get('job-000')['status'] == 'completed'
+    interrupted = store.get('job-001')
+    assert (interrupted['status'], interrupted['error'], interrupted['progress']) == ('failed', 'restart', 40)
+    assert store.count('processing') == 0
+    assert store.totals()['failed'] == 2
+    assert store.fail_interrupted() == 0
@@ -0,0 +1,100 @@
+"""
+POST /api/v1/generate/medical в main_redis: параметры формата доходят до задачи Celery.
+Брокер и result backend заменены на память - Redis и воркеры не нужны,
+отправленные задачи читаются из очереди.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.workers.celery_app import celery_app
+
+celery_app.conf.update(broker_url='memory://', result_backend='cache+memory://')
+
+from app import main_redis  # noqa: E402
+from app.workers import tasks  # noqa: E402
+
+
+def _sent_tasks():
+    """Задачи, отправленные в очереди generation и export: [(имя, args, kwargs, options)]"""
+    sent = []
+    with celery_app.connection_for_read() as connection:
+        for queue in ('generation', 'export'):
+            simple = connection.SimpleQueue(queue, accept=celery_app.conf.accept_content)
+            while True:
+                try:
+                    message = simple.get(block=False)
+                except simple.Empty:
+                    break
+                args, kwargs, options = message.decode()
+                sent.append((message.headers['task'], args, kwargs, options))
+                message.ack()
+            simple.close()
+    return sent
+
+
+@pytest.fixture
+def client():
+    _sent_tasks()
+    main_redis.jobs.clear()
+    return TestClient(main_redis.app)
+
+
+def test_format_reaches_task(client):
+    response = client.post('/api/v1/generate/medical', params={
+        'patients': 100, 'visits': 200, 'seed': 3, 'export_format': 'feather', 'compression': 'lz4',
+    })
+    
+    assert response.status_code == 200
+    job_id = response.json()['job_id']
+    assert main_redis.jobs[job_id]['format'] == 'ipc'
+    [(name, args, _, _)] = _sent_tasks()
+    assert name == 'generate_medical_dataset'
+    assert args == [100, 200, 3, 'ipc', 'lz4', None]
+
+
+def test_default_format_is_json(client):
+    client.post('/api/v1/generate/medical', params={'patients': 10, 'visits': 20})
+    [(_, args, _, _)] = _sent_tasks()
+    assert args[3:5] == ['json', None]
+
+
+@pytest.mark.parametrize('params', [{'export_format': 'xlsx'}, {'export_format': 'json', 'compression': 'gzip'}])
+def test_bad_format_is_rejected(client, params):
+    response = client.post('/api/v1/generate/medical', params={'patients': 10, 'visits': 20, **params})
+    
+    assert response.status_code == 400
+    assert _sent_tasks() == []
+    assert main_redis.jobs == {}
+
+
+def test_large_parquet_job_dispatches_chord(client, monkeypatch):
+    monkeypatch.setattr(tasks, 'SHARD_THRESHOLD_ROWS', 1000)
+    monkeypatch.setattr(tasks, 'SHARD_ROWS', 20000)
+    response = client.post('/api/v1/generate/medical', params={
+        'patients': 25000, 'visits': 40000, 'export_format': 'parquet',
+    })
+    
+    assert response.status_code == 200
+    job_id = response.json()['job_id']
+    sent = _sent_tasks()
+    assert [name for name, *_ in sent] == ['generate_patient_shard'] * 2 + ['generate_visit_shard'] * 2
+    for _, _, kwargs, options in sent:
+        # Шарды - заголовок chord, merge получает id задачи из ответа API
+        assert kwargs == {'parent_id': job_id, 'total_rows': 65000}
+        assert options['chord']['task'] == 'merge_dataset_shards'
+        assert options['chord']['options']['task_id'] == job_id
+
+
+def test_small_parquet_job_is_not_sharded(client, monkeypatch):
+    monkeypatch.setattr(tasks, 'SHARD_THRESHOLD_ROWS', 1000)
+    client.post('/api/v1/generate/medical', params={'patients': 400, 'visits': 500, 'export_format': 'parquet'})
+    assert [name for name, *_ in _sent_tasks()] == ['generate_medical_dataset']
+
+
+def test_large_unsharded_job_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(tasks, 'MAX_UNSHARDED_ROWS', 1000)
+    response = client.post('/api/v1/generate/medical', params={'patients': 600, 'visits': 600, 'export_format': 'csv'})
+    
+    assert response.status_code == 400
+    assert 'parquet' in response.json()['detail']
+    assert _sent_tasks() == []
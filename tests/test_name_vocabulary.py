@@ -0,0 +1,107 @@
+"""
+Словари имен: извлечение списков из Faker, кэш на диске,
+пересоздание поврежденного кэша и одно построение при одновременных обращениях.
+"""
+import threading
+
+import numpy as np
+import pytest
+
+from app.core import name_vocabulary
+from app.core.name_vocabulary import NameVocabulary, NAME_LISTS, get_vocabulary, vocabulary_path
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(name_vocabulary, 'NAME_VOCABULARY_DIR', str(tmp_path))
+    monkeypatch.setattr(name_vocabulary, '_vocabularies', {})
+    return tmp_path
+
+
+@pytest.fixture(scope='module')
+def en_us():
+    return NameVocabulary.from_faker('en_US')
+
+
+def test_locale_extraction(en_us):
+    from faker import Faker
+
+    provider = Faker('en_US').factories[0].provider('faker.providers.person')
+    assert set(en_us.names) == set(NAME_LISTS)
+    assert list(en_us.names['first_names_female']) == list(provider.first_names_female)
+    # У en_US нет фамилий по полу - берется общий список с весами частот
+    assert list(en_us.names['last_names_male']) == list(provider.last_names)
+    assert en_us.weights['last_names_male'] is not None
+    assert len(en_us.weights['last_names_male']) == len(en_us.names['last_names_male'])
+
+
+def test_locale_specific_names():
+    vocabulary = NameVocabulary.from_faker('ru_RU')
+    assert 'Иван' in set(vocabulary.names['first_names_male'])
+    assert len(vocabulary.names['last_names_female']) > 0
+
+
+def test_sample_follows_gender(en_us):
+    rng = np.random.default_rng(0)
+    is_male = rng.random(1000) < 0.5
+    names = en_us.sample('first_names', is_male, rng)
+    male_names = set(en_us.names['first_names_male'])
+    female_names = set(en_us.names['first_names_female'])
+    
+    assert all(name in male_names for name in names.filter(is_male))
+    assert all(name in female_names for name in names.filter(~is_male))
+
+
+def test_save_and_load(en_us, tmp_path):
+    path = str(tmp_path / 'names.npz')
+    en_us.save(path)
+    loaded = NameVocabulary.load(path, 'en_US')
+    
+    assert list(tmp_path.iterdir()) == [tmp_path / 'names.npz']
+    for key in NAME_LISTS:
+        assert np.array_equal(loaded.names[key], en_us.names[key])
+
+
+def test_cache_written_on_first_use(cache_dir):
+    vocabulary = get_vocabulary('en_US')
+    assert (cache_dir / 'names_en_US.npz').exists()
+    assert get_vocabulary('en_US') is vocabulary
+
+
+@pytest.mark.parametrize('content', [b'not a zip file', b'PK\x03\x04 truncated', b''])
+def test_corrupt_cache_is_rebuilt(cache_dir, content):
+    path = vocabulary_path('en_US')
+    with open(path, 'wb') as f:
+        f.write(content)
+    
+    vocabulary = get_vocabulary('en_US')
+    assert len(vocabulary.names['first_names_male']) > 0
+    # Файл перезаписан: следующий процесс прочитает его без Faker
+    loaded = NameVocabulary.load(path, 'en_US')
+    assert np.array_equal(loaded.names['last_names_female'], vocabulary.names['last_names_female'])
+
+
+def test_concurrent_first_use_builds_once(cache_dir, monkeypatch):
+    builds = []
+    from_faker = NameVocabulary.from_faker.__func__
+
+    def counting_from_faker(cls, locale):
+        builds.append(locale)
+        return from_faker(cls, locale)
+
+    monkeypatch.setattr(NameVocabulary, 'from_faker', classmethod(counting_from_faker))
+    start = threading.Barrier(8)
+    results = []
+
+    def first_use():
+        start.wait()
+        results.append(get_vocabulary('en_US'))
+
+    threads = [threading.Thread(target=first_use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert builds == ['en_US']
+    assert all(result is results[0] for result in results)
@@ -0,0 +1,38 @@
+"""
+Предпросмотр статистики: аналитическое среднее обрезанного нормального
+распределения совпадает с выборочным, ожидаемая статистика - со статистикой
+сгенерированного датасета.
+"""
+import numpy as np
+import polars as pl
+import pytest
+
+from app.core.batch_generator import BatchGenerator
+from app.core.preview_stats import clipped_normal_mean, expected_statistics
+
+
+@pytest.mark.parametrize('params, bounds', [
+    ((150, 80), (30, 500)),
+    ((32, 4), (16, 50)),
+    ((0, 1), (-0.5, 2)),
+])
+def test_clipped_normal_mean_matches_sample(params, bounds):
+    sample = np.clip(np.random.default_rng(0).normal(*params, 2_000_000), *bounds)
+    assert clipped_normal_mean(params, bounds) == pytest.approx(sample.mean(), abs=3 * sample.std() / 1000)
+
+
+def test_wide_bounds_give_plain_mean():
+    assert clipped_normal_mean((26, 5), (-1000, 1000)) == pytest.approx(26)
+
+
+def test_expected_statistics_match_generated_dataset():
+    dataset = BatchGenerator(batch_size=10000, seed=11).generate_full_medical_dataset(60000, 120000)
+    patients_df, visits_df = dataset['patients'], dataset['visits']
+    expected = expected_statistics()
+
+    assert patients_df['diabetes'].mean() == pytest.approx(expected['diabetes_rate'], abs=0.005)
+    assert patients_df['bmi'].mean() == pytest.approx(expected['avg_bmi'], abs=0.1)
+    assert visits_df['cost'].cast(pl.Float64).mean() == pytest.approx(expected['avg_cost'], abs=1)
+    for diabetes, group in (('diabetic', True), ('non_diabetic', False)):
+        bmi = patients_df.filter(pl.col('diabetes') == group)['bmi'].mean()
+        assert bmi == pytest.approx(expected['bmi_correlation'][diabetes], abs=0.2)
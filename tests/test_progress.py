@@ -0,0 +1,58 @@
+"""
+ProgressTracker: события не чаще min_interval, последнее событие - всегда,
+скорость и ETA по прошедшему времени.
+"""
+from app.core import progress
+from app.core.progress import ProgressTracker
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_events_are_throttled(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(progress.time, 'perf_counter', clock)
+    events = []
+    tracker = ProgressTracker(1000, events.append, min_interval=0.5)
+    tracker.set_stage('patients')
+
+    for _ in range(9):
+        clock.now += 0.125
+        tracker.advance(100)
+    # Первый батч и затем не чаще раза в 0.5 с
+    assert [event['rows_done'] for event in events] == [100, 500, 900]
+
+    clock.now += 0.125
+    tracker.advance(100)
+    assert events[-1]['rows_done'] == 1000
+    assert events[-1]['progress'] == 100
+    assert events[-1]['eta_seconds'] == 0
+
+
+def test_snapshot_rate_and_eta(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(progress.time, 'perf_counter', clock)
+    events = []
+    tracker = ProgressTracker(1000, events.append)
+    tracker.set_stage('visits')
+    clock.now += 2
+    tracker.advance(250)
+    assert events == [{
+        'stage': 'visits',
+        'rows_done': 250,
+        'rows_total': 1000,
+        'progress': 25.0,
+        'rows_per_second': 125,
+        'eta_seconds': 6.0,
+    }]
+
+
+def test_without_callback():
+    tracker = ProgressTracker(0, None)
+    tracker.advance(10)
+    assert tracker.snapshot()['progress'] == 100.0
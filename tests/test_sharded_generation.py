@@ -0,0 +1,94 @@
+"""
+Шардированная генерация (chord шардов + merge): части Parquet вместе
+совпадают с датасетом, сгенерированным одной задачей с тем же seed.
+Задачи вызываются напрямую, без брокера.
+"""
+import os
+import json
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from app.core.batch_generator import BatchGenerator, render_ids
+from app.workers import tasks
+from app.workers.tasks import (
+    GENERATION_BATCH_SIZE,
+    shard_ranges,
+    generate_patient_shard,
+    generate_visit_shard,
+    merge_dataset_shards,
+    combine_shard_statistics,
+)
+
+SEED = 7
+N_PATIENTS = 25000
+N_VISITS = 42000
+SHARD_ROWS = 20000
+
+
+def test_shard_ranges_cover_all_batches():
+    assert shard_ranges(25000, 20000, 10000) == [(0, 2), (2, 3)]
+    assert shard_ranges(20000, 20000, 10000) == [(0, 2)]
+    # Подзадача не меньше одного батча
+    assert shard_ranges(25000, 5000, 10000) == [(0, 1), (1, 2), (2, 3)]
+    assert shard_ranges(0, 20000, 10000) == []
+
+
+@pytest.fixture(scope='module')
+def sharded(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('sharded'))
+    partials = [
+        generate_patient_shard(directory, first, last, N_PATIENTS, SEED, 'zstd')
+        for first, last in shard_ranges(N_PATIENTS, SHARD_ROWS)
+    ] + [
+        generate_visit_shard(directory, first, last, N_PATIENTS, N_VISITS, SEED, 'zstd')
+        for first, last in shard_ranges(N_VISITS, SHARD_ROWS)
+    ]
+    return directory, partials
+
+
+@pytest.fixture(scope='module')
+def full_dataset():
+    generator = BatchGenerator(batch_size=GENERATION_BATCH_SIZE, seed=SEED)
+    return generator.generate_full_medical_dataset(N_PATIENTS, N_VISITS)
+
+
+def test_parts_concatenate_to_full_dataset(sharded, full_dataset):
+    directory, _ = sharded
+    expected = render_ids(full_dataset)
+    for table in ('patients', 'visits'):
+        parts = sorted(os.listdir(os.path.join(directory, table)))
+        combined = pl.concat([pl.read_parquet(os.path.join(directory, table, part)) for part in parts])
+        assert_frame_equal(combined, expected[table])
+
+
+def test_merge_statistics_match_full_dataset(sharded, full_dataset):
+    directory, partials = sharded
+    record = merge_dataset_shards(partials, 'task-1', directory, N_PATIENTS, N_VISITS, SEED)
+    
+    with open(os.path.join(directory, tasks.MANIFEST_FILE), encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['files']['patients'] == ['patients/part-00000.parquet', 'patients/part-00002.parquet']
+    assert len(manifest['files']['visits']) == len(shard_ranges(N_VISITS, SHARD_ROWS))
+    assert record['patients'] == N_PATIENTS and record['visits'] == N_VISITS
+    
+    statistics = combine_shard_statistics(partials)
+    patients, visits = full_dataset['patients'], full_dataset['visits']
+    assert statistics['diabetes_rate'] == pytest.approx(patients['diabetes'].mean())
+    assert statistics['avg_bmi'] == pytest.approx(patients['bmi'].cast(pl.Float64).mean())
+    assert statistics['avg_cost'] == pytest.approx(visits['cost'].mean())
+    assert sum(entry['visits'] for entry in statistics['visits']['by_month'].values()) == N_VISITS
+
+
+def test_failed_part_write_leaves_no_files(tmp_path):
+    class BrokenFrame:
+        def write_parquet(self, path, **kwargs):
+            with open(path, 'wb') as f:
+                f.write(b'PAR1')
+            raise OSError('disk full')
+
+    filepath = str(tmp_path / 'part-00000.parquet')
+    with pytest.raises(OSError):
+        tasks._write_part(filepath, BrokenFrame(), 'zstd', None)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,131 @@
+"""
+StatsAggregator: счетчики на событиях задач и пользователей
+совпадают с пересчетом по хранилищу (job_totals, reconcile_*).
+"""
+from types import SimpleNamespace
+
+from app.core.stats import StatsAggregator, job_totals
+
+
+def _user(industry='healthcare', verified=True, developer=False, generations=0, patients=0, visits=0):
+    return SimpleNamespace(
+        industry=industry,
+        is_verified=verified,
+        is_developer=developer,
+        total_generations=generations,
+        total_records_generated=patients + visits,
+        total_patients_generated=patients,
+        total_visits_generated=visits,
+    )
+
+
+def test_job_lifecycle_counters():
+    stats = StatsAggregator()
+    jobs = [{'job_id': str(index), 'status': 'processing'} for index in range(4)]
+    for job in jobs:
+        stats.job_created(job)
+
+    jobs[0].update(status='completed', patients=100, visits=500)
+    jobs[1].update(status='completed', patients=10, visits=50)
+    jobs[2].update(status='failed')
+    for job in jobs[:3]:
+        stats.job_finished(job)
+
+    assert stats.snapshot()['jobs'] == {
+        'jobs': 4, 'processing': 1, 'completed': 2, 'failed': 1, 'patients': 110, 'visits': 550,
+    }
+
+
+def test_unfinished_status_is_not_counted():
+    stats = StatsAggregator()
+    stats.job_created({'status': 'processing'})
+    stats.job_finished({'status': 'processing'})
+
+    assert stats.snapshot()['jobs']['processing'] == 1
+    assert stats.snapshot()['jobs']['completed'] == 0
+
+
+def test_job_deleted():
+    stats = StatsAggregator()
+    completed = {'status': 'completed', 'patients': 100, 'visits': 500}
+    running = {'status': 'processing'}
+    for job in (completed, running):
+        stats.job_created(job)
+    stats.job_finished(completed)
+
+    stats.job_deleted(completed)
+    stats.job_deleted(running)
+    assert stats.snapshot()['jobs'] == {
+        'jobs': 0, 'processing': 0, 'completed': 0, 'failed': 0, 'patients': 0, 'visits': 0,
+    }
+    # Повторное удаление не уводит счетчики в минус
+    stats.job_deleted(running)
+    assert stats.snapshot()['jobs']['jobs'] == 0
+
+
+def test_counters_match_reconcile():
+    jobs = [
+        {'status': 'completed', 'patients': 100, 'visits': 500},
+        {'status': 'failed', 'patients': 7, 'visits': 7},
+        {'status': 'processing'},
+    ]
+    incremental = StatsAggregator()
+    for job in jobs:
+        incremental.job_created(job)
+        incremental.job_finished(job)
+
+    reconciled = StatsAggregator()
+    reconciled.reconcile_jobs(job_totals(jobs))
+    assert incremental.snapshot()['jobs'] == reconciled.snapshot()['jobs']
+    assert reconciled.snapshot()['jobs']['processing'] == 1
+
+
+def test_jobs_cleared():
+    stats = StatsAggregator()
+    stats.job_created({'status': 'processing'})
+    stats.jobs_cleared()
+    assert stats.snapshot()['jobs']['jobs'] == 0
+
+
+def test_user_counters_match_reconcile():
+    stats = StatsAggregator()
+    alice = _user('healthcare', verified=False, developer=True)
+    bob = _user('insurance')
+    stats.user_registered(alice)
+    stats.user_registered(bob)
+    stats.user_verified(alice)
+    stats.generation_started(alice, patients=100, visits=400)
+    stats.generation_started(bob, patients=10, visits=20, records=35)
+
+    users = stats.snapshot()['users']
+    assert users['total_users'] == 2
+    assert users['verified_users'] == 2
+    assert users['developer_count'] == 1
+    assert users['total_generations'] == 2
+    assert users['total_records'] == 535
+    assert users['total_patients'] == 110
+    assert users['total_visits'] == 420
+    assert users['industry_distribution'] == {
+        'healthcare': {'count': 1, 'generations': 1},
+        'insurance': {'count': 1, 'generations': 1},
+    }
+
+    reconciled = StatsAggregator()
+    reconciled.reconcile_users([
+        _user('healthcare', developer=True, generations=1, patients=100, visits=400),
+        _user('insurance', generations=1, patients=10, visits=20),
+    ])
+    expected = reconciled.snapshot()['users']
+    assert expected['industry_distribution'] == users['industry_distribution']
+    assert expected['total_generations'] == users['total_generations']
+
+
+def test_snapshot_is_a_copy():
+    stats = StatsAggregator()
+    stats.user_registered(_user())
+    snapshot = stats.snapshot()
+    snapshot['users']['industry_distribution']['healthcare']['count'] = 99
+    snapshot['jobs']['jobs'] = 99
+
+    assert stats.snapshot()['users']['industry_distribution']['healthcare']['count'] == 1
+    assert stats.snapshot()['jobs']['jobs'] == 0
@@ -0,0 +1,105 @@
+"""
+TaskStatusCache: события воркеров обновляют только отслеживаемые задачи,
+незавершенные читаются из backend одним MGET, прогресс не откатывается,
+on_ready вызывается один раз, карта ограничена по размеру и времени.
+"""
+from types import SimpleNamespace
+
+from app.workers.task_status import TaskStatusCache
+
+
+class _Backend:
+    """Backend с метаданными задач в словаре и счетчиком MGET"""
+
+    def __init__(self):
+        self.meta = {}
+        self.mgets = []
+
+    def get_key_for_task(self, task_id):
+        return task_id
+
+    def mget(self, keys):
+        self.mgets.append(list(keys))
+        return [self.meta.get(key) for key in keys]
+
+    def decode_result(self, value):
+        return value
+
+
+def _cache(**kwargs):
+    backend = _Backend()
+    ready = []
+    cache = TaskStatusCache(
+        SimpleNamespace(backend=backend), on_ready=lambda task_id, state: ready.append((task_id, state)), **kwargs
+    )
+    return cache, backend, ready
+
+
+def test_events_update_only_tracked_tasks():
+    cache, _, ready = _cache()
+    cache.track('job')
+    cache._on_event({'type': 'task-started', 'uuid': 'job'})
+    cache._on_event({'type': 'task-started', 'uuid': 'shard'})
+    cache._on_event({'type': 'worker-heartbeat'})
+    assert cache.get('job')['state'] == 'STARTED'
+    assert cache.get('shard') is None
+
+    cache._on_event({'type': 'task-succeeded', 'uuid': 'job'})
+    cache._on_event({'type': 'task-failed', 'uuid': 'job'})
+    assert cache.get('job')['state'] == 'SUCCESS'
+    assert ready == [('job', 'SUCCESS')]
+
+
+def test_states_read_unfinished_from_backend_once():
+    cache, backend, ready = _cache()
+    cache.track('done')
+    cache._on_event({'type': 'task-succeeded', 'uuid': 'done'})
+    cache.track('running')
+    backend.meta['running'] = {'status': 'PROGRESS', 'result': {'progress': 40}}
+
+    states = cache.states(['done', 'running', 'queued'])
+    assert states == {'done': 'SUCCESS', 'running': 'PROGRESS', 'queued': 'PENDING'}
+    # Итоговые из карты, остальные - одним запросом
+    assert backend.mgets == [['running', 'queued']]
+    assert cache.get('running')['info'] == {'progress': 40}
+    assert ready == [('done', 'SUCCESS')]
+
+
+def test_progress_does_not_go_back():
+    cache, backend, _ = _cache()
+    cache.track('job')
+    backend.meta['job'] = {'status': 'PROGRESS', 'result': {'progress': 60}}
+    cache.refresh(['job'])
+    backend.meta['job'] = {'status': 'PROGRESS', 'result': {'progress': 30}}
+    cache.refresh(['job'])
+    assert cache.get('job')['info'] == {'progress': 60}
+
+    # Событие без метаданных сохраняет прочитанный прогресс
+    cache._on_event({'type': 'task-started', 'uuid': 'job'})
+    status = cache.get('job')
+    assert (status['state'], status['info']) == ('STARTED', {'progress': 60})
+
+
+def test_map_size_is_bounded():
+    cache, _, _ = _cache(max_entries=20)
+    for index in range(5):
+        cache.track(f'done-{index}')
+        cache._on_event({'type': 'task-succeeded', 'uuid': f'done-{index}'})
+    for index in range(30):
+        cache.track(f'job-{index}')
+    assert len(cache._statuses) <= 20
+    # Сначала вытесняются итоговые записи, свежие незавершенные остаются
+    assert cache.get('done-0') is None
+    assert cache.get('job-29')['state'] == 'PENDING'
+
+
+def test_expire_by_state():
+    cache, _, _ = _cache(ttl=10, pending_ttl=100)
+    cache.track('done')
+    cache._on_event({'type': 'task-succeeded', 'uuid': 'done'})
+    cache.track('running')
+    for status in cache._statuses.values():
+        status['updated'] -= 50
+    assert cache.expire() == 1
+    assert cache.get('done') is None
+    assert cache.get('running') is not None
@@ -0,0 +1,57 @@
+"""
+Подготовка процесса воркера: переиспользуемый генератор процесса дает те же
+данные, что новый генератор с тем же seed, ключевые колонки пациентов
+считаются один раз на задачу.
+"""
+import numpy as np
+import pytest
+from polars.testing import assert_frame_equal
+
+from app.core.batch_generator import BatchGenerator
+from app.workers import bootstrap
+from app.workers.bootstrap import worker_generator, worker_patient_keys
+
+
+@pytest.fixture(autouse=True)
+def clean_process_state(monkeypatch):
+    monkeypatch.setattr(bootstrap, '_generators', {})
+    monkeypatch.setattr(bootstrap, '_patient_keys', {})
+
+
+def test_worker_generator_is_reused_with_new_seed():
+    first = worker_generator(1, 500)
+    first.generate_patient_shard(0, 700)
+    second = worker_generator(2, 500)
+    assert second is first
+    assert worker_generator(2, 250) is not first
+
+    fresh = BatchGenerator(batch_size=500, seed=2)
+    for index in range(2):
+        assert_frame_equal(second.generate_patient_shard(index, 700), fresh.generate_patient_shard(index, 700))
+    assert_frame_equal(second.generate_visit_shard(1, 700, 1200), fresh.generate_visit_shard(1, 700, 1200))
+
+
+def test_patient_keys_computed_once_per_task(monkeypatch):
+    generator = worker_generator(3, 500)
+    calls = []
+    original = generator.patient_keys
+    monkeypatch.setattr(generator, 'patient_keys', lambda n: calls.append(n) or original(n))
+
+    keys = worker_patient_keys(generator, 1200)
+    assert worker_patient_keys(generator, 1200) is keys
+    assert calls == [1200]
+    for column, expected in zip(keys, BatchGenerator(batch_size=500, seed=3).patient_keys(1200)):
+        np.testing.assert_array_equal(column, expected)
+
+    # Следующая задача процесса вытесняет ключи предыдущей
+    worker_generator(4, 500)
+    worker_patient_keys(generator, 1200)
+    assert calls == [1200, 1200]
+    assert len(bootstrap._patient_keys) == 1
+
+
+def test_visit_shard_with_shared_keys_matches_fresh_generator():
+    generator = worker_generator(5, 500)
+    keys = worker_patient_keys(generator, 900)
+    fresh = BatchGenerator(batch_size=500, seed=5)
+    assert_frame_equal(generator.generate_visit_shard(2, 900, 1500, keys), fresh.generate_visit_shard(2, 900, 1500))